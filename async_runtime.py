@@ -0,0 +1,132 @@
+import os
+import asyncio
+import threading
+import weakref
+
+import httpx
+from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+from config import get_config
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running in a daemon thread
+
+    Lets blocking code (Streamlit script runs, worker threads) use the async
+    model APIs: each call is scheduled on the one loop and the caller waits
+    for its result, so any number of in-flight requests share one thread
+    and one connection pool instead of holding a thread each.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        with self._lock:
+            # A forked child (job queue workers) inherits no running thread
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="async-runtime", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._loop
+
+    def submit(self, coro):
+        """Schedule a coroutine on the background loop; cancelling the returned Future cancels the task"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro, timeout=None):
+        """
+        Run a coroutine on the background loop and wait for its result
+
+        Raises:
+            RuntimeError: Called from the loop's own thread (would deadlock)
+            Exception: Whatever the coroutine raised
+        """
+        loop = self._ensure_started()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("run_sync() called from the async runtime thread; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+    def stats(self, timeout=1.0):
+        """Tasks currently scheduled on the loop (in-flight model calls and followers)"""
+        async def count():
+            return len(asyncio.all_tasks()) - 1
+        return {"tasks": self.run(count(), timeout)}
+
+
+_background_loop = BackgroundLoop()
+_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def run_sync(coro, timeout=None):
+    """Run a coroutine to completion from synchronous code"""
+    return _background_loop.run(coro, timeout)
+
+
+def submit(coro):
+    """Start a coroutine in the background from synchronous code; returns a concurrent.futures.Future"""
+    return _background_loop.submit(coro)
+
+
+def stats(timeout=1.0):
+    """Background loop saturation; raises TimeoutError if the loop is blocked"""
+    return _background_loop.stats(timeout)
+
+
+def create_client(api_key=None):
+    """A new AsyncGroq client with the configured pool sizes, timeout and retries"""
+    groq = get_config().groq
+    return AsyncGroq(
+        api_key=api_key or groq.api_key,
+        timeout=groq.timeout_seconds,
+        max_retries=groq.max_retries,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=groq.max_connections,
+                max_keepalive_connections=groq.max_keepalive_connections
+            )
+        )
+    )
+
+
+_client_factory = create_client
+
+
+def set_client_factory(factory=None):
+    """
+    Build clients with factory(api_key) from now on (None restores create_client)
+
+    Used to put a recording or replaying client (cassette.py) in front of
+    every model call; clients created before the switch are dropped.
+    """
+    global _client_factory
+    with _clients_lock:
+        _client_factory = factory or create_client
+        _clients.clear()
+
+
+def get_async_client(api_key=None):
+    """
+    The AsyncGroq client for the running event loop and API key
+
+    Clients (and their httpx connection pools) are created once per loop,
+    since an httpx.AsyncClient cannot be shared between loops. Pool sizes,
+    timeout and retries come from the groq config section.
+    """
+    loop = asyncio.get_running_loop()
+    api_key = api_key or get_config().groq.api_key
+    with _clients_lock:
+        clients = _clients.setdefault(loop, {})
+        client = clients.get(api_key)
+        if client is None:
+            client = _client_factory(api_key)
+            clients[api_key] = client
+        return client
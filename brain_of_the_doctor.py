@@ -1,74 +1,434 @@
 import os
+import io
+import time
 import base64
-from groq import Groq
+import asyncio
+import logging
+from types import SimpleNamespace
+from PIL import Image, ImageOps
+
+from async_runtime import get_async_client, run_sync
+from config import get_config
+from image_hash import phash, hamming, PerceptualImageIndex
+from single_flight import SingleFlight, make_key
+from usage_accounting import get_usage_meter
+from model_router import model_router
+from response_shaping import trim_to_sentence
+from pipeline import StageResult
+from structured_output import (
+    SectionStreamParser, structured_query, parse_sections, sections_json, merge_sections, emit_sections
+)
+
+# Groq vision limits: at most 5 images and 4MB of base64 image data per request
+MAX_IMAGES_PER_REQUEST = 5
+MAX_IMAGE_BYTES_PER_REQUEST = 4 * 1024 * 1024
+
+# Reuses earlier analyses for re-uploaded / re-encoded copies of the same photos
+image_analysis_index = PerceptualImageIndex(max_distance=get_config().images.near_duplicate_distance)
+
+# Identical concurrent chat requests (e.g. a shared demo case) make one upstream call
+chat_flight = SingleFlight(timeout=get_config().concurrency.single_flight_timeout)
 
 def encode_image(image_path):
     """Encode image to base64 string"""
     if image_path is None or not os.path.exists(image_path):
         return None
-    
+
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
-def analyze_image_with_query(query, encoded_image, model):
+def preprocess_image(image_path, max_side=None):
     """
-    Analyze image with query or perform text-only analysis if no image
-    
+    Load an image, fix its orientation and downscale it
+
     Args:
-        query: The prompt/query text
-        encoded_image: Base64 encoded image or None for text-only
-        model: The model to use
-    
+        image_path: Path to the image file
+        max_side: Longest side in pixels after downscaling (default images.max_side)
+
     Returns:
-        str: The model's response
-    """
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    
-    # Build messages based on whether image is available
-    if encoded_image:
-        # Image + Text analysis
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": query
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{encoded_image}"
-                        }
-                    }
-                ]
-            }
-        ]
-    else:
-        # Text-only analysis
-        messages = [
+        PIL.Image: RGB image ready for encoding, or None if the file is missing
+    """
+    if image_path is None or not os.path.exists(image_path):
+        return None
+
+    max_side = max_side or get_config().images.max_side
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side))
+    return img
+
+def encode_pil_image(img, quality=None):
+    """Encode a PIL image to a base64 JPEG string (default quality images.jpeg_quality)"""
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality or get_config().images.jpeg_quality, optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+def prepare_images(image_paths, max_distance=None):
+    """
+    Preprocess several images and drop near-identical frames
+
+    Args:
+        image_paths: Paths to the uploaded images
+        max_distance: Max Hamming distance between pHashes to treat two images
+            as duplicates (default images.near_duplicate_distance)
+
+    Returns:
+        tuple: (base64 JPEG strings, perceptual hashes), one per distinct image, in upload order
+    """
+    if max_distance is None:
+        max_distance = get_config().images.near_duplicate_distance
+    encoded_images = []
+    image_hashes = []
+    for image_path in image_paths:
+        img = preprocess_image(image_path)
+        if img is None:
+            continue
+        image_hash = phash(img)
+        if any(hamming(image_hash, h) <= max_distance for h in image_hashes):
+            continue
+        image_hashes.append(image_hash)
+        encoded_images.append(encode_pil_image(img))
+    return encoded_images, image_hashes
+
+def pack_images(encoded_images, max_images=MAX_IMAGES_PER_REQUEST, max_bytes=MAX_IMAGE_BYTES_PER_REQUEST):
+    """
+    Split images into as few request-sized batches as the model limits allow
+
+    Args:
+        encoded_images: Base64 image strings
+        max_images: Max images per request
+        max_bytes: Max total base64 bytes per request
+
+    Returns:
+        list: Batches (lists) of base64 image strings
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for encoded in encoded_images:
+        if current and (len(current) >= max_images or current_bytes + len(encoded) > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(encoded)
+        current_bytes += len(encoded)
+    if current:
+        batches.append(current)
+    return batches
+
+def _build_messages(query, encoded_images):
+    """Build chat messages for a text query with zero or more images"""
+    if not encoded_images:
+        return [
             {
                 "role": "user",
                 "content": query
             }
         ]
-    
-    # Make API call
-    try:
-        chat_completion = client.chat.completions.create(
-            messages=messages,
-            model=model
+
+    if len(encoded_images) > 1:
+        query = (
+            f"The following {len(encoded_images)} images show the same patient "
+            f"from different angles or areas. Consider them together.\n\n{query}"
         )
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        # If vision model fails for text-only, try with a text model
-        if not encoded_image:
-            try:
-                chat_completion = client.chat.completions.create(
+
+    content = [
+        {
+            "type": "text",
+            "text": query
+        }
+    ]
+    for encoded in encoded_images:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:image/jpeg;base64,{encoded}"
+            }
+        })
+    return [
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
+async def _complete_async(client, messages, model, usage=None, max_tokens=None, images=0, stop=None,
+                          structured=False, on_section=None):
+    async def call():
+        kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+        if stop:
+            kwargs["stop"] = stop
+        start = time.perf_counter()
+        try:
+            if on_section is not None:
+                chat_completion, content = await _stream_sections_async(client, messages, model, kwargs, on_section)
+            else:
+                chat_completion = await client.chat.completions.create(
                     messages=messages,
-                    model="llama-3.3-70b-versatile"  # Fallback text model
+                    model=model,
+                    **kwargs
                 )
-                return chat_completion.choices[0].message.content
-            except Exception as e2:
-                return f"Error processing your request: {str(e2)}"
-        return f"Error analyzing image: {str(e)}"
\ No newline at end of file
+                content = chat_completion.choices[0].message.content
+        except Exception:
+            model_router.observe(model, time.perf_counter() - start, ok=False)
+            raise
+        model_router.observe(model, time.perf_counter() - start)
+        try:
+            get_usage_meter().record_completion(chat_completion, model, usage, images)
+        except Exception as e:
+            logging.warning(f"Could not record usage: {str(e)}")
+        choice = chat_completion.choices[0]
+        if getattr(choice, "finish_reason", None) == "length" and not structured:
+            # Cut off by max_tokens: don't show or speak half a sentence
+            return trim_to_sentence(content)
+        return content
+
+    return await chat_flight.do_async(make_key("chat", model, max_tokens, stop, messages), call)
+
+async def _stream_sections_async(client, messages, model, kwargs, on_section):
+    """
+    Stream a structured answer, calling on_section(name, value) as each section completes
+
+    Returns:
+        tuple: (completion-like object with finish_reason and usage, full response text)
+    """
+    parser = SectionStreamParser()
+    pieces = []
+    finish_reason = None
+    counts = None
+    stream = await client.chat.completions.create(messages=messages, model=model, stream=True, **kwargs)
+    async for chunk in stream:
+        if chunk.choices:
+            choice = chunk.choices[0]
+            delta = getattr(choice.delta, "content", None)
+            if delta:
+                pieces.append(delta)
+                emit_sections(on_section, parser.feed(delta))
+            finish_reason = getattr(choice, "finish_reason", None) or finish_reason
+        # Groq reports token counts on the last chunk, under x_groq
+        counts = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None) or counts
+    completion = SimpleNamespace(choices=[SimpleNamespace(finish_reason=finish_reason)], usage=counts)
+    return completion, "".join(pieces)
+
+async def _complete_with_fallback_async(client, messages, models, usage=None, max_tokens=None, images=0, stop=None,
+                                        structured=False, on_section=None):
+    """Try each model in order until one answers; re-raises the last failure"""
+    for i, model in enumerate(models):
+        try:
+            return await _complete_async(client, messages, model, usage, max_tokens, images, stop, structured, on_section)
+        except Exception as e:
+            if i == len(models) - 1:
+                raise
+            logging.warning(f"Model {model} failed, falling back to {models[i + 1]}: {str(e)}")
+
+def _finish_structured(response):
+    """Normalize a structured answer to compact JSON; anything unparseable (prose) passes through"""
+    sections = parse_sections(response)
+    return sections_json(sections) if sections is not None else response
+
+async def analyze_async(query, encoded_images, model, max_workers=None, image_hashes=None,
+                        usage=None, max_tokens=None, fallback_models=None, stop=None,
+                        structured=False, on_section=None):
+    """
+    Analyze zero or more images of the same case with one query, without blocking the event loop
+
+    Images are packed into as few requests as the model allows. When more
+    than one request is needed, the batches run concurrently and their
+    findings are merged into a single answer with a final text-only call.
+    If image_hashes are given, a near-duplicate case with the same query and
+    model reuses its earlier analysis instead of calling the model.
+
+    Args:
+        query: The prompt/query text
+        encoded_images: List of base64 encoded images (may be empty for text-only)
+        model: The model to use
+        max_workers: Max concurrent vision requests (default concurrency.image_requests)
+        image_hashes: Perceptual hashes from prepare_images, or None to skip the index
+        usage: Tags (specialty, language) to account the tokens under
+        max_tokens: Cap on the response length, or None for the model default
+        fallback_models: Models to try in order if model fails (defaults to
+            models.text_large for text-only requests, none with images)
+        stop: Stop sequences that end the response early
+        structured: Ask for a JSON object of sections (see structured_output)
+            instead of free-form text
+        on_section: With structured, callback(name, value) for each section
+            as soon as it has streamed in completely (called on the event
+            loop thread; keep it short)
+
+    Returns:
+        str: The model's response; with structured, the sections as a JSON
+            object (free-form text if the model ignored the format). On
+            failure, "Error ..." text (analyze_result_async() reports
+            failures separately from answers).
+    """
+    try:
+        return await _analyze_checked_async(
+            query, encoded_images, model, max_workers, image_hashes, usage, max_tokens, fallback_models, stop,
+            structured, on_section
+        )
+    except Exception as e:
+        return _error_text(e, encoded_images)
+
+async def _analyze_checked_async(query, encoded_images, model, max_workers=None, image_hashes=None, usage=None,
+                                 max_tokens=None, fallback_models=None, stop=None, structured=False,
+                                 on_section=None):
+    """analyze_async() that raises instead of returning error text"""
+    if structured:
+        response = await _analyze_async(
+            structured_query(query), encoded_images, model, max_workers, image_hashes, usage, max_tokens,
+            fallback_models, stop, True, on_section
+        )
+        return _finish_structured(response)
+    return await _analyze_async(
+        query, encoded_images, model, max_workers, image_hashes, usage, max_tokens, fallback_models, stop
+    )
+
+def _error_text(error, encoded_images):
+    if encoded_images:
+        return f"Error analyzing image: {str(error)}"
+    return f"Error processing your request: {str(error)}"
+
+async def _analyze_async(query, encoded_images, model, max_workers=None, image_hashes=None, usage=None,
+                         max_tokens=None, fallback_models=None, stop=None, structured=False, on_section=None):
+    config = get_config()
+    client = get_async_client()
+    max_workers = max_workers or config.concurrency.image_requests
+
+    if not encoded_images:
+        if fallback_models is None:
+            fallback_models = [config.models.text_large]
+        return await _complete_with_fallback_async(
+            client, _build_messages(query, []), [model] + list(fallback_models), usage, max_tokens, stop=stop,
+            structured=structured, on_section=on_section
+        )
+
+    models = [model] + list(fallback_models or [])
+
+    if image_hashes:
+        context_key = PerceptualImageIndex.context_key(model, max_tokens, query)
+        cached = image_analysis_index.get(context_key, image_hashes)
+        if cached is not None:
+            return cached
+        response = await _analyze_images_async(
+            client, query, encoded_images, models, max_workers, usage, max_tokens, stop, structured, on_section
+        )
+        image_analysis_index.put(context_key, image_hashes, response)
+        return response
+
+    return await _analyze_images_async(
+        client, query, encoded_images, models, max_workers, usage, max_tokens, stop, structured, on_section
+    )
+
+async def _analyze_images_async(client, query, encoded_images, models, max_workers, usage=None, max_tokens=None,
+                                stop=None, structured=False, on_section=None):
+    batches = pack_images(encoded_images)
+    semaphore = asyncio.Semaphore(max(1, max_workers))
+
+    async def run_batch(batch, on_section=None):
+        async with semaphore:
+            return await _complete_with_fallback_async(
+                client, _build_messages(query, batch), models, usage, max_tokens, images=len(batch), stop=stop,
+                structured=structured, on_section=on_section
+            )
+
+    if len(batches) == 1:
+        # Only the answer the patient sees is streamed; batch findings are merged first
+        return await run_batch(batches[0], on_section)
+    findings = await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+    merge_query = (
+        "Several assessments were made from different photos of the same patient. "
+        "Merge them into one answer that follows the original instructions below, "
+        "without repeating yourself and without mentioning that there were several assessments.\n\n"
+        f"Original instructions:\n{query}\n\n"
+        + "\n\n".join(f"Assessment {i + 1}:\n{text}" for i, text in enumerate(findings))
+    )
+    try:
+        return await _complete_with_fallback_async(
+            client, _build_messages(merge_query, []), models, usage, max_tokens, stop=stop,
+            structured=structured, on_section=on_section
+        )
+    except Exception:
+        # Merging is best-effort; the individual findings are still useful
+        parts = [parse_sections(text) for text in findings] if structured else []
+        if any(parts):
+            return sections_json(merge_sections(parts))
+        return "\n\n".join(findings)
+
+async def analyze_result_async(query, encoded_images, model, **kwargs):
+    """
+    analyze_async() as a StageResult
+
+    Takes the same arguments as analyze_async(). Failures are caught as
+    exceptions, so an answer that happens to start with "Error" is still
+    an answer.
+    """
+    try:
+        response = await _analyze_checked_async(query, encoded_images, model, **kwargs)
+    except Exception as e:
+        logging.error(f"Analysis failed ({type(e).__name__}): {str(e)}")
+        return StageResult.failure("llm", _error_text(e, encoded_images))
+    return StageResult.success("llm", response)
+
+def analyze_image_with_query(query, encoded_image, model, usage=None, max_tokens=None, fallback_models=None,
+                             stop=None, structured=False, on_section=None):
+    """
+    Analyze image with query or perform text-only analysis if no image
+
+    Blocking wrapper around analyze_async().
+
+    Args:
+        query: The prompt/query text
+        encoded_image: Base64 encoded image or None for text-only
+        model: The model to use
+        usage: Tags (specialty, language) to account the tokens under
+        max_tokens: Cap on the response length, or None for the model default
+        fallback_models: Models to try in order if model fails (defaults to
+            models.text_large for text-only requests, none with an image)
+        stop: Stop sequences that end the response early
+        structured: Return the sections (possible conditions, remedies, red
+            flags, spoken summary) as a JSON object
+        on_section: With structured, callback(name, value) for each section
+            as soon as it is complete
+
+    Returns:
+        str: The model's response (JSON with structured)
+    """
+    return run_sync(analyze_async(
+        query, [encoded_image] if encoded_image else [], model, usage=usage, max_tokens=max_tokens,
+        fallback_models=fallback_models, stop=stop, structured=structured, on_section=on_section
+    ))
+
+def analyze_images_with_query(query, encoded_images, model, max_workers=None, image_hashes=None,
+                              usage=None, max_tokens=None, fallback_models=None, stop=None,
+                              structured=False, on_section=None):
+    """
+    Analyze several images of the same case with one query
+
+    Blocking wrapper around analyze_async(); see there for batching,
+    merging, the near-duplicate index and structured output.
+
+    Args:
+        query: The prompt/query text
+        encoded_images: List of base64 encoded images (may be empty for text-only)
+        model: The vision model to use
+        max_workers: Max concurrent vision requests
+        image_hashes: Perceptual hashes from prepare_images, or None to skip the index
+        usage: Tags (specialty, language) to account the tokens under
+        max_tokens: Cap on the response length, or None for the model default
+        fallback_models: Models to try in order if model fails (see analyze_image_with_query)
+        stop: Stop sequences that end the response early
+        structured: Return the sections as a JSON object
+        on_section: With structured, callback(name, value) per completed section
+
+    Returns:
+        str: The model's response (JSON with structured)
+    """
+    return run_sync(analyze_async(
+        query, encoded_images, model, max_workers, image_hashes, usage, max_tokens, fallback_models, stop,
+        structured, on_section
+    ))
+
+def analyze_images_result(query, encoded_images, model, **kwargs):
+    """Blocking wrapper around analyze_result_async()"""
+    return run_sync(analyze_result_async(query, encoded_images, model, **kwargs))
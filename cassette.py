@@ -0,0 +1,412 @@
+"""
+Record and replay model traffic at the client boundary
+
+A cassette captures every Groq chat completion and transcription and every
+synthesized voice response of a run, so the run can be replayed offline,
+deterministically and (optionally) faster than real time:
+
+    cassettes/default/
+        interactions.jsonl    one JSON line per call: kind, request key,
+                              request, response (or error) and latency
+        media/<sha256>        images, recordings and speech, once each
+
+Images, audio and speech are stored by content hash instead of inline
+base64, which keeps the log small and lets repeated inputs share a file.
+On replay a call is matched on its request key (kind, model, parameters
+and content hashes); identical requests get their recorded responses in
+order, repeating the last one once they run out. Streamed completions
+are stored whole and streamed back in small pieces.
+
+    CASSETTE_MODE=record CASSETTE_PATH=cassettes/rash streamlit run streamlit_app.py
+    CASSETTE_MODE=replay CASSETTE_TIMING=0 streamlit run streamlit_app.py
+    python cassette.py cassettes/rash          # summary of a cassette
+"""
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+import async_runtime
+
+INTERACTIONS_FILE = "interactions.jsonl"
+MEDIA_DIR = "media"
+
+# Replayed streams are cut into pieces of this many characters
+STREAM_PIECE_CHARS = 16
+
+
+class CassetteMiss(LookupError):
+    """Replay found no recorded response for a request"""
+
+
+class ReplayedError(Exception):
+    """A call that failed while recording, failing the same way on replay"""
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _request_key(kind, request):
+    return _sha256(json.dumps([kind, request], sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+
+class Cassette:
+    """
+    One cassette directory, opened for recording or replay
+
+    Args:
+        path: Cassette directory (created when recording)
+        timing: Replay latency scale; 1 sleeps as long as the recorded call
+            took, 0 answers immediately
+    """
+
+    def __init__(self, path, timing=1.0):
+        self.path = path
+        self.timing = timing
+        self.mode = None
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._recorded = defaultdict(deque)
+        self._last = {}
+        self._models = []
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    # Storage
+
+    def _media_path(self, digest):
+        return os.path.join(self.path, MEDIA_DIR, digest)
+
+    def put_media(self, data):
+        """Store a blob once; returns its content hash"""
+        digest = _sha256(data)
+        path = self._media_path(digest)
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def get_media(self, digest):
+        with open(self._media_path(digest), "rb") as f:
+            return f.read()
+
+    def interactions(self):
+        """Every recorded interaction, in recording order"""
+        path = os.path.join(self.path, INTERACTIONS_FILE)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    # Recording
+
+    def record(self):
+        """Start recording: wrap the Groq client factory and the TTS router (appends to an existing cassette)"""
+        import voice_of_the_doctor
+
+        os.makedirs(os.path.join(self.path, MEDIA_DIR), exist_ok=True)
+        self.mode = "record"
+        router = voice_of_the_doctor.tts_router
+        synthesize = router.synthesize_async
+
+        async def recording_synthesize(input_text, language):
+            request = {"text": input_text, "language": language}
+            audio, audio_format = await self._capture(
+                "tts", request, lambda: synthesize(input_text, language),
+                lambda result: {"media": self.put_media(result[0]), "format": result[1]}
+            )
+            return audio, audio_format
+
+        async_runtime.set_client_factory(lambda api_key: _RecordingClient(self, async_runtime.create_client(api_key)))
+        router.synthesize_async = recording_synthesize
+        logging.info(f"Recording model traffic to {self.path}")
+        return self
+
+    async def _capture(self, kind, request, call, serialize):
+        start = time.perf_counter()
+        offset = time.monotonic() - self._started
+        entry = {"kind": kind, "key": _request_key(kind, request), "offset": round(offset, 3), "request": request}
+        try:
+            result = await call()
+        except Exception as e:
+            entry["latency"] = round(time.perf_counter() - start, 3)
+            entry["error"] = {"type": type(e).__name__, "message": str(e)}
+            self._append(entry)
+            raise
+        entry["latency"] = round(time.perf_counter() - start, 3)
+        try:
+            entry["response"] = serialize(result)
+            self._append(entry)
+        except Exception as e:
+            logging.warning(f"Could not record {kind} call: {str(e)}")
+        return result
+
+    async def _capture_stream(self, kind, request, call):
+        """_capture() for a streamed completion; recorded once the stream has been read to the end"""
+        start = time.perf_counter()
+        offset = time.monotonic() - self._started
+        entry = {"kind": kind, "key": _request_key(kind, request), "offset": round(offset, 3), "request": request}
+        try:
+            stream = await call()
+        except Exception as e:
+            entry["latency"] = round(time.perf_counter() - start, 3)
+            entry["error"] = {"type": type(e).__name__, "message": str(e)}
+            self._append(entry)
+            raise
+        return self._recording_stream(entry, start, stream)
+
+    async def _recording_stream(self, entry, start, stream):
+        pieces = []
+        finish_reason = None
+        usage = None
+        try:
+            async for chunk in stream:
+                if chunk.choices:
+                    pieces.append(getattr(chunk.choices[0].delta, "content", None) or "")
+                    finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+                usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                yield chunk
+        except Exception as e:
+            entry["latency"] = round(time.perf_counter() - start, 3)
+            entry["error"] = {"type": type(e).__name__, "message": str(e)}
+            self._append(entry)
+            raise
+        entry["latency"] = round(time.perf_counter() - start, 3)
+        entry["response"] = {"content": "".join(pieces), "finish_reason": finish_reason, "usage": _usage_counts(usage)}
+        self._append(entry)
+
+    def _append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            with open(os.path.join(self.path, INTERACTIONS_FILE), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.stats["recorded"] += 1
+
+    # Replay
+
+    def replay(self):
+        """Start replaying: serve every Groq and TTS call from the cassette, without network access"""
+        import voice_of_the_doctor
+
+        for entry in self.interactions():
+            self._recorded[entry["key"]].append(entry)
+            model = entry["request"].get("model")
+            if model and model not in self._models:
+                self._models.append(model)
+        if not self._recorded:
+            logging.warning(f"Cassette {self.path} is empty; every call will miss")
+        self.mode = "replay"
+
+        async def replaying_synthesize(input_text, language):
+            response = await self.play("tts", {"text": input_text, "language": language})
+            audio = await asyncio.to_thread(self.get_media, response["media"])
+            return audio, response["format"]
+
+        async_runtime.set_client_factory(lambda api_key: _ReplayClient(self))
+        voice_of_the_doctor.tts_router.synthesize_async = replaying_synthesize
+        logging.info(f"Replaying model traffic from {self.path} (timing x{self.timing})")
+        return self
+
+    async def play(self, kind, request):
+        """
+        The recorded response to a request, after its (scaled) recorded latency
+
+        Raises:
+            CassetteMiss: Nothing was recorded for this request
+            ReplayedError: The recorded call failed
+        """
+        key = _request_key(kind, request)
+        with self._lock:
+            queue = self._recorded.get(key)
+            entry = queue.popleft() if queue else self._last.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+            else:
+                self._last[key] = entry
+                self.stats["replayed"] += 1
+        if entry is None:
+            raise CassetteMiss(f"No recorded {kind} response for request {key[:12]} in {self.path}")
+        if self.timing:
+            await asyncio.sleep(entry["latency"] * self.timing)
+        if "error" in entry:
+            raise ReplayedError(f"{entry['error']['type']}: {entry['error']['message']}")
+        return entry["response"]
+
+    def summary(self):
+        """Calls, failures, recorded latency and media size per kind"""
+        kinds = defaultdict(lambda: {"calls": 0, "errors": 0, "latency": 0.0})
+        for entry in self.interactions():
+            stats = kinds[entry["kind"]]
+            stats["calls"] += 1
+            stats["errors"] += "error" in entry
+            stats["latency"] = round(stats["latency"] + entry["latency"], 3)
+        media_dir = os.path.join(self.path, MEDIA_DIR)
+        files = os.listdir(media_dir) if os.path.isdir(media_dir) else []
+        return {
+            "kinds": dict(kinds),
+            "media_files": len(files),
+            "media_bytes": sum(os.path.getsize(os.path.join(media_dir, name)) for name in files),
+        }
+
+
+def _chat_request(cassette, messages, model, kwargs):
+    """A chat request with inline images replaced by content hashes (stored when recording)"""
+    normalized = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                url = part.get("image_url", {}).get("url", "") if part.get("type") == "image_url" else ""
+                if url.startswith("data:") and ";base64," in url:
+                    data = base64.b64decode(url.split(";base64,", 1)[1])
+                    digest = cassette.put_media(data) if cassette.mode == "record" else _sha256(data)
+                    part = {"type": "image_url", "image_url": {"media": digest}}
+                parts.append(part)
+            message = {**message, "content": parts}
+        normalized.append(message)
+    return {"model": model, "messages": normalized, "params": kwargs}
+
+
+def _transcription_request(cassette, model, file, language):
+    # file is (name, bytes) as sent by voice_of_the_patient; the name is a temp path, not part of the key
+    data = file[1] if isinstance(file, tuple) else file.read()
+    digest = cassette.put_media(data) if cassette.mode == "record" else _sha256(data)
+    return {"model": model, "language": language, "audio": digest}
+
+
+def _usage_counts(usage):
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0),
+        "completion_tokens": getattr(usage, "completion_tokens", 0),
+        "total_tokens": getattr(usage, "total_tokens", 0),
+    }
+
+
+def _completion_response(completion):
+    choice = completion.choices[0]
+    return {
+        "content": choice.message.content,
+        "finish_reason": getattr(choice, "finish_reason", None),
+        "usage": _usage_counts(getattr(completion, "usage", None)),
+    }
+
+
+def _completion_from_response(response):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(
+            message=SimpleNamespace(content=response["content"]),
+            finish_reason=response.get("finish_reason")
+        )],
+        usage=SimpleNamespace(**response["usage"])
+    )
+
+
+async def _stream_from_response(response, piece_chars=STREAM_PIECE_CHARS):
+    """A recorded completion as a stream of chunks, shaped like Groq's (usage under x_groq on the last one)"""
+    content = response["content"] or ""
+    for i in range(0, len(content), piece_chars):
+        yield SimpleNamespace(choices=[SimpleNamespace(
+            delta=SimpleNamespace(content=content[i:i + piece_chars]), finish_reason=None
+        )])
+        await asyncio.sleep(0)
+    yield SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason=response.get("finish_reason"))],
+        x_groq=SimpleNamespace(usage=SimpleNamespace(**response["usage"]))
+    )
+
+
+class _RecordingClient:
+    """An AsyncGroq client whose chat and transcription calls are written to a cassette"""
+
+    def __init__(self, cassette, client):
+        self._cassette = cassette
+        self._client = client
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+
+    def __getattr__(self, name):
+        # Anything not recorded (models.list for health probes, ...) goes straight through
+        return getattr(self._client, name)
+
+    async def _chat(self, messages, model, **kwargs):
+        request = _chat_request(self._cassette, messages, model, kwargs)
+        if kwargs.get("stream"):
+            return await self._cassette._capture_stream(
+                "chat", request, lambda: self._client.chat.completions.create(messages=messages, model=model, **kwargs)
+            )
+        return await self._cassette._capture(
+            "chat", request,
+            lambda: self._client.chat.completions.create(messages=messages, model=model, **kwargs),
+            _completion_response
+        )
+
+    async def _transcribe(self, model, file, language=None, **kwargs):
+        request = _transcription_request(self._cassette, model, file, language)
+        return await self._cassette._capture(
+            "stt", request,
+            lambda: self._client.audio.transcriptions.create(model=model, file=file, language=language, **kwargs),
+            lambda transcription: {"text": transcription.text}
+        )
+
+
+class _ReplayClient:
+    """Stands in for AsyncGroq, answering from a cassette"""
+
+    def __init__(self, cassette):
+        self._cassette = cassette
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+        self.models = SimpleNamespace(list=self._list_models)
+
+    async def _chat(self, messages, model, **kwargs):
+        response = await self._cassette.play("chat", _chat_request(self._cassette, messages, model, kwargs))
+        if kwargs.get("stream"):
+            return _stream_from_response(response)
+        return _completion_from_response(response)
+
+    async def _transcribe(self, model, file, language=None, **kwargs):
+        response = await self._cassette.play("stt", _transcription_request(self._cassette, model, file, language))
+        return SimpleNamespace(text=response["text"])
+
+    async def _list_models(self):
+        return SimpleNamespace(data=[SimpleNamespace(id=model) for model in self._cassette._models])
+
+
+def install_from_config(config=None):
+    """
+    Record or replay as configured in the cassette section (CASSETTE_MODE)
+
+    Returns:
+        Cassette: The installed cassette, or None when the mode is "off"
+    """
+    if config is None:
+        from config import get_config
+        config = get_config()
+    settings = config.cassette
+    if settings.mode == "record":
+        return Cassette(settings.path).record()
+    if settings.mode == "replay":
+        return Cassette(settings.path, timing=settings.timing).replay()
+    return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarize a model traffic cassette")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    summary = Cassette(args.path).summary()
+    for kind, stats in sorted(summary["kinds"].items()):
+        print(f"{kind:<5} {stats['calls']:>6} calls {stats['errors']:>4} errors {stats['latency']:>9.2f}s recorded latency")
+    print(f"media {summary['media_files']:>6} files {summary['media_bytes'] / 1024:>9.1f} KiB")
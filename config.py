@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Literal, Optional
+
+import yaml
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+# Per-environment overrides live under "profiles" in the config file
+DEFAULT_CONFIG_PATH = "config.yaml"
+DEFAULT_PROFILE = "development"
+
+# Prefix for nested overrides of any field, e.g. APP__GROQ__MAX_CONNECTIONS=400
+ENV_PREFIX = "APP__"
+
+SPECIALTIES = ("allopathy", "homeopathy", "ayurveda")
+
+
+class Section(BaseModel):
+    # Unknown keys are typos, not extensions
+    model_config = ConfigDict(extra="forbid")
+
+
+class GroqConfig(Section):
+    api_key: Optional[str] = None
+    max_connections: int = Field(200, ge=1)
+    max_keepalive_connections: int = Field(50, ge=0)
+    timeout_seconds: float = Field(60.0, gt=0)
+    max_retries: int = Field(2, ge=0)
+
+
+class ModelsConfig(Section):
+    stt: str = "whisper-large-v3"
+    vision: str = "meta-llama/llama-4-scout-17b-16e-instruct"
+    text_small: str = "llama-3.1-8b-instant"
+    text_large: str = "llama-3.3-70b-versatile"
+    routes_path: Optional[str] = None
+
+
+class LanguageConfig(Section):
+    whisper: str
+    tts: str
+
+
+class PathsConfig(Section):
+    output_audio: str = "temp_docs/doctor_response.mp3"
+    media_dir: str = "temp_docs/media"
+    consultation_db: str = "data/consultations.db"
+    jobs_db: str = "data/jobs.db"
+    usage_db: str = "data/usage.db"
+
+
+class MediaConfig(Section):
+    session_quota_mb: int = Field(25, ge=1)
+    global_quota_mb: int = Field(256, ge=1)
+    spill_threshold_mb: int = Field(2, ge=0)
+    idle_timeout_min: int = Field(30, ge=1)
+    max_upload_images: int = Field(10, ge=1)
+
+
+class ImagesConfig(Section):
+    max_side: int = Field(1024, ge=64)
+    jpeg_quality: int = Field(85, ge=10, le=95)
+    near_duplicate_distance: int = Field(6, ge=0, le=64)
+    # Local quality gate before vision calls: off, warn (feedback only) or reject (skip the photo)
+    quality_gate: Literal["off", "warn", "reject"] = "reject"
+    min_side: int = Field(160, ge=1)
+    blur_threshold: float = Field(40.0, ge=0)
+    dark_threshold: float = Field(40.0, ge=0, le=255)
+    bright_threshold: float = Field(225.0, ge=0, le=255)
+    min_contrast: float = Field(12.0, ge=0)
+
+
+class ConcurrencyConfig(Section):
+    image_requests: int = Field(3, ge=1)
+    single_flight_timeout: float = Field(120.0, gt=0)
+    speech_workers: int = Field(4, ge=1)
+    max_speech_jobs: int = Field(500, ge=1)
+    report_workers: int = Field(2, ge=1)
+    max_reports: int = Field(200, ge=1)
+    prefetch_max_results: int = Field(200, ge=1)
+
+
+class CacheConfig(Section):
+    semantic_mode: Literal["off", "shadow", "on"] = "shadow"
+    semantic_threshold: float = Field(0.9, ge=0.0, le=1.0)
+    embedding_model: Optional[str] = None
+
+
+class TTSConfig(Section):
+    preference: Dict[str, List[str]] = Field(default_factory=dict)
+    piper_voices: Dict[str, str] = Field(default_factory=dict)
+    prefetch: bool = False
+    gtts_max_chars: int = Field(100, ge=20)
+    audio_codec: Literal["auto", "opus", "mp3", "wav"] = "auto"  # Delivery codec for local-engine speech
+    audio_bitrate_kbps: int = Field(24, ge=6, le=128)
+
+
+class ResponseConfig(Section):
+    max_tokens: Dict[str, int] = Field(default_factory=lambda: {"allopathy": 350, "homeopathy": 300, "ayurveda": 300})
+    stop_sequences: List[str] = Field(default_factory=lambda: ["\n\n"])
+    structured: bool = False
+
+    @field_validator("stop_sequences")
+    @classmethod
+    def _at_most_four(cls, value):
+        if len(value) > 4:
+            raise ValueError("the API accepts at most 4 stop sequences")
+        return value
+
+
+class UsageConfig(Section):
+    daily_token_budget: int = Field(0, ge=0)
+    budgets: Dict[str, int] = Field(default_factory=dict)
+    soft_limit: float = Field(0.8, gt=0.0, le=1.0)
+    flush_interval: float = Field(5.0, gt=0)
+
+
+class JobQueueConfig(Section):
+    enabled: bool = False
+    timeout_seconds: float = Field(180.0, gt=0)
+
+
+class PrefetchConfig(Section):
+    enabled: bool = True
+
+
+class ReportsConfig(Section):
+    pdf: Literal["auto", "true", "false"] = "auto"
+
+    @field_validator("pdf", mode="before")
+    @classmethod
+    def _lower(cls, value):
+        return str(value).lower()
+
+
+class HealthConfig(Section):
+    port: int = Field(8502, ge=0, le=65535)
+    probe_ttl: float = Field(30.0, gt=0)
+    probe_timeout: float = Field(3.0, gt=0)
+
+
+class CassetteConfig(Section):
+    mode: Literal["off", "record", "replay"] = "off"
+    path: str = "cassettes/default"
+    timing: float = Field(1.0, ge=0)  # Replay latency scale: 1 = as recorded, 0 = instant
+
+    @field_validator("mode", mode="before")
+    @classmethod
+    def _lower(cls, value):
+        return str(value).lower()
+
+
+class AppConfig(Section):
+    """
+    Every setting the app and its pipeline read, validated on load
+
+    Sections marked "restart" below are read when shared objects (clients,
+    pools, executors) are created; the rest are read per request and take
+    effect on hot reload.
+    """
+
+    profile: str = DEFAULT_PROFILE
+    reload_interval_seconds: float = Field(5.0, ge=0)  # 0 disables hot reload
+    groq: GroqConfig = Field(default_factory=GroqConfig)  # restart
+    models: ModelsConfig = Field(default_factory=ModelsConfig)
+    languages: Dict[str, LanguageConfig] = Field(default_factory=lambda: {
+        "english": LanguageConfig(whisper="en", tts="en"),
+        "hindi": LanguageConfig(whisper="hi", tts="hi"),
+    })
+    paths: PathsConfig = Field(default_factory=PathsConfig)  # restart
+    media: MediaConfig = Field(default_factory=MediaConfig)  # restart, except max_upload_images
+    images: ImagesConfig = Field(default_factory=ImagesConfig)
+    concurrency: ConcurrencyConfig = Field(default_factory=ConcurrencyConfig)  # restart, except image_requests
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    tts: TTSConfig = Field(default_factory=TTSConfig)
+    response: ResponseConfig = Field(default_factory=ResponseConfig)
+    usage: UsageConfig = Field(default_factory=UsageConfig)
+    job_queue: JobQueueConfig = Field(default_factory=JobQueueConfig)  # restart, except timeout_seconds
+    prefetch: PrefetchConfig = Field(default_factory=PrefetchConfig)
+    reports: ReportsConfig = Field(default_factory=ReportsConfig)
+    health: HealthConfig = Field(default_factory=HealthConfig)  # restart
+    cassette: CassetteConfig = Field(default_factory=CassetteConfig)  # restart
+
+
+def _csv(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _json_or_raw(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+# Environment variable names documented before the config file existed
+LEGACY_ENV = {
+    "GROQ_API_KEY": ("groq", "api_key"),
+    "GROQ_MAX_CONNECTIONS": ("groq", "max_connections"),
+    "GROQ_MAX_KEEPALIVE_CONNECTIONS": ("groq", "max_keepalive_connections"),
+    "OUTPUT_AUDIO_PATH": ("paths", "output_audio"),
+    "MEDIA_DIR": ("paths", "media_dir"),
+    "CONSULTATION_DB_PATH": ("paths", "consultation_db"),
+    "JOB_QUEUE_DB_PATH": ("paths", "jobs_db"),
+    "USAGE_DB_PATH": ("paths", "usage_db"),
+    "MEDIA_SESSION_QUOTA_MB": ("media", "session_quota_mb"),
+    "MEDIA_GLOBAL_QUOTA_MB": ("media", "global_quota_mb"),
+    "MEDIA_SPILL_THRESHOLD_MB": ("media", "spill_threshold_mb"),
+    "MEDIA_IDLE_TIMEOUT_MIN": ("media", "idle_timeout_min"),
+    "MAX_UPLOAD_IMAGES": ("media", "max_upload_images"),
+    "IMAGE_QUALITY_GATE": ("images", "quality_gate"),
+    "IMAGE_BLUR_THRESHOLD": ("images", "blur_threshold"),
+    "EMBEDDING_MODEL": ("cache", "embedding_model"),
+    "SEMANTIC_CACHE_MODE": ("cache", "semantic_mode"),
+    "SEMANTIC_CACHE_THRESHOLD": ("cache", "semantic_threshold"),
+    "TTS_PREFETCH": ("tts", "prefetch"),
+    "TTS_AUDIO_CODEC": ("tts", "audio_codec"),
+    "TTS_AUDIO_BITRATE_KBPS": ("tts", "audio_bitrate_kbps"),
+    "JOB_QUEUE_ENABLED": ("job_queue", "enabled"),
+    "JOB_TIMEOUT_SECONDS": ("job_queue", "timeout_seconds"),
+    "USAGE_DAILY_TOKEN_BUDGET": ("usage", "daily_token_budget"),
+    "USAGE_SOFT_LIMIT": ("usage", "soft_limit"),
+    "USAGE_FLUSH_INTERVAL": ("usage", "flush_interval"),
+    "MODEL_ROUTES_PATH": ("models", "routes_path"),
+    "RESPONSE_STOP_SEQUENCES": ("response", "stop_sequences", json.loads),
+    "RESPONSE_STRUCTURED": ("response", "structured"),
+    "PREFETCH_ENABLED": ("prefetch", "enabled"),
+    "REPORT_PDF": ("reports", "pdf"),
+    "HEALTH_PORT": ("health", "port"),
+    "HEALTH_PROBE_TTL": ("health", "probe_ttl"),
+    "HEALTH_PROBE_TIMEOUT": ("health", "probe_timeout"),
+    "CASSETTE_MODE": ("cassette", "mode"),
+    "CASSETTE_PATH": ("cassette", "path"),
+    "CASSETTE_TIMING": ("cassette", "timing"),
+}
+for _specialty in SPECIALTIES:
+    LEGACY_ENV[f"RESPONSE_MAX_TOKENS_{_specialty.upper()}"] = ("response", "max_tokens", _specialty)
+    LEGACY_ENV[f"USAGE_BUDGET_{_specialty.upper()}"] = ("usage", "budgets", _specialty)
+for _language in ("en", "hi"):
+    LEGACY_ENV[f"TTS_PREFERENCE_{_language.upper()}"] = ("tts", "preference", _language, _csv)
+    LEGACY_ENV[f"PIPER_VOICE_{_language.upper()}"] = ("tts", "piper_voices", _language)
+
+
+def _deep_merge(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _set_path(data, path, value):
+    for key in path[:-1]:
+        data = data.setdefault(key, {})
+    data[path[-1]] = value
+
+
+def _env_overrides(environ):
+    overrides = {}
+    for name, spec in LEGACY_ENV.items():
+        value = environ.get(name)
+        if value in (None, ""):
+            continue
+        *path, convert = spec if callable(spec[-1]) else (*spec, None)
+        _set_path(overrides, path, convert(value) if convert else value)
+    for name, value in environ.items():
+        if name.startswith(ENV_PREFIX) and value != "":
+            path = [part.lower() for part in name[len(ENV_PREFIX):].split("__") if part]
+            if path:
+                _set_path(overrides, path, _json_or_raw(value))
+    return overrides
+
+
+def load_config(path=None, profile=None, environ=None):
+    """
+    Build the config from defaults, the config file, the profile and the environment
+
+    Later sources win: built-in defaults, the file's top-level settings, its
+    profiles.<profile> section, then environment variables (the documented
+    names such as MEDIA_DIR, or APP__<SECTION>__<FIELD> for any field).
+
+    Args:
+        path: Config file (default CONFIG_PATH or config.yaml; missing is fine)
+        profile: Profile name (default APP_PROFILE or "development")
+        environ: Environment mapping (default os.environ)
+
+    Raises:
+        ValueError: The file can't be parsed or a value fails validation
+    """
+    environ = os.environ if environ is None else environ
+    path = path or environ.get("CONFIG_PATH", DEFAULT_CONFIG_PATH)
+    profile = profile or environ.get("APP_PROFILE", DEFAULT_PROFILE)
+
+    data = {}
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        if not isinstance(data, dict):
+            raise ValueError(f"{path}: expected a mapping at the top level")
+    profiles = data.pop("profiles", None) or {}
+    data = _deep_merge(data, profiles.get(profile) or {})
+    data = _deep_merge(data, _env_overrides(environ))
+    data["profile"] = profile
+    try:
+        return AppConfig.model_validate(data)
+    except ValidationError as e:
+        raise ValueError(f"Invalid configuration ({path}, profile {profile}): {e}") from e
+
+
+class ConfigManager:
+    """
+    Holds the current AppConfig, loaded once and hot-reloaded on file changes
+
+    get() is cheap: at most every reload_interval_seconds it compares the
+    config file's mtime and, when it changed, reloads. A file that fails to
+    parse or validate is logged and the previous config stays in effect.
+    Callbacks registered with on_reload(fn) get (new, old) after a reload.
+    """
+
+    def __init__(self, path=None, profile=None):
+        self.path = path
+        self.profile = profile
+        self._lock = threading.Lock()
+        self._config = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._listeners = []
+
+    def get(self):
+        config = self._config
+        if config is None:
+            with self._lock:
+                if self._config is None:
+                    # .env fills in the environment once, before the first load
+                    load_dotenv()
+                    self._config = load_config(self.path, self.profile)
+                    self._mtime = self._file_mtime()
+                    self._checked_at = time.monotonic()
+                return self._config
+        interval = config.reload_interval_seconds
+        if interval and time.monotonic() - self._checked_at >= interval:
+            self._maybe_reload()
+        return self._config
+
+    def on_reload(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def reload(self):
+        """Reload now; returns the new config (or the old one if the new one is invalid)"""
+        with self._lock:
+            return self._reload_locked()
+
+    def _maybe_reload(self):
+        with self._lock:
+            self._checked_at = time.monotonic()
+            if self._file_mtime() == self._mtime:
+                return
+            self._reload_locked()
+
+    def _reload_locked(self):
+        old = self._config
+        self._mtime = self._file_mtime()
+        try:
+            new = load_config(self.path, self.profile)
+        except Exception as e:
+            logging.error(f"Config reload failed, keeping the previous config: {str(e)}")
+            return old
+        self._config = new
+        logging.info(f"Configuration reloaded (profile {new.profile})")
+        for callback in list(self._listeners):
+            try:
+                callback(new, old)
+            except Exception as e:
+                logging.error(f"Config reload listener failed: {str(e)}")
+        return new
+
+    def _file_mtime(self):
+        path = self.path or os.getenv("CONFIG_PATH", DEFAULT_CONFIG_PATH)
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+
+config_manager = ConfigManager()
+
+
+def get_config():
+    """The current configuration (loaded on first use)"""
+    return config_manager.get()
+
+
+def on_reload(callback):
+    """Call callback(new, old) whenever the configuration is reloaded"""
+    config_manager.on_reload(callback)
+
+
+if __name__ == "__main__":
+    # Print the effective configuration (secrets masked) for the current profile
+    effective = get_config().model_dump()
+    if effective["groq"]["api_key"]:
+        effective["groq"]["api_key"] = "***"
+    print(yaml.safe_dump(effective, sort_keys=False, allow_unicode=True))
@@ -0,0 +1,223 @@
+import logging
+import threading
+
+from consultation_store import connect
+from embeddings import tokenize, get_default_embedder, VectorIndex
+
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS consultation_fts USING fts5(
+    symptoms,
+    response,
+    tokenize = 'unicode61'
+);
+CREATE TABLE IF NOT EXISTS search_index_state (
+    name TEXT PRIMARY KEY,
+    last_rowid INTEGER NOT NULL
+);
+"""
+
+# Words in a query that mean "restrict to this specialty" rather than symptoms
+SPECIALTY_ALIASES = {
+    "allopathy": "allopathy", "allopathic": "allopathy",
+    "एलोपैथी": "allopathy", "एलोपैथिक": "allopathy",
+    "homeopathy": "homeopathy", "homeopathic": "homeopathy", "homoeopathy": "homeopathy",
+    "होम्योपैथी": "homeopathy", "होम्योपैथिक": "homeopathy",
+    "ayurveda": "ayurveda", "ayurvedic": "ayurveda",
+    "आयुर्वेद": "ayurveda", "आयुर्वेदिक": "ayurveda",
+}
+
+# Reciprocal rank fusion constant
+RRF_K = 60
+CANDIDATES_PER_INDEX = 50
+CATCH_UP_CHUNK = 500
+
+
+def _symptoms_text(row):
+    return " ".join(t for t in (row.get("transcription"), row.get("text_input")) if t)
+
+
+class ConsultationSearch:
+    """
+    Full-text (SQLite FTS5) and semantic search over stored consultations
+
+    Failed consultations (no response) are indexed but filtered out of
+    both rankings.
+
+    The FTS index lives next to the consultations table and is kept up to
+    date incrementally from the store's writer thread. The semantic index is
+    an in-memory VectorIndex of symptom embeddings, rebuilt from the database
+    at startup and extended the same way. Hybrid search fuses both rankings
+    with reciprocal rank fusion.
+    """
+
+    def __init__(self, store, embedder=None, semantic=True):
+        self.store = store
+        self.embedder = (embedder or get_default_embedder()) if semantic else None
+        self.vectors = VectorIndex(self.embedder.dim) if self.embedder else None
+
+        with connect(store.db_path) as conn:
+            conn.executescript(SEARCH_SCHEMA)
+
+        self._read_conn = connect(store.db_path)
+        self._read_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+
+        # Listen first, then catch up: indexing is idempotent per rowid
+        store.add_listener(self._on_batch)
+        self._catch_up()
+
+    def search(self, query, specialty=None, language=None, limit=10, mode="hybrid"):
+        """
+        Find past consultations similar to a free-text query
+
+        Specialty names in the query ("rash + fever, ayurveda") become a
+        specialty filter when no explicit specialty is given.
+
+        Args:
+            query: Free text in English, Hindi or both
+            specialty: Restrict to a doctor type
+            language: Restrict to "english" or "hindi"
+            limit: Max results
+            mode: "hybrid", "fulltext" or "semantic"
+
+        Returns:
+            list: Consultation dicts with an added "score", best first
+        """
+        tokens = []
+        for token in tokenize(query):
+            alias = SPECIALTY_ALIASES.get(token)
+            if alias:
+                specialty = specialty or alias
+            else:
+                tokens.append(token)
+        if not tokens:
+            return []
+
+        rankings = []
+        if mode in ("hybrid", "fulltext"):
+            rankings.append(self._fulltext(tokens, specialty, language))
+        if mode in ("hybrid", "semantic") and self.vectors is not None:
+            rankings.append(self._semantic(" ".join(tokens), specialty, language))
+
+        fused = {}
+        for ranking in rankings:
+            for rank, consultation_id in enumerate(ranking):
+                fused[consultation_id] = fused.get(consultation_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+        results = []
+        for consultation_id, score in sorted(fused.items(), key=lambda item: -item[1])[:limit]:
+            consultation = self.store.get(consultation_id)
+            if consultation is not None:
+                consultation["score"] = score
+                results.append(consultation)
+        return results
+
+    def _fulltext(self, tokens, specialty, language):
+        # OR of prefix terms; bm25 ranks documents matching more terms higher
+        match = " OR ".join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+        sql = (
+            "SELECT c.id FROM consultation_fts f JOIN consultations c ON c.rowid = f.rowid "
+            "WHERE consultation_fts MATCH ? AND c.response IS NOT NULL"
+        )
+        params = [match]
+        if specialty:
+            sql += " AND c.specialty = ?"
+            params.append(specialty)
+        if language:
+            sql += " AND c.language = ?"
+            params.append(language)
+        sql += " ORDER BY bm25(consultation_fts, 2.0, 1.0) LIMIT ?"
+        params.append(CANDIDATES_PER_INDEX)
+        with self._read_lock:
+            return [row[0] for row in self._read_conn.execute(sql, params)]
+
+    def _semantic(self, text, specialty, language):
+        vector = self.embedder.embed([text])[0]
+        hits = self.vectors.search(
+            vector, k=CANDIDATES_PER_INDEX, min_score=0.1, specialty=specialty, language=language, answered=True
+        )
+        return [key for key, _, _ in hits]
+
+    def _on_batch(self, conn, rows):
+        ids = [row["id"] for row in rows]
+        placeholders = ", ".join("?" for _ in ids)
+        indexed = conn.execute(
+            f"SELECT rowid, id, specialty, language, transcription, text_input, response "
+            f"FROM consultations WHERE id IN ({placeholders})",
+            ids
+        ).fetchall()
+        self._index(conn, [dict(r) for r in indexed])
+
+    def _catch_up(self):
+        conn = connect(self.store.db_path)
+        try:
+            row = conn.execute("SELECT last_rowid FROM search_index_state WHERE name = 'fts'").fetchone()
+            fts_done = row[0] if row else 0
+            last_rowid = 0
+            while True:
+                rows = [dict(r) for r in conn.execute(
+                    "SELECT rowid, id, specialty, language, transcription, text_input, response "
+                    "FROM consultations WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last_rowid, CATCH_UP_CHUNK)
+                )]
+                if not rows:
+                    break
+                last_rowid = rows[-1]["rowid"]
+                pending = [r for r in rows if r["rowid"] > fts_done]
+                self._index(conn, pending, vector_rows=rows)
+        finally:
+            conn.close()
+
+    def _index(self, conn, rows, vector_rows=None):
+        """Add rows to the FTS index (persisted) and the vector index (in memory)"""
+        vector_rows = rows if vector_rows is None else vector_rows
+        with self._index_lock:
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(
+                            "DELETE FROM consultation_fts WHERE rowid = ?",
+                            [(r["rowid"],) for r in rows]
+                        )
+                        conn.executemany(
+                            "INSERT INTO consultation_fts (rowid, symptoms, response) VALUES (?, ?, ?)",
+                            [(r["rowid"], _symptoms_text(r), r.get("response") or "") for r in rows]
+                        )
+                        conn.execute(
+                            "INSERT INTO search_index_state (name, last_rowid) VALUES ('fts', ?) "
+                            "ON CONFLICT(name) DO UPDATE SET last_rowid = MAX(last_rowid, excluded.last_rowid)",
+                            (max(r["rowid"] for r in rows),)
+                        )
+                except Exception as e:
+                    logging.error(f"Failed to update consultation search index: {str(e)}")
+
+            if self.vectors is not None and vector_rows:
+                texts = [_symptoms_text(r) or (r.get("response") or "") for r in vector_rows]
+                self.vectors.add(
+                    [r["id"] for r in vector_rows],
+                    self.embedder.embed(texts),
+                    [{"specialty": r["specialty"], "language": r["language"], "answered": r.get("response") is not None}
+                     for r in vector_rows]
+                )
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import get_config
+    from consultation_store import ConsultationStore
+
+    parser = argparse.ArgumentParser(description="Search past consultations")
+    parser.add_argument("query")
+    parser.add_argument("--specialty")
+    parser.add_argument("--language")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--mode", default="hybrid", choices=["hybrid", "fulltext", "semantic"])
+    parser.add_argument("--db", default=get_config().paths.consultation_db)
+    args = parser.parse_args()
+
+    store = ConsultationStore(db_path=args.db)
+    search = ConsultationSearch(store)
+    for result in search.search(args.query, args.specialty, args.language, args.limit, args.mode):
+        symptoms = _symptoms_text(result) or "(image only)"
+        print(f"{result['score']:.4f}  {result['id']}  {result['specialty']}/{result['language']}  {symptoms[:80]}")
+    store.close()
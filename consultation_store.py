@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_QUEUE_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS consultations (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    session_id TEXT,
+    specialty TEXT NOT NULL,
+    language TEXT NOT NULL,
+    has_image INTEGER NOT NULL DEFAULT 0,
+    has_audio INTEGER NOT NULL DEFAULT 0,
+    has_text INTEGER NOT NULL DEFAULT 0,
+    image_count INTEGER NOT NULL DEFAULT 0,
+    transcription TEXT,
+    text_input TEXT,
+    response TEXT,
+    timings TEXT,
+    models TEXT,
+    errors TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_consultations_created_at ON consultations (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_consultations_specialty ON consultations (specialty, created_at);
+CREATE INDEX IF NOT EXISTS idx_consultations_language ON consultations (language, created_at);
+"""
+
+COLUMNS = (
+    "id", "created_at", "session_id", "specialty", "language",
+    "has_image", "has_audio", "has_text", "image_count",
+    "transcription", "text_input", "response", "timings", "models", "errors"
+)
+JSON_COLUMNS = ("timings", "models", "errors")
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = (
+    ("errors", "ALTER TABLE consultations ADD COLUMN errors TEXT"),
+)
+
+
+def connect(db_path):
+    """Open a connection with the pragmas every store connection uses"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class ConsultationStore:
+    """
+    Persistent history of consultations in a local SQLite (WAL) database
+
+    record() only enqueues; a background thread writes queued consultations
+    in batches, so saving history never adds latency to a consultation.
+    Reads use their own connection and, thanks to WAL, never block the writer.
+
+    Failed consultations are stored too, with response None and the failed
+    stages' messages in errors, so the history shows failure rates; search
+    and reports skip them.
+    """
+
+    def __init__(
+        self,
+        db_path="data/consultations.db",
+        batch_size=DEFAULT_BATCH_SIZE,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        queue_size=DEFAULT_QUEUE_SIZE
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with connect(db_path) as conn:
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(consultations)")}
+            for column, statement in MIGRATIONS:
+                if column not in existing:
+                    conn.execute(statement)
+
+        self._read_conn = connect(db_path)
+        self._read_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._listeners = []
+        self._closed = False
+        self._writer = threading.Thread(target=self._run_writer, name="consultation-store-writer", daemon=True)
+        self._writer.start()
+
+    def add_listener(self, callback):
+        """
+        Register callback(conn, rows) to run on the writer thread after each batch commits
+
+        Used by indexes that need to follow new consultations incrementally.
+        """
+        self._listeners.append(callback)
+
+    def record(self, consultation):
+        """
+        Queue a consultation for writing without blocking
+
+        Args:
+            consultation: Dict with the keys in COLUMNS; "id" is required,
+                created_at defaults to now, timings/models may be dicts
+
+        Returns:
+            bool: False if the queue was full and the record was dropped
+        """
+        row = dict(consultation)
+        row.setdefault("created_at", time.time())
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            logging.warning("Consultation history queue full, dropping record")
+            return False
+
+    def flush(self, timeout=None):
+        """
+        Block until everything queued so far has been written
+
+        Returns:
+            bool: False on timeout, or immediately once the store is closed
+        """
+        if self._closed:
+            return False
+        done = threading.Event()
+        self._queue.put(done, timeout=timeout)
+        return done.wait(timeout)
+
+    def close(self):
+        """Flush pending writes and stop the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._read_conn.close()
+
+    def get(self, consultation_id):
+        """Fetch a single consultation by id, or None"""
+        with self._read_lock:
+            row = self._read_conn.execute(
+                "SELECT * FROM consultations WHERE id = ?", (consultation_id,)
+            ).fetchone()
+        return _row_to_dict(row) if row is not None else None
+
+    def query(self, specialty=None, language=None, since=None, until=None, limit=20, cursor=None, answered=None):
+        """
+        Page through consultations, newest first
+
+        Args:
+            specialty: Filter by doctor type ("allopathy", "homeopathy", "ayurveda")
+            language: Filter by language ("english", "hindi")
+            since: Only consultations at or after this unix timestamp
+            until: Only consultations before this unix timestamp
+            limit: Page size
+            cursor: next_cursor from the previous page, or None for the first page
+            answered: True for consultations with an answer, False for
+                failed ones, None for both
+
+        Returns:
+            tuple: (list of consultation dicts, next_cursor or None when exhausted)
+        """
+        clauses = []
+        params = []
+        if specialty:
+            clauses.append("specialty = ?")
+            params.append(specialty)
+        if language:
+            clauses.append("language = ?")
+            params.append(language)
+        if answered is not None:
+            clauses.append("response IS NOT NULL" if answered else "response IS NULL")
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if cursor is not None:
+            # Keyset pagination: stable and O(limit) regardless of page depth
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+
+        sql = "SELECT * FROM consultations"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self._read_lock:
+            rows = self._read_conn.execute(sql, params).fetchall()
+
+        items = [_row_to_dict(r) for r in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = (last["created_at"], last["id"])
+        return items, next_cursor
+
+    def count(self, specialty=None, language=None, answered=None):
+        """Number of stored consultations matching the filters (answered as in query())"""
+        sql = "SELECT COUNT(*) FROM consultations WHERE 1=1"
+        params = []
+        if specialty:
+            sql += " AND specialty = ?"
+            params.append(specialty)
+        if language:
+            sql += " AND language = ?"
+            params.append(language)
+        if answered is not None:
+            sql += " AND response IS NOT NULL" if answered else " AND response IS NULL"
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchone()[0]
+
+    def _run_writer(self):
+        conn = connect(self.db_path)
+        running = True
+        while running:
+            batch = []
+            waiters = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            # Drain whatever else is already queued, up to one batch
+            while True:
+                if item is None:
+                    running = False
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if not running or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(conn, batch)
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        rows = [_dict_to_row(c) for c in batch]
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        try:
+            with conn:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO consultations ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Failed to write {len(rows)} consultations: {str(e)}")
+            return
+
+        written = [dict(zip(COLUMNS, r)) for r in rows]
+        for listener in self._listeners:
+            try:
+                listener(conn, written)
+            except Exception as e:
+                logging.error(f"Consultation store listener failed: {str(e)}")
+
+
+def _dict_to_row(consultation):
+    values = []
+    for column in COLUMNS:
+        value = consultation.get(column)
+        if column in JSON_COLUMNS and value is not None and not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False)
+        elif column.startswith("has_"):
+            value = int(bool(value))
+        elif column == "image_count":
+            value = int(value or 0)
+        values.append(value)
+    return tuple(values)
+
+
+def _row_to_dict(row):
+    result = dict(row)
+    for column in JSON_COLUMNS:
+        if result.get(column):
+            result[column] = json.loads(result[column])
+    for column in ("has_image", "has_audio", "has_text"):
+        result[column] = bool(result[column])
+    return result
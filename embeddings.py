@@ -0,0 +1,197 @@
+import zlib
+import logging
+import threading
+
+import numpy as np
+
+from config import get_config
+from text_normalization import tokenize
+
+DEFAULT_DIM = 512
+
+
+class HashingEmbedder:
+    """
+    Dependency-free local text embedder
+
+    Words and character trigrams are hashed into a fixed number of buckets
+    and the counts are L2-normalised, so texts that share vocabulary (in any
+    word order, in Hindi or English) get a high cosine similarity. It is not
+    a semantic model, but it is fast, deterministic and needs no download.
+    """
+
+    # Bag of words: blind to negation and word order, and misses paraphrases
+    semantic = False
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        for token in tokenize(text):
+            yield "w:" + token
+            padded = f"#{token}#"
+            for i in range(len(padded) - 2):
+                yield "c:" + padded[i:i + 3]
+
+    def embed(self, texts):
+        """
+        Embed a batch of texts
+
+        Args:
+            texts: List of strings
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dim), rows L2-normalised
+        """
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # Sign bit from the hash reduces the bias of bucket collisions
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEmbedder:
+    """Multilingual sentence-transformers model, used when the package is installed"""
+
+    semantic = True
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts):
+        return np.asarray(
+            self._model.encode(list(texts), normalize_embeddings=True),
+            dtype=np.float32
+        )
+
+
+_default_embedder = None
+_default_lock = threading.Lock()
+
+
+def get_default_embedder():
+    """
+    Shared embedder for search and caching
+
+    Uses the sentence-transformers model named by cache.embedding_model (e.g.
+    "paraphrase-multilingual-MiniLM-L12-v2") when set and installed,
+    otherwise the hashing embedder.
+    """
+    global _default_embedder
+    with _default_lock:
+        if _default_embedder is None:
+            model_name = get_config().cache.embedding_model
+            if model_name:
+                try:
+                    _default_embedder = SentenceTransformerEmbedder(model_name)
+                except Exception as e:
+                    logging.warning(f"Could not load embedding model {model_name}: {str(e)}")
+            if _default_embedder is None:
+                _default_embedder = HashingEmbedder()
+        return _default_embedder
+
+
+class VectorIndex:
+    """
+    In-memory cosine-similarity index over L2-normalised vectors
+
+    Vectors live in one contiguous float32 matrix (grown by doubling), so a
+    query is a single matrix-vector product plus argpartition. Each vector
+    carries a key and a metadata dict that can be used to filter results.
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((64, dim), dtype=np.float32)
+        self._keys = []
+        self._meta = []
+        self._positions = {}
+        # field -> object array of that metadata field, rebuilt after adds
+        self._meta_columns = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, keys, vectors, metas=None):
+        """Add or replace vectors by key"""
+        metas = metas if metas is not None else [{}] * len(keys)
+        with self._lock:
+            for key, vector, meta in zip(keys, vectors, metas):
+                position = self._positions.get(key)
+                if position is None:
+                    position = len(self._keys)
+                    if position >= self._matrix.shape[0]:
+                        grown = np.zeros((self._matrix.shape[0] * 2, self.dim), dtype=np.float32)
+                        grown[:position] = self._matrix[:position]
+                        self._matrix = grown
+                    self._keys.append(key)
+                    self._meta.append(meta)
+                    self._positions[key] = position
+                else:
+                    self._meta[position] = meta
+                self._matrix[position] = vector
+            self._meta_columns = {}
+
+    def remove(self, keys):
+        """Remove vectors by key (the last vector is moved into each freed slot)"""
+        with self._lock:
+            for key in keys:
+                position = self._positions.pop(key, None)
+                if position is None:
+                    continue
+                last = len(self._keys) - 1
+                if position != last:
+                    moved_key = self._keys[last]
+                    self._matrix[position] = self._matrix[last]
+                    self._keys[position] = moved_key
+                    self._meta[position] = self._meta[last]
+                    self._positions[moved_key] = position
+                self._keys.pop()
+                self._meta.pop()
+            self._meta_columns = {}
+
+    def _meta_column(self, name):
+        column = self._meta_columns.get(name)
+        if column is None:
+            column = np.array([m.get(name) for m in self._meta], dtype=object)
+            self._meta_columns[name] = column
+        return column
+
+    def search(self, vector, k=10, min_score=None, **filters):
+        """
+        Find the k most similar vectors
+
+        Args:
+            vector: Query vector (L2-normalised)
+            k: Number of results
+            min_score: Drop results below this cosine similarity
+            **filters: Metadata fields that must match exactly
+
+        Returns:
+            list: (key, score, meta) tuples, best first
+        """
+        with self._lock:
+            n = len(self._keys)
+            if n == 0:
+                return []
+            scores = self._matrix[:n] @ np.asarray(vector, dtype=np.float32)
+            for name, value in filters.items():
+                if value is not None:
+                    scores = np.where(self._meta_column(name) == value, scores, -np.inf)
+            if min_score is not None:
+                scores = np.where(scores >= min_score, scores, -np.inf)
+
+            k = min(k, n)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self._keys[i], float(scores[i]), self._meta[i])
+                for i in top if np.isfinite(scores[i])
+            ]
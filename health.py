@@ -0,0 +1,260 @@
+"""
+Liveness, readiness and saturation endpoints for one app process
+
+Streamlit can't serve extra routes, so a small HTTP server runs on its own
+port (health.port / HEALTH_PORT, default 8502) inside the app process:
+
+    GET /livez    200 while the process and its async runtime respond
+    GET /readyz   200 once warmed up and Groq / TTS are reachable, else 503
+    GET /metrics  JSON saturation gauges (in-flight calls, queue depths, ...)
+
+Start the app through this module so warm-up starts with the process rather
+than with the first session:
+
+    python health.py --server.port 8501
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import importlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+import async_runtime
+from config import get_config
+
+GTTS_PROBE_URL = "https://translate.google.com"
+
+# Imported during warm-up so the first consultation doesn't pay for them
+WARM_IMPORTS = ["numpy", "PIL.Image", "gtts", "brain_of_the_doctor", "voice_of_the_patient", "voice_of_the_doctor"]
+
+
+class CachedProbe:
+    """
+    A backend reachability check whose result is reused for ttl seconds
+
+    status() never blocks: a stale result is returned as-is while a refresh
+    runs on the async runtime, so probes stay cheap however often the load
+    balancer polls.
+    """
+
+    def __init__(self, name, check, ttl=None, timeout=None):
+        self.name = name
+        self.check = check
+        self.ttl = ttl or get_config().health.probe_ttl
+        self.timeout = timeout or get_config().health.probe_timeout
+        self._lock = threading.Lock()
+        self._result = None
+        self._refreshing = None
+
+    def status(self):
+        """
+        Returns:
+            dict: ok (None until the first check finishes), detail or error,
+                latency and age of the last check in seconds
+        """
+        with self._lock:
+            result = self._result
+            stale = result is None or time.monotonic() - result["checked_at"] > self.ttl
+            if stale and self._refreshing is None:
+                self._refreshing = async_runtime.submit(self.refresh())
+        if result is None:
+            return {"ok": None, "error": "not checked yet"}
+        status = {k: v for k, v in result.items() if k != "checked_at"}
+        status["age"] = round(time.monotonic() - result["checked_at"], 1)
+        return status
+
+    async def refresh(self):
+        """Run the check now and cache its outcome"""
+        start = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(self.check(), self.timeout)
+            result = {"ok": True, "detail": detail}
+        except Exception as e:
+            result = {"ok": False, "error": str(e) or type(e).__name__}
+            logging.warning(f"Health probe {self.name} failed: {result['error']}")
+        result["latency"] = round(time.perf_counter() - start, 3)
+        result["checked_at"] = time.monotonic()
+        with self._lock:
+            self._result = result
+            self._refreshing = None
+        return result
+
+
+async def check_groq():
+    """List models on the shared client; also opens (warms) its pooled connection"""
+    models = await async_runtime.get_async_client().models.list()
+    return f"{len(models.data)} models"
+
+
+async def check_tts():
+    """Ready if a local engine is installed, otherwise if gTTS's endpoint answers"""
+    from voice_of_the_doctor import tts_router
+
+    local = [name for name in tts_router.backends if name != "gtts"]
+    if local:
+        return f"local: {', '.join(local)}"
+    async with httpx.AsyncClient(timeout=get_config().health.probe_timeout) as client:
+        response = await client.head(GTTS_PROBE_URL, follow_redirects=True)
+    if response.status_code >= 500:
+        raise RuntimeError(f"gTTS endpoint returned {response.status_code}")
+    return "gtts"
+
+
+class HealthMonitor:
+    """
+    Process health: warm-up state, cached backend probes and saturation gauges
+
+    Other modules register gauges with add_metrics(name, fn); each fn
+    returns a JSON-serializable snapshot and is called on every /metrics
+    request, so it must be cheap.
+    """
+
+    def __init__(self, probes):
+        self.probes = {probe.name: probe for probe in probes}
+        self.started_at = time.time()
+        self.warm = False
+        self.warm_seconds = None
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._server = None
+
+    def add_metrics(self, name, fn):
+        with self._lock:
+            self._metrics[name] = fn
+
+    def start(self, port=None):
+        """Start warm-up and the HTTP server once per process (later calls are no-ops; port 0 disables the server)"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        port = get_config().health.port if port is None else port
+        threading.Thread(target=self.warm_up, name="health-warmup", daemon=True).start()
+        if port:
+            try:
+                self._server = ThreadingHTTPServer(("0.0.0.0", port), _handler(self))
+            except OSError as e:
+                logging.error(f"Could not start health server on port {port}: {str(e)}")
+                return
+            threading.Thread(target=self._server.serve_forever, name="health-server", daemon=True).start()
+            logging.info(f"Health endpoints on :{port} (/livez, /readyz, /metrics)")
+
+    def warm_up(self):
+        """Import heavy modules, load the embedder and run every probe (which opens the connection pool)"""
+        start = time.perf_counter()
+        for module in WARM_IMPORTS:
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                logging.warning(f"Warm-up import of {module} failed: {str(e)}")
+        try:
+            from embeddings import get_default_embedder
+            get_default_embedder().embed(["warm up"])
+        except Exception as e:
+            logging.warning(f"Warm-up of the embedder failed: {str(e)}")
+        for probe in self.probes.values():
+            try:
+                async_runtime.run_sync(probe.refresh())
+            except Exception as e:
+                logging.warning(f"Warm-up probe {probe.name} failed: {str(e)}")
+        self.warm_seconds = round(time.perf_counter() - start, 3)
+        self.warm = True
+        logging.info(f"Warm-up finished in {self.warm_seconds}s")
+
+    def liveness(self):
+        """
+        Returns:
+            tuple: (alive, body); not alive when the async runtime is blocked
+        """
+        body = {"status": "ok", "pid": os.getpid(), "uptime": round(time.time() - self.started_at, 1)}
+        try:
+            async_runtime.run_sync(asyncio.sleep(0), timeout=2)
+        except Exception as e:
+            body["status"] = "fail"
+            body["error"] = f"async runtime unresponsive: {str(e) or type(e).__name__}"
+            return False, body
+        return True, body
+
+    def readiness(self):
+        """
+        Returns:
+            tuple: (ready, body); ready once warmed up and every probe last succeeded
+        """
+        checks = {name: probe.status() for name, probe in self.probes.items()}
+        ready = self.warm and all(check["ok"] for check in checks.values())
+        return ready, {
+            "status": "ready" if ready else "not ready",
+            "warm": self.warm,
+            "warm_seconds": self.warm_seconds,
+            "checks": checks
+        }
+
+    def metrics(self):
+        """Saturation snapshot: background loop tasks plus every registered gauge"""
+        body = {"pid": os.getpid(), "uptime": round(time.time() - self.started_at, 1)}
+        try:
+            body["in_flight"] = async_runtime.stats()["tasks"]
+        except Exception as e:
+            body["in_flight"] = None
+            logging.warning(f"Could not read async runtime stats: {str(e)}")
+        with self._lock:
+            gauges = list(self._metrics.items())
+        for name, fn in gauges:
+            try:
+                body[name] = fn()
+            except Exception as e:
+                body[name] = {"error": str(e)}
+        return body
+
+
+def _handler(monitor):
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path in ("/livez", "/healthz"):
+                ok, body = monitor.liveness()
+            elif path == "/readyz":
+                ok, body = monitor.readiness()
+            elif path == "/metrics":
+                ok, body = True, monitor.metrics()
+            else:
+                ok, body = False, {"error": "not found"}
+                self._send(404, body)
+                return
+            self._send(200 if ok else 503, body)
+
+        def _send(self, code, body):
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # probes hit these every few seconds
+
+    return HealthHandler
+
+
+health_monitor = HealthMonitor([CachedProbe("groq", check_groq), CachedProbe("tts", check_tts)])
+
+
+if __name__ == "__main__":
+    # Warm up with the process, then run the app in it. Start the monitor
+    # of the importable "health" module, the one the app registers gauges on.
+    from streamlit.web import cli as streamlit_cli
+    import health
+
+    health.health_monitor.start()
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+    sys.argv = ["streamlit", "run", app_path] + sys.argv[1:]
+    sys.exit(streamlit_cli.main())
@@ -0,0 +1,195 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MAX_DISTANCE = 6
+DEFAULT_MAX_ENTRIES = 1000
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis as an n x n matrix"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+_DCT_32 = _dct_matrix(32)
+
+def phash(img, hash_size=8):
+    """
+    Perceptual hash (DCT based) of a PIL image
+
+    Robust to re-encoding, resizing and small brightness changes.
+
+    Args:
+        img: PIL image
+        hash_size: Side of the low-frequency block kept (hash has hash_size**2 bits)
+
+    Returns:
+        int: The hash
+    """
+    size = _DCT_32.shape[0]
+    pixels = np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    dct = _DCT_32 @ pixels @ _DCT_32.T
+    low = dct[:hash_size, :hash_size].flatten()
+    # Skip the DC term so overall brightness doesn't dominate the median
+    bits = low > np.median(low[1:])
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+def hamming(a, b):
+    """Number of differing bits between two hashes"""
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance
+
+    Each node carries a set of values (entry ids) so several entries can
+    share one hash; nodes are never removed, only emptied.
+    """
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, key, value):
+        if self._root is None:
+            self._root = [key, {value}, {}]
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].add(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, {value}, {}]
+                self.size += 1
+                return
+            node = child
+
+    def remove(self, key, value):
+        node = self._root
+        while node is not None:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].discard(value)
+                return
+            node = node[2].get(distance)
+
+    def search(self, key, max_distance):
+        """
+        Find every value whose hash is within max_distance of key
+
+        Returns:
+            list: (distance, value) pairs
+        """
+        if self._root is None:
+            return []
+        results = []
+        stack = [self._root]
+        while stack:
+            node_key, values, children = stack.pop()
+            distance = hamming(key, node_key)
+            if distance <= max_distance:
+                results.extend((distance, v) for v in values)
+            # Triangle inequality: only subtrees in this band can match
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return results
+
+
+class PerceptualImageIndex:
+    """
+    Cache of analyses keyed by the perceptual hashes of a case's images
+
+    A lookup hits when the other inputs (context) are identical and every
+    image in the case has a near-duplicate in the cached case, so a
+    re-uploaded, re-encoded or resized photo reuses the earlier analysis.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._tree = BKTree()
+        # entry_id -> (context_key, hashes, value), least recently used first
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._live_hashes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def context_key(*parts):
+        """Digest of the non-image inputs that must match exactly"""
+        return hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def get(self, context_key, hashes):
+        """
+        Return a cached value for near-duplicate images with the same context
+
+        Args:
+            context_key: Result of context_key() for the other inputs
+            hashes: Perceptual hashes of the case's images
+
+        Returns:
+            The cached value, or None
+        """
+        if not hashes:
+            return None
+        with self._lock:
+            candidates = None
+            for h in hashes:
+                ids = {
+                    entry_id for _, entry_id in self._tree.search(h, self.max_distance)
+                    if self._entries[entry_id][0] == context_key
+                }
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    self.misses += 1
+                    return None
+            for entry_id in candidates:
+                if len(self._entries[entry_id][1]) == len(hashes):
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id][2]
+            self.misses += 1
+            return None
+
+    def put(self, context_key, hashes, value):
+        """Cache a value for a case's image hashes and context"""
+        if not hashes:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (context_key, tuple(hashes), value)
+            for h in hashes:
+                self._tree.add(h, entry_id)
+            self._live_hashes += len(hashes)
+
+            while len(self._entries) > self.max_entries:
+                old_id, (_, old_hashes, _) = self._entries.popitem(last=False)
+                for h in old_hashes:
+                    self._tree.remove(h, old_id)
+                self._live_hashes -= len(old_hashes)
+
+            # Emptied nodes are never removed, so rebuild once they dominate
+            if self._tree.size > 2 * self._live_hashes + 64:
+                self._tree = BKTree()
+                for entry_id, (_, entry_hashes, _) in self._entries.items():
+                    for h in entry_hashes:
+                        self._tree.add(h, entry_id)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
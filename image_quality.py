@@ -0,0 +1,122 @@
+"""
+Fast local quality checks for uploaded photos
+
+Runs on the decoded image in a few milliseconds, before any encoding or
+vision call, so photos the model can't read (too small, blurred, too dark,
+washed out or featureless) are caught while the patient can still retake
+them, instead of after a full round trip.
+"""
+import os
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config import get_config
+
+# Side the grayscale copy is reduced to before measuring, so thresholds
+# don't depend on the camera resolution
+ANALYSIS_SIDE = 512
+
+DEFAULT_MIN_SIDE = 160
+DEFAULT_BLUR_THRESHOLD = 40.0
+DEFAULT_DARK_THRESHOLD = 40.0
+DEFAULT_BRIGHT_THRESHOLD = 225.0
+DEFAULT_MIN_CONTRAST = 12.0
+
+# Fraction of pixels near black / white beyond which exposure fails too
+CLIPPED_FRACTION = 0.6
+
+ISSUES = ("unreadable", "too_small", "blurry", "too_dark", "too_bright", "low_contrast")
+
+
+def laplacian_variance(gray):
+    """
+    Variance of the 4-neighbour Laplacian of a grayscale array
+
+    Low values mean few sharp edges: out of focus or motion blur.
+    """
+    center = gray[1:-1, 1:-1]
+    laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4.0 * center
+    return float(laplacian.var())
+
+
+def assess_image(img, min_side=DEFAULT_MIN_SIDE, blur_threshold=DEFAULT_BLUR_THRESHOLD,
+                 dark_threshold=DEFAULT_DARK_THRESHOLD, bright_threshold=DEFAULT_BRIGHT_THRESHOLD,
+                 min_contrast=DEFAULT_MIN_CONTRAST, size=None):
+    """
+    Check whether a photo is usable for visual analysis
+
+    Args:
+        img: PIL image (orientation already applied)
+        min_side: Smallest acceptable shorter side in pixels
+        blur_threshold: Minimum Laplacian variance (sharpness)
+        dark_threshold / bright_threshold: Acceptable mean brightness range (0-255)
+        min_contrast: Minimum standard deviation of brightness
+        size: The original (width, height) if img was decoded at reduced size
+
+    Returns:
+        dict: ok, issues (codes from ISSUES) and the measured metrics
+    """
+    width, height = size or img.size
+    gray_img = img.convert("L")
+    gray_img.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    gray = np.asarray(gray_img, dtype=np.float32)
+
+    brightness = float(gray.mean())
+    contrast = float(gray.std())
+    dark_fraction = float((gray < 16).mean())
+    bright_fraction = float((gray > 239).mean())
+    sharpness = laplacian_variance(gray) if min(gray.shape) >= 3 else 0.0
+
+    issues = []
+    if min(width, height) < min_side:
+        issues.append("too_small")
+    if brightness < dark_threshold or dark_fraction > CLIPPED_FRACTION:
+        issues.append("too_dark")
+    elif brightness > bright_threshold or bright_fraction > CLIPPED_FRACTION:
+        issues.append("too_bright")
+    if contrast < min_contrast:
+        issues.append("low_contrast")
+    # A flat or badly exposed frame has no edges either; report the cause, not blur
+    elif sharpness < blur_threshold and not issues:
+        issues.append("blurry")
+
+    return {
+        "ok": not issues,
+        "issues": issues,
+        "metrics": {
+            "width": width,
+            "height": height,
+            "sharpness": round(sharpness, 1),
+            "brightness": round(brightness, 1),
+            "contrast": round(contrast, 1),
+        },
+    }
+
+
+def assess_file(image_path, **thresholds):
+    """
+    assess_image() for a file; unreadable files fail with the issue "unreadable"
+
+    Thresholds default to the images section of the config.
+    """
+    if not thresholds:
+        images = get_config().images
+        thresholds = {
+            "min_side": images.min_side,
+            "blur_threshold": images.blur_threshold,
+            "dark_threshold": images.dark_threshold,
+            "bright_threshold": images.bright_threshold,
+            "min_contrast": images.min_contrast,
+        }
+    if image_path is None or not os.path.exists(image_path):
+        return {"ok": False, "issues": ["unreadable"], "metrics": {}}
+    try:
+        with Image.open(image_path) as img:
+            size = img.size
+            img.draft("L", (ANALYSIS_SIDE, ANALYSIS_SIDE))  # JPEG: decode at reduced size
+            img = ImageOps.exif_transpose(img)
+            result = assess_image(img, size=size, **thresholds)
+    except Exception:
+        return {"ok": False, "issues": ["unreadable"], "metrics": {}}
+    return result
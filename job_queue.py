@@ -0,0 +1,466 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+from concurrent.futures import Future, InvalidStateError
+
+DEFAULT_VISIBILITY_TIMEOUT = 120
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 0.2
+RETRY_BACKOFF_BASE = 2.0
+
+# Max jobs running at once per queue, across every worker process
+DEFAULT_QUEUE_LIMITS = {"stt": 4, "llm": 8, "tts": 4}
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+LEASE_EXPIRED_ERROR = "Lease expired: the worker stopped before finishing the job"
+
+
+class JobFailed(Exception):
+    """Raised by JobClient.run when a job exhausted its attempts"""
+
+
+class Job:
+    """A unit of work as seen by workers and clients"""
+
+    def __init__(self, id, queue, task, payload, status, attempts, max_attempts, result=None, error=None):
+        self.id = id
+        self.queue = queue
+        self.task = task
+        self.payload = payload
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.result = result
+        self.error = error
+
+
+class Broker:
+    """
+    Storage for jobs; subclass to plug in another backend (Redis, SQS, ...)
+
+    reserve() must be atomic across processes: a job is handed to one worker
+    at a time and becomes visible again if the worker does not finish it
+    within the visibility timeout.
+    """
+
+    def enqueue(self, queue, task, payload, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        raise NotImplementedError
+
+    def reserve(self, queues, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        raise NotImplementedError
+
+    def complete(self, job_id, worker_id, result):
+        """Store a result; ignored (returns False) unless worker_id still holds the job's lease"""
+        raise NotImplementedError
+
+    def fail(self, job_id, worker_id, error):
+        """Retry or fail a job; ignored (returns False) unless worker_id still holds the job's lease"""
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def depth(self):
+        """Queued and running job counts per queue"""
+        raise NotImplementedError
+
+
+class SQLiteBroker(Broker):
+    """
+    Local broker backed by a SQLite (WAL) file shared by UI and worker processes
+
+    Reservation runs in an IMMEDIATE transaction, which takes SQLite's write
+    lock, so the per-queue concurrency check and the claim are atomic.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        queue TEXT NOT NULL,
+        task TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        available_at REAL NOT NULL,
+        lease_expires_at REAL,
+        worker_id TEXT,
+        result TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (queue, status, available_at);
+    """
+
+    def __init__(self, db_path="data/jobs.db", queue_limits=None):
+        self.db_path = db_path
+        self.queue_limits = dict(DEFAULT_QUEUE_LIMITS if queue_limits is None else queue_limits)
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        # One connection per thread; isolation_level=None so we control transactions
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, queue, task, payload, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, queue, task, payload, status, max_attempts, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, queue, task, json.dumps(payload, ensure_ascii=False), STATUS_QUEUED, max_attempts, now, now, now)
+        )
+        return job_id
+
+    def reserve(self, queues, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Leases that expired on the last attempt (the job keeps killing its worker) end the job
+            conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? "
+                f"WHERE queue IN ({', '.join('?' for _ in queues)}) AND status = ? AND lease_expires_at <= ? "
+                f"AND attempts >= max_attempts",
+                (STATUS_FAILED, LEASE_EXPIRED_ERROR, now, *queues, STATUS_RUNNING, now)
+            )
+            for queue in queues:
+                limit = self.queue_limits.get(queue)
+                if limit is not None:
+                    running = conn.execute(
+                        "SELECT COUNT(*) FROM jobs WHERE queue = ? AND status = ? AND lease_expires_at > ?",
+                        (queue, STATUS_RUNNING, now)
+                    ).fetchone()[0]
+                    if running >= limit:
+                        continue
+                # Queued jobs that are due, or running jobs whose lease expired (worker died)
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE queue = ? AND ("
+                    "(status = ? AND available_at <= ?) "
+                    "OR (status = ? AND lease_expires_at <= ? AND attempts < max_attempts)"
+                    ") ORDER BY available_at LIMIT 1",
+                    (queue, STATUS_QUEUED, now, STATUS_RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_expires_at = ?, "
+                    "worker_id = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_RUNNING, now + visibility_timeout, worker_id, now, row["id"])
+                )
+                conn.execute("COMMIT")
+                job = _row_to_job(row)
+                job.attempts += 1
+                job.status = STATUS_RUNNING
+                return job
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def complete(self, job_id, worker_id, result):
+        # A worker whose lease expired must not overwrite the job another worker now holds
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, lease_expires_at = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND worker_id = ?",
+            (STATUS_DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id, STATUS_RUNNING, worker_id)
+        )
+        return cursor.rowcount > 0
+
+    def fail(self, job_id, worker_id, error):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND worker_id = ?",
+                (job_id, STATUS_RUNNING, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+            if row["attempts"] < row["max_attempts"]:
+                # Retry with exponential backoff
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, available_at = ?, lease_expires_at = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (STATUS_QUEUED, error, now + RETRY_BACKOFF_BASE ** row["attempts"], now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                    (STATUS_FAILED, error, now, job_id)
+                )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, job_id):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row is not None else None
+
+    def depth(self):
+        depth = {}
+        for row in self._conn().execute(
+            "SELECT queue, status, COUNT(*) AS n FROM jobs WHERE status IN (?, ?) GROUP BY queue, status",
+            (STATUS_QUEUED, STATUS_RUNNING)
+        ):
+            depth.setdefault(row["queue"], {})[row["status"]] = row["n"]
+        return depth
+
+    def purge(self, older_than):
+        """Delete finished jobs last updated more than older_than seconds ago"""
+        self._conn().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (STATUS_DONE, STATUS_FAILED, time.time() - older_than)
+        )
+
+
+def _row_to_job(row):
+    return Job(
+        id=row["id"],
+        queue=row["queue"],
+        task=row["task"],
+        payload=json.loads(row["payload"]),
+        status=row["status"],
+        attempts=row["attempts"],
+        max_attempts=row["max_attempts"],
+        result=json.loads(row["result"]) if row["result"] is not None else None,
+        error=row["error"]
+    )
+
+
+# Task registry: name -> function(**payload) returning a JSON-serialisable result
+
+TASKS = {}
+
+
+def task(name):
+    """Register a function as a job task"""
+    def register(fn):
+        TASKS[name] = fn
+        return fn
+    return register
+
+
+@task("transcribe")
+def transcribe_task(audio_filepath, stt_model, language, usage=None):
+    from voice_of_the_patient import transcribe_result, GROQ_API_KEY
+    # A failed stage fails the job instead of returning its error text as the result
+    return transcribe_result(GROQ_API_KEY, audio_filepath, stt_model, language, usage).unwrap()
+
+
+@task("analyze")
+def analyze_task(query, image_paths, model, usage=None, max_tokens=None, fallback_models=None, stop=None,
+                 structured=False):
+    from brain_of_the_doctor import prepare_images, analyze_images_result
+    encoded_images, image_hashes = prepare_images(image_paths)
+    return analyze_images_result(
+        query, encoded_images, model, image_hashes=image_hashes, usage=usage, max_tokens=max_tokens,
+        fallback_models=fallback_models, stop=stop, structured=structured
+    ).unwrap()
+
+
+@task("tts")
+def tts_task(input_text, output_filepath, language, codec=None):
+    from voice_of_the_doctor import text_to_speech_result
+    return text_to_speech_result(input_text, output_filepath, language, codec).unwrap()
+
+
+class Worker:
+    """Pulls jobs from the given queues and runs the registered tasks"""
+
+    def __init__(self, broker, queues, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.broker = broker
+        self.queues = list(queues)
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """Run at most one job; returns True if a job was processed"""
+        job = self.broker.reserve(self.queues, self.worker_id, self.visibility_timeout)
+        if job is None:
+            return False
+        fn = TASKS.get(job.task)
+        try:
+            if fn is None:
+                raise RuntimeError(f"Unknown task {job.task}")
+            result = fn(**job.payload)
+        except Exception as e:
+            logging.warning(f"Job {job.id} ({job.task}) attempt {job.attempts} failed: {str(e)}")
+            if not self.broker.fail(job.id, self.worker_id, str(e)):
+                logging.warning(f"Job {job.id} lease was lost; failure not recorded")
+        else:
+            if not self.broker.complete(job.id, self.worker_id, result):
+                logging.warning(f"Job {job.id} lease was lost; result discarded")
+        return True
+
+    def run(self):
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+
+class JobClient:
+    """
+    Used by the UI process to submit jobs and collect their results
+
+    submit_async() hands back a Future; one background thread per client
+    polls the broker for every pending job, so script runs wait on a
+    Future instead of each sleeping in their own polling loop.
+    """
+
+    def __init__(self, broker, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.broker = broker
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wake = threading.Event()
+        self._poller = None
+
+    def submit(self, queue, task_name, payload, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        return self.broker.enqueue(queue, task_name, payload, max_attempts)
+
+    def submit_async(self, queue, task_name, payload, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """
+        Submit a job and return a Future for its result
+
+        The Future raises JobFailed if the job exhausted its attempts;
+        cancel it to stop tracking a job nobody waits for any more.
+        """
+        return self.watch(self.submit(queue, task_name, payload, max_attempts))
+
+    def watch(self, job_id):
+        """A Future resolved by the poller thread when the job finishes"""
+        future = Future()
+        with self._lock:
+            self._pending[job_id] = future
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll_loop, name="job-client-poller", daemon=True)
+                self._poller.start()
+        self._wake.set()
+        return future
+
+    def status(self, job_id):
+        job = self.broker.get(job_id)
+        return job.status if job is not None else None
+
+    def wait(self, job_id, timeout=None):
+        """
+        Wait until a job finishes
+
+        Returns:
+            The job's result
+
+        Raises:
+            JobFailed: The job failed on every attempt
+            TimeoutError: It did not finish within timeout seconds
+        """
+        future = self.watch(job_id)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Job {job_id} did not finish within {timeout}s")
+
+    def run(self, queue, task_name, payload, timeout=None):
+        """Submit a job and wait for its result"""
+        return self.wait(self.submit(queue, task_name, payload), timeout)
+
+    def _poll_loop(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                pending = list(self._pending.items())
+                if not pending:
+                    self._wake.clear()
+                    continue
+            for job_id, future in pending:
+                if future.cancelled():
+                    self._forget(job_id)
+                    continue
+                try:
+                    job = self.broker.get(job_id)
+                except Exception as e:
+                    logging.warning(f"Could not poll job {job_id}: {str(e)}")
+                    continue
+                if job is None:
+                    self._resolve(job_id, future, error=JobFailed(f"Job {job_id} no longer exists"))
+                elif job.status == STATUS_DONE:
+                    self._resolve(job_id, future, result=job.result)
+                elif job.status == STATUS_FAILED:
+                    self._resolve(job_id, future, error=JobFailed(job.error))
+            time.sleep(self.poll_interval)
+
+    def _forget(self, job_id):
+        with self._lock:
+            self._pending.pop(job_id, None)
+
+    def _resolve(self, job_id, future, result=None, error=None):
+        self._forget(job_id)
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass  # Cancelled by a caller that stopped waiting
+
+
+def _worker_process(db_path, queues):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    Worker(SQLiteBroker(db_path), queues).run()
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    from config import get_config
+
+    parser = argparse.ArgumentParser(description="Run consultation job workers")
+    parser.add_argument("--db", default=get_config().paths.jobs_db)
+    parser.add_argument("--queues", default="stt,llm,tts", help="Comma-separated queues to serve")
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+
+    queues = [q.strip() for q in args.queues.split(",") if q.strip()]
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(args.db, queues), daemon=True)
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
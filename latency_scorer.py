@@ -0,0 +1,89 @@
+import time
+import threading
+
+# Latency/error smoothing, the latency assumed for candidates not yet
+# measured, the seconds a 100% error rate adds to a candidate's score and
+# the slowdown each later preference is charged. Error rates decay with
+# this half-life so a candidate that stopped getting traffic after failing
+# is eventually retried.
+LATENCY_EWMA_ALPHA = 0.3
+ERROR_EWMA_ALPHA = 0.2
+ERROR_HALF_LIFE_SECONDS = 300.0
+DEFAULT_LATENCY_PRIOR = 2.0
+FAILURE_PENALTY_SECONDS = 30.0
+RANK_WEIGHT = 0.25
+
+
+class LatencyScorer:
+    """
+    Live latency and error-rate scores shared by the chat model and TTS routers
+
+    Each key (a model name, a (backend, language) pair) keeps an EWMA of
+    its latency and of its error rate. A candidate's score is its latency
+    (latency_prior until measured) scaled up by RANK_WEIGHT per later
+    preference, plus FAILURE_PENALTY_SECONDS times its error rate; lowest
+    wins. With explore_unmeasured, candidates never called instead go
+    first, in preference order, so each gets measured once.
+    """
+
+    def __init__(self, latency_prior=DEFAULT_LATENCY_PRIOR, explore_unmeasured=False):
+        self.latency_prior = latency_prior
+        self.explore_unmeasured = explore_unmeasured
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._errors = {}
+        self._requests = {}
+
+    def rank(self, candidates, key=None):
+        """
+        Order candidates (given in preference order) best first
+
+        Args:
+            candidates: The adequate candidates, most preferred first
+            key: Callable mapping a candidate to its stats key (default: the candidate)
+
+        Returns:
+            list: The candidates, reordered
+        """
+        key = key or (lambda candidate: candidate)
+        with self._lock:
+            def score(item):
+                rank, candidate = item
+                name = key(candidate)
+                if self.explore_unmeasured and name not in self._requests:
+                    return (0, rank)
+                latency = self._latency.get(name, self.latency_prior)
+                return (1, latency * (1 + RANK_WEIGHT * rank) + FAILURE_PENALTY_SECONDS * self._error_rate(name))
+            return [c for _, c in sorted(enumerate(candidates), key=score)]
+
+    def observe(self, key, seconds, ok=True):
+        """Record one call's outcome (failed calls only update the error rate)"""
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+            outcome = 0.0 if ok else 1.0
+            error = self._error_rate(key) if key in self._errors else outcome
+            self._errors[key] = (ERROR_EWMA_ALPHA * outcome + (1 - ERROR_EWMA_ALPHA) * error, time.monotonic())
+            if ok:
+                previous = self._latency.get(key)
+                self._latency[key] = (
+                    seconds if previous is None
+                    else LATENCY_EWMA_ALPHA * seconds + (1 - LATENCY_EWMA_ALPHA) * previous
+                )
+
+    def stats(self):
+        """Latency EWMA, error-rate EWMA and request count per key"""
+        with self._lock:
+            return {
+                key: {
+                    "latency": self._latency.get(key),
+                    "error_rate": self._error_rate(key),
+                    "requests": count
+                }
+                for key, count in self._requests.items()
+            }
+
+    def _error_rate(self, key):
+        if key not in self._errors:
+            return 0.0
+        rate, updated = self._errors[key]
+        return rate * 0.5 ** ((time.monotonic() - updated) / ERROR_HALF_LIFE_SECONDS)
@@ -0,0 +1,396 @@
+"""
+Load generator for streamlit_app.py
+
+Drives the real app headlessly through Streamlit's AppTest with N concurrent
+simulated users in one process (like one Streamlit server process), against
+mock Groq / TTS backends with log-normal latency. Each user repeatedly runs a
+full consultation with a random mix of image, voice and text inputs,
+specialty and language.
+
+    python load_test.py --users 1,2,4,8,16 --consultations 3 --latency-scale 0.2
+
+With --record DIR the same simulated traffic goes to the real Groq and TTS
+backends and is captured in a cassette (see cassette.py); --replay DIR then
+serves it back offline, with recorded latencies scaled by --latency-scale.
+Replays match when the other arguments (users, consultations, seed) do.
+
+Prints a saturation table (throughput and p50/p95/p99 latency per
+concurrency level) plus process CPU and RSS, and can write it as JSON.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import random
+import logging
+import resource
+import asyncio
+import argparse
+import tempfile
+import threading
+from types import SimpleNamespace
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app.py")
+SAMPLE_IMAGES = sorted(glob.glob(os.path.join(os.path.dirname(APP_PATH), "temp_docs", "*.jp*g")))
+SAMPLE_AUDIO = os.path.join(os.path.dirname(APP_PATH), "temp_docs", "patient_audio.wav")
+
+# (median seconds, log-normal sigma) per mocked backend call
+LATENCY_PROFILE = {
+    "stt": (0.8, 0.35),
+    "llm_text": (1.2, 0.4),
+    "llm_vision": (2.0, 0.4),
+    "tts": (0.6, 0.3),
+}
+
+SYMPTOMS = {
+    "english": [
+        "headache for {n} days with mild fever",
+        "itchy red rash on my arm since {n} days",
+        "dry cough and sore throat for {n} days",
+        "stomach pain after meals for {n} weeks",
+    ],
+    "hindi": [
+        "मुझे {n} दिनों से सिरदर्द और हल्का बुखार है",
+        "मेरे हाथ पर {n} दिनों से खुजली वाले लाल दाने हैं",
+        "{n} दिनों से सूखी खांसी और गले में खराश है",
+    ],
+}
+
+
+class MockBackends:
+    """Patches the async Groq client and TTS router with latency-simulating fakes"""
+
+    def __init__(self, latency_scale=1.0, error_rate=0.0, seed=None):
+        self.latency_scale = latency_scale
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {name: 0 for name in LATENCY_PROFILE}
+
+    async def _call(self, kind):
+        median, sigma = LATENCY_PROFILE[kind]
+        with self._lock:
+            self.calls[kind] += 1
+            delay = self._random.lognormvariate(0, sigma) * median * self.latency_scale
+            fail = self._random.random() < self.error_rate
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError(f"Simulated {kind} failure")
+
+    def install(self):
+        import async_runtime
+        import voice_of_the_doctor
+
+        backends = self
+
+        class FakeAsyncGroq:
+            def __init__(self, api_key=None, **kwargs):
+                self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+                self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self._transcribe))
+
+            async def _chat(self, messages, model, **kwargs):
+                has_image = isinstance(messages[0]["content"], list)
+                await backends._call("llm_vision" if has_image else "llm_text")
+                text = "Based on your symptoms I think you may have a mild viral infection. Rest well."
+                if '"spoken_summary"' in str(messages[0]["content"]):  # structured output requested
+                    text = json.dumps({
+                        "spoken_summary": text,
+                        "conditions": ["Mild viral infection"],
+                        "remedies": ["Rest", "Drink plenty of fluids"],
+                        "red_flags": ["Fever lasting more than three days"],
+                    })
+                if kwargs.get("stream"):
+                    return self._stream(text)
+                return SimpleNamespace(
+                    choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+                    usage=SimpleNamespace(prompt_tokens=400, completion_tokens=60, total_tokens=460)
+                )
+
+            async def _stream(self, text):
+                for i in range(0, len(text), 8):
+                    yield SimpleNamespace(choices=[SimpleNamespace(
+                        delta=SimpleNamespace(content=text[i:i + 8]), finish_reason=None
+                    )])
+                    await asyncio.sleep(0)
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")],
+                    x_groq=SimpleNamespace(usage=SimpleNamespace(prompt_tokens=400, completion_tokens=60, total_tokens=460))
+                )
+
+            async def _transcribe(self, model, file, language=None, **kwargs):
+                await backends._call("stt")
+                return SimpleNamespace(text="I have had a headache and mild fever for three days")
+
+        async def fake_tts(input_text, language):
+            await backends._call("tts")
+            return b"ID3" + b"\0" * 2048, "mp3"
+
+        async_runtime.AsyncGroq = FakeAsyncGroq
+        voice_of_the_doctor.tts_router.synthesize_async = fake_tts
+
+
+class ProcessSampler:
+    """Samples this process's CPU time and resident memory"""
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss_bytes():
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        # Not Linux: fall back to peak RSS (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    @staticmethod
+    def cpu_seconds():
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_rss = self.rss_bytes()
+        self._cpu_start = self.cpu_seconds()
+        self._wall_start = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.cpu = self.cpu_seconds() - self._cpu_start
+        self.wall = time.perf_counter() - self._wall_start
+
+
+def allow_concurrent_apptests():
+    """
+    Let AppTest instances run in parallel threads
+
+    Each AppTest run installs a mock Runtime singleton and clears it when it
+    finishes, which pulls it out from under runs still going in other
+    threads. Keep serving the most recent mock runtime instead. Each run
+    also recompiles the script, and concurrent compile() calls can trip
+    CPython's AST recursion check, so compilation is serialized.
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def locked_get_bytecode(self, script_path):
+        with compile_lock:
+            return get_bytecode(self, script_path)
+
+    ScriptCache.get_bytecode = locked_get_bytecode
+
+    latest = {}
+
+    def instance(cls):
+        if cls._instance is not None:
+            latest["runtime"] = cls._instance
+        runtime = cls._instance or latest.get("runtime")
+        if runtime is None:
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or "runtime" in latest)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def simulate_user(user_id, consultations, media, rng, timeout, record):
+    """One simulated user running consultations back to back"""
+    from streamlit.testing.v1 import AppTest
+
+    for n in range(consultations):
+        language = rng.choice(["english", "hindi"])
+        doctor = rng.choice(["allopathy", "homeopathy", "ayurveda"])
+        use_image = rng.random() < 0.5
+        use_voice = rng.random() < 0.4
+        use_text = rng.random() < 0.7 or not (use_image or use_voice)
+
+        consultation_latency, tts_latency, ok = None, None, False
+        session_id = None
+        try:
+            at = AppTest.from_file(APP_PATH, default_timeout=timeout).run()
+            session_id = at.session_state["session_id"]
+            at.session_state["selected_language"] = language
+            at.session_state["selected_doctor"] = doctor
+
+            # File uploads and the audio recorder component can't be driven by
+            # AppTest, so seed their results the same way the widgets would
+            if use_image and SAMPLE_IMAGES:
+                with open(rng.choice(SAMPLE_IMAGES), "rb") as f:
+                    media.put(session_id, "image_0", f.read(), suffix=".jpg")
+                at.session_state["image_keys"] = ["image_0"]
+                at.session_state["image_saved"] = True
+            if use_voice and os.path.exists(SAMPLE_AUDIO):
+                # Real recordings never repeat; a unique tail keeps content-keyed caches honest
+                with open(SAMPLE_AUDIO, "rb") as f:
+                    media.put(session_id, "audio", f.read() + f"user {user_id}.{n}".encode(), suffix=".wav")
+                at.session_state["audio_saved"] = True
+            at.run()
+            if use_text:
+                text = rng.choice(SYMPTOMS[language]).format(n=rng.randint(2, 9))
+                at.text_area(key="text_symptoms_input").input(f"{text} (user {user_id}.{n})").run()
+
+            button = next(b for b in at.button if b.label.startswith("🔍"))
+            start = time.perf_counter()
+            button.click().run()
+            consultation_latency = time.perf_counter() - start
+            # A failed analysis still finishes the run (partial results), but is not a success
+            ok = not at.exception and at.session_state["analysis_done"] and at.session_state["results"]["response"] is not None
+
+            # Ask for the voice response and wait for it like a listening user
+            play = [b for b in at.button if b.key == "play_voice"]
+            if ok and play:
+                start = time.perf_counter()
+                play[0].click().run()
+                deadline = time.monotonic() + timeout
+                while not at.get("audio") and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    at.run()
+                if at.get("audio"):
+                    tts_latency = time.perf_counter() - start
+        except Exception as e:
+            logging.warning(f"Simulated user {user_id} failed: {str(e)}")
+
+        record({
+            "user": user_id,
+            "ok": bool(ok),
+            "inputs": "".join(k for k, used in (("I", use_image), ("V", use_voice), ("T", use_text)) if used),
+            "language": language,
+            "doctor": doctor,
+            "consultation": consultation_latency,
+            "tts": tts_latency,
+        })
+        if session_id:
+            media.clear_session(session_id)
+
+
+def run_level(users, consultations, media, seed, timeout):
+    samples = []
+    lock = threading.Lock()
+
+    def record(sample):
+        with lock:
+            samples.append(sample)
+
+    threads = [
+        threading.Thread(
+            target=simulate_user,
+            args=(u, consultations, media, random.Random(seed * 1000 + u), timeout, record)
+        )
+        for u in range(users)
+    ]
+    with ProcessSampler() as sampler:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    latencies = [s["consultation"] for s in samples if s["ok"]]
+    tts = [s["tts"] for s in samples if s["tts"] is not None]
+    return {
+        "users": users,
+        "consultations": len(samples),
+        "errors": sum(1 for s in samples if not s["ok"]),
+        "throughput_per_s": len(samples) / sampler.wall if sampler.wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "tts_p99": percentile(tts, 99),
+        "cpu_percent": 100.0 * sampler.cpu / sampler.wall if sampler.wall else 0.0,
+        "peak_rss_mb": sampler.peak_rss / (1024 * 1024),
+        "wall_s": sampler.wall,
+    }
+
+
+def _fmt(value, spec=".2f"):
+    return "-" if value is None else format(value, spec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test streamlit_app.py with simulated concurrent sessions")
+    parser.add_argument("--users", default="1,2,4,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--consultations", type=int, default=3, help="Consultations per user per level")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply mock backend latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock backend calls that fail")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per app run timeout (seconds)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Write the results to this file")
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--record", metavar="DIR", help="Use the real backends and record their traffic to a cassette")
+    backend.add_argument("--replay", metavar="DIR", help="Serve backend calls from a recorded cassette")
+    args = parser.parse_args()
+
+    # Keep load-test state out of the real data directories
+    workdir = tempfile.mkdtemp(prefix="symptom-scanner-load-")
+    os.environ.setdefault("CONSULTATION_DB_PATH", os.path.join(workdir, "consultations.db"))
+    os.environ.setdefault("OUTPUT_AUDIO_PATH", os.path.join(workdir, "doctor_response.mp3"))
+    os.environ.setdefault("MEDIA_DIR", os.path.join(workdir, "media"))
+    os.environ.setdefault("USAGE_DB_PATH", os.path.join(workdir, "usage.db"))
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+
+    from cassette import Cassette
+
+    backends, cassette = None, None
+    if args.record:
+        cassette = Cassette(args.record).record()
+    elif args.replay:
+        cassette = Cassette(args.replay, timing=args.latency_scale).replay()
+    else:
+        backends = MockBackends(args.latency_scale, args.error_rate, args.seed)
+        backends.install()
+    allow_concurrent_apptests()
+
+    # Share one media store between the app and the harness so inputs can be seeded
+    import session_media
+    media = session_media.SessionMediaManager(spill_dir=os.environ["MEDIA_DIR"])
+    session_media.SessionMediaManager = lambda **kwargs: media
+
+    results = []
+    header = f"{'users':>5} {'n':>4} {'err':>4} {'thru/s':>7} {'p50':>6} {'p95':>6} {'p99':>6} {'tts99':>6} {'cpu%':>6} {'rssMB':>7}"
+    print(header)
+    print("-" * len(header))
+    for users in [int(u) for u in args.users.split(",") if u.strip()]:
+        level = run_level(users, args.consultations, media, args.seed, args.timeout)
+        results.append(level)
+        print(
+            f"{level['users']:>5} {level['consultations']:>4} {level['errors']:>4} "
+            f"{level['throughput_per_s']:>7.2f} {_fmt(level['p50']):>6} {_fmt(level['p95']):>6} "
+            f"{_fmt(level['p99']):>6} {_fmt(level['tts_p99']):>6} {level['cpu_percent']:>6.1f} "
+            f"{level['peak_rss_mb']:>7.1f}"
+        )
+
+    backend_calls = backends.calls if backends else cassette.stats
+    print(f"\n{'Mock backend' if backends else 'Cassette'} calls: {backend_calls}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "levels": results, "backend_calls": backend_calls}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import json
+import logging
+
+from config import get_config, on_reload
+from latency_scorer import LatencyScorer
+
+
+def default_routes(models=None):
+    """
+    Built-in rules over the configured models (models config section)
+
+    First matching rule wins; its models are the adequate ones, in preference order.
+    """
+    models = models or get_config().models
+    return [
+        {
+            "when": {"has_image": True},
+            "models": [models.vision]
+        },
+        {
+            "when": {"has_image": False, "language": "english", "max_chars": 400},
+            "models": [models.text_small, models.vision, models.text_large]
+        },
+        {
+            "when": {"has_image": False},
+            "models": [models.vision, models.text_large]
+        },
+    ]
+
+
+def _matches(when, has_image, input_chars, language, specialty):
+    if "has_image" in when and when["has_image"] != has_image:
+        return False
+    if "min_chars" in when and input_chars < when["min_chars"]:
+        return False
+    if "max_chars" in when and input_chars > when["max_chars"]:
+        return False
+    for field, value in (("language", language), ("specialty", specialty)):
+        if field in when:
+            allowed = when[field] if isinstance(when[field], list) else [when[field]]
+            if value not in allowed:
+                return False
+    return True
+
+
+class ModelRouter:
+    """
+    Picks the fastest adequate chat model per request
+
+    Rules (see default_routes) match on has_image, input length
+    (min_chars / max_chars), language and specialty and name the models
+    adequate for that kind of request, in preference order. Within a rule
+    the order is re-ranked by live stats (see latency_scorer.LatencyScorer:
+    latency EWMA, a prior until measured, scaled up slightly for later
+    preferences, plus a penalty proportional to the error rate). The
+    remaining models are the fallbacks.
+    """
+
+    def __init__(self, routes=None):
+        self.routes = routes or default_routes()
+        self.scorer = LatencyScorer()
+
+    def choose(self, has_image=False, input_chars=0, language=None, specialty=None):
+        """
+        Returns:
+            list: Model names to try in order (first is the pick, the rest are fallbacks)
+        """
+        for route in self.routes:
+            if _matches(route.get("when", {}), has_image, input_chars, language, specialty):
+                return self.rank(route["models"])
+        return [get_config().models.vision]
+
+    def rank(self, models):
+        return self.scorer.rank(models)
+
+    def observe(self, model, seconds, ok=True):
+        """Record one call's outcome (failed calls only update the error rate)"""
+        self.scorer.observe(model, seconds, ok)
+
+    def stats(self):
+        """Latency EWMA, error-rate EWMA and request count per model"""
+        return self.scorer.stats()
+
+
+def load_routes(path=None, models=None):
+    """Routing rules from a JSON file (models.routes_path / MODEL_ROUTES_PATH), or the defaults"""
+    models = models or get_config().models
+    path = path or models.routes_path
+    if not path:
+        return default_routes(models)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            routes = json.load(f)
+        if not isinstance(routes, list) or not all(r.get("models") for r in routes):
+            raise ValueError("expected a list of rules, each with a non-empty 'models' list")
+        return routes
+    except Exception as e:
+        logging.error(f"Could not load model routes from {path}, using defaults: {str(e)}")
+        return default_routes(models)
+
+
+model_router = ModelRouter(load_routes())
+on_reload(lambda new, old: setattr(model_router, "routes", load_routes(models=new.models)))
@@ -0,0 +1,170 @@
+"""
+Typed stage outcomes and the consultation degradation policy
+
+The helper modules used to report failures in-band: an "Error ..." string
+where the transcription or answer would be, None instead of an audio
+path. Passed along unchecked, that text became the patient's symptoms in
+the prompt and then the doctor's spoken answer. Each helper now also
+offers a StageResult (transcribe_result, analyze_images_result,
+text_to_speech_result), and Pipeline runs the consultation stages under
+one policy:
+
+- fail fast per stage: an exception or error result ends the stage as a
+  failure (model fallbacks happen inside the stage) and never travels on
+  as data;
+- skip downstream: a stage whose required stages failed is not run, so
+  no model calls are spent on bad inputs;
+- partial results: every outcome is kept, so the app shows what did
+  succeed, e.g. the answer without its voice, or a text-only answer when
+  the recording could not be transcribed.
+
+The "Error ..." string APIs remain for existing callers; is_error()
+recognizes their failures.
+"""
+import time
+import logging
+
+ERROR_PREFIX = "Error"
+
+
+def is_error(value):
+    """Whether a helper's plain return value reports a failure (an "Error ..." string or None)"""
+    return value is None or (isinstance(value, str) and value.startswith(ERROR_PREFIX))
+
+
+class StageError(RuntimeError):
+    """A stage's failure, raised by StageResult.unwrap()"""
+
+    def __init__(self, stage, message):
+        super().__init__(message)
+        self.stage = stage
+
+
+class StageResult:
+    """
+    Outcome of one pipeline stage
+
+    status is "ok" (value holds the output), "failed" (error holds the
+    message) or "skipped" (the stage was not run; error names the upstream
+    failure).
+    """
+
+    OK = "ok"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+    def __init__(self, stage, status, value=None, error=None, elapsed=0.0):
+        self.stage = stage
+        self.status = status
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @classmethod
+    def success(cls, stage, value, elapsed=0.0):
+        return cls(stage, cls.OK, value=value, elapsed=elapsed)
+
+    @classmethod
+    def failure(cls, stage, error, elapsed=0.0):
+        return cls(stage, cls.FAILED, error=error, elapsed=elapsed)
+
+    @classmethod
+    def skip(cls, stage, reason):
+        return cls(stage, cls.SKIPPED, error=reason)
+
+    @classmethod
+    def from_value(cls, stage, value, elapsed=0.0):
+        """A result from a helper's plain return value ("Error ..." strings and None are failures)"""
+        if value is None:
+            return cls.failure(stage, f"{ERROR_PREFIX}: {stage} returned no result", elapsed)
+        if is_error(value):
+            return cls.failure(stage, value, elapsed)
+        return cls.success(stage, value, elapsed)
+
+    @property
+    def ok(self):
+        return self.status == self.OK
+
+    def unwrap(self):
+        """
+        The value of a successful stage
+
+        Raises:
+            StageError: The stage failed or was skipped
+        """
+        if not self.ok:
+            raise StageError(self.stage, self.error)
+        return self.value
+
+    def to_dict(self):
+        return {"stage": self.stage, "status": self.status, "error": self.error, "elapsed": round(self.elapsed, 3)}
+
+    def __repr__(self):
+        detail = f"value={self.value!r}" if self.ok else f"error={self.error!r}"
+        return f"StageResult({self.stage!r}, {self.status!r}, {detail})"
+
+
+class Pipeline:
+    """
+    The stages of one consultation, run under the degradation policy
+
+    Stages are named (e.g. "stt", "llm", "tts") and run in the order the
+    caller runs them; results holds each stage's StageResult.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, stage, fn, requires=()):
+        """
+        Run a stage unless a stage it requires did not succeed
+
+        Args:
+            stage: Stage name
+            fn: Zero-argument callable returning a StageResult or a plain
+                value (see StageResult.from_value); exceptions fail the stage
+                (a StageError with its own message)
+            requires: Stages whose failure makes this one pointless; stages
+                that never ran don't block it
+
+        Returns:
+            StageResult: The outcome (skipped without calling fn if blocked)
+        """
+        blocked = self.blocked_by(requires)
+        if blocked is not None:
+            result = StageResult.skip(stage, f"skipped: {blocked.stage} {blocked.status}")
+            logging.info(f"Pipeline stage {stage} skipped, {blocked.stage} {blocked.status}")
+            self.results[stage] = result
+            return result
+
+        start = time.perf_counter()
+        try:
+            outcome = fn()
+        except StageError as e:
+            outcome = StageResult.failure(stage, str(e))
+        except Exception as e:
+            outcome = StageResult.failure(stage, f"{ERROR_PREFIX} in {stage}: {str(e)}")
+        if not isinstance(outcome, StageResult):
+            outcome = StageResult.from_value(stage, outcome)
+        outcome.stage = stage
+        outcome.elapsed = time.perf_counter() - start
+        if not outcome.ok:
+            logging.warning(f"Pipeline stage {stage} {outcome.status}: {outcome.error}")
+        self.results[stage] = outcome
+        return outcome
+
+    def blocked_by(self, requires):
+        """The first required stage that ran and did not succeed, or None"""
+        for name in requires:
+            result = self.results.get(name)
+            if result is not None and not result.ok:
+                return result
+        return None
+
+    def ok(self, stage):
+        result = self.results.get(stage)
+        return result is not None and result.ok
+
+    def summary(self):
+        """Status of every stage run so far, for history and logs"""
+        return {stage: result.to_dict() for stage, result in self.results.items()}
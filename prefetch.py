@@ -0,0 +1,118 @@
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+
+from async_runtime import submit
+
+DEFAULT_MAX_RESULTS = 200
+
+
+class SpeculativePrefetcher:
+    """
+    Consultation work started before "Get Consultation" is pressed
+
+    As soon as an input is ready (a recording saved, images uploaded) the
+    app starts the work the consultation will need from it (transcription,
+    image preprocessing) on the background event loop. Work is keyed by
+    content (digest plus the parameters that affect the result), so the
+    same recording or photos share one job across reruns and sessions.
+
+    Each session holds at most one job per slot ("stt", "images"). When a
+    slot moves to a different key (input changed or discarded), the old
+    job is cancelled unless another session still holds it. The oldest
+    finished results are dropped once more than max_results are kept (a
+    session that never comes back must not pin its results).
+    """
+
+    def __init__(self, max_results=DEFAULT_MAX_RESULTS):
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._holders = {}
+        self._stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0}
+
+    def speculate(self, owner, slot, key, make_coro):
+        """
+        Start the work for key in the background (no-op if already started)
+
+        Args:
+            owner: Session id holding the job
+            slot: Which input the job belongs to, e.g. "stt" or "images"
+            key: Content key of the result
+            make_coro: Zero-argument function returning the coroutine to run
+        """
+        with self._lock:
+            previous = self._holders.get((owner, slot))
+            if previous == key and key in self._jobs:
+                return
+            self._holders[(owner, slot)] = key
+            if previous is not None and previous != key:
+                self._cancel_unheld_locked(previous)
+            if key not in self._jobs:
+                self._jobs[key] = submit(make_coro())
+                self._stats["started"] += 1
+            self._jobs.move_to_end(key)
+            self._trim_locked()
+
+    def take(self, key, timeout=None):
+        """
+        Wait for a speculated result
+
+        Returns:
+            The result, or None if nothing was started for key, it failed or
+            was cancelled, or it did not finish within timeout (the caller
+            then does the work itself)
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        try:
+            result = job.result(timeout)
+        except (CancelledError, TimeoutError):
+            result = None
+        except Exception as e:
+            logging.warning(f"Speculative job failed, recomputing: {str(e)}")
+            result = None
+        with self._lock:
+            self._stats["hits" if result is not None else "misses"] += 1
+            if result is None and self._jobs.get(key) is job and job.done():
+                del self._jobs[key]
+        return result
+
+    def discard(self, key):
+        """Forget a result (e.g. an error the caller will retry)"""
+        with self._lock:
+            job = self._jobs.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def release(self, owner, slot=None):
+        """Drop an owner's hold on one slot (or all of them), cancelling work nobody else holds"""
+        with self._lock:
+            for held in [h for h in self._holders if h[0] == owner and (slot is None or h[1] == slot)]:
+                self._cancel_unheld_locked(self._holders.pop(held))
+
+    def stats(self):
+        """Jobs started and cancelled, takes served (hits) or not (misses), and jobs kept"""
+        with self._lock:
+            return {**self._stats, "jobs": len(self._jobs)}
+
+    def _cancel_unheld_locked(self, key):
+        if key in self._holders.values():
+            return
+        job = self._jobs.get(key)
+        if job is not None and not job.done():
+            job.cancel()
+            del self._jobs[key]
+            self._stats["cancelled"] += 1
+
+    def _trim_locked(self):
+        finished = [k for k, job in self._jobs.items() if job.done()]
+        while len(self._jobs) > self.max_results and finished:
+            del self._jobs[finished.pop(0)]
+        for held in [h for h, key in self._holders.items() if key not in self._jobs]:
+            del self._holders[held]
@@ -0,0 +1,334 @@
+import os
+import html
+import time
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_REPORTS = 200
+
+FORMATS = {
+    "html": "text/html",
+    "pdf": "application/pdf",
+}
+
+# Voice response file extension -> MIME type for the embedded player
+AUDIO_TYPES = {"mp3": "audio/mpeg", "ogg": "audio/ogg", "wav": "audio/wav"}
+
+LABELS = {
+    "english": {
+        "lang": "en",
+        "title": "AI Medical Consultation Report",
+        "consultation_type": "Consultation Type",
+        "date": "Date",
+        "inputs": "Input Methods",
+        "language": "Language",
+        "language_name": "English",
+        "symptoms": "Patient's Symptoms",
+        "voice": "Voice",
+        "text": "Text",
+        "image": "Image",
+        "no_symptoms": "No symptoms described (image-only analysis)",
+        "assessment": "{specialty} Assessment",
+        "voice_response": "Voice Response",
+        "disclaimer": "Disclaimer",
+        "disclaimer_text": (
+            "This AI assistant is for educational purposes only. The consultation was based on "
+            "{specialty} principles. Always consult a qualified healthcare professional for proper "
+            "diagnosis and treatment."
+        ),
+    },
+    "hindi": {
+        "lang": "hi",
+        "title": "AI चिकित्सा परामर्श रिपोर्ट",
+        "consultation_type": "परामर्श प्रकार",
+        "date": "दिनांक",
+        "inputs": "इनपुट विधियां",
+        "language": "भाषा",
+        "language_name": "हिंदी",
+        "symptoms": "मरीज के लक्षण",
+        "voice": "आवाज़",
+        "text": "टेक्स्ट",
+        "image": "छवि",
+        "no_symptoms": "कोई लक्षण नहीं बताए गए (केवल छवि विश्लेषण)",
+        "assessment": "{specialty} मूल्यांकन",
+        "voice_response": "आवाज़ प्रतिक्रिया",
+        "disclaimer": "अस्वीकरण",
+        "disclaimer_text": (
+            "यह AI सहायक केवल शैक्षिक उद्देश्यों के लिए है। परामर्श {specialty} सिद्धांतों पर आधारित था। "
+            "उचित निदान और उपचार के लिए हमेशा योग्य स्वास्थ्य पेशेवर से परामर्श करें।"
+        ),
+    },
+}
+
+STYLE = """
+body { font-family: "Noto Sans", "Noto Sans Devanagari", Arial, sans-serif; color: #1f2937;
+       max-width: 780px; margin: 2rem auto; padding: 0 1rem; line-height: 1.6; }
+h1 { color: #1e3a5f; border-bottom: 2px solid #1e3a5f; padding-bottom: 0.5rem; }
+h2 { color: #1e3a5f; font-size: 1.15rem; margin-top: 1.75rem; }
+table { border-collapse: collapse; }
+td { padding: 0.15rem 1rem 0.15rem 0; vertical-align: top; }
+.response { background: #f8fafc; border-left: 4px solid #1e3a5f; padding: 0.75rem 1rem; white-space: pre-wrap; }
+.disclaimer { font-size: 0.85rem; color: #6b7280; border-top: 1px solid #cbd5e1; padding-top: 0.75rem; }
+"""
+
+
+def report_from_results(results, audio_path=None):
+    """
+    Report fields from a consultation result (st.session_state.results)
+
+    Args:
+        results: The results dict built by the app
+        audio_path: The voice response file, embedded in HTML reports if given
+
+    Returns:
+        dict: Input for render_html / render_pdf
+    """
+    return {
+        "id": results["id"],
+        "created_at": results.get("created_at") or time.time(),
+        "doctor_type": results["doctor_type"],
+        "doctor_name": results.get("doctor_name"),
+        "specialty": results.get("specialty"),
+        "language": results.get("language", "english"),
+        "has_image": results.get("has_image", False),
+        "transcription": results.get("transcription", ""),
+        "text_input": results.get("text_input", ""),
+        "response": results.get("response", ""),
+        "audio_path": audio_path,
+    }
+
+
+def report_from_consultation(consultation):
+    """Report fields from a stored consultation (ConsultationStore row)"""
+    return {
+        "id": consultation["id"],
+        "created_at": consultation["created_at"],
+        "doctor_type": consultation["specialty"],
+        "doctor_name": None,
+        "specialty": None,
+        "language": consultation.get("language", "english"),
+        "has_image": consultation.get("has_image", False),
+        "transcription": consultation.get("transcription") or "",
+        "text_input": consultation.get("text_input") or "",
+        "response": consultation.get("response") or "",
+        "audio_path": None,
+    }
+
+
+def report_filename(report, fmt):
+    stamp = datetime.fromtimestamp(report["created_at"]).strftime("%Y%m%d_%H%M%S")
+    return f"medical_consultation_{report['doctor_type']}_{stamp}.{fmt}"
+
+
+def render_html(report):
+    """
+    Render a report as a self-contained HTML document
+
+    The voice response, when available, is embedded as a data URI so the
+    file plays anywhere it is shared.
+    """
+    labels = LABELS.get(report["language"], LABELS["english"])
+    specialty = report["specialty"] or report["doctor_type"].title()
+    esc = html.escape
+
+    inputs = []
+    if report["has_image"]:
+        inputs.append(labels["image"])
+    if report["transcription"]:
+        inputs.append(labels["voice"])
+    if report["text_input"]:
+        inputs.append(labels["text"])
+
+    symptoms = []
+    if report["transcription"]:
+        symptoms.append(f"<p><strong>{labels['voice']}:</strong> {esc(report['transcription'])}</p>")
+    if report["text_input"]:
+        symptoms.append(f"<p><strong>{labels['text']}:</strong> {esc(report['text_input'])}</p>")
+    if not symptoms:
+        symptoms.append(f"<p>{labels['no_symptoms']}</p>")
+
+    audio = ""
+    if report.get("audio_path") and os.path.exists(report["audio_path"]):
+        with open(report["audio_path"], "rb") as f:
+            encoded = base64.b64encode(f.read()).decode("ascii")
+        mime = AUDIO_TYPES.get(os.path.splitext(report["audio_path"])[1].lstrip("."), "audio/mpeg")
+        audio = (
+            f"<h2>{labels['voice_response']}</h2>\n"
+            f'<audio controls src="data:{mime};base64,{encoded}"></audio>'
+        )
+
+    date = datetime.fromtimestamp(report["created_at"]).strftime("%Y-%m-%d %H:%M:%S")
+    return f"""<!DOCTYPE html>
+<html lang="{labels['lang']}">
+<head>
+<meta charset="utf-8">
+<title>{esc(labels['title'])}</title>
+<style>{STYLE}</style>
+</head>
+<body>
+<h1>{esc(labels['title'])}</h1>
+<table>
+<tr><td><strong>{labels['consultation_type']}</strong></td><td>{esc(report['doctor_name'] or specialty)}</td></tr>
+<tr><td><strong>{labels['date']}</strong></td><td>{date}</td></tr>
+<tr><td><strong>{labels['inputs']}</strong></td><td>{esc(', '.join(inputs))}</td></tr>
+<tr><td><strong>{labels['language']}</strong></td><td>{labels['language_name']}</td></tr>
+</table>
+<h2>{labels['symptoms']}</h2>
+{''.join(symptoms)}
+<h2>{esc(labels['assessment'].format(specialty=specialty))}</h2>
+<div class="response">{esc(report['response'])}</div>
+{audio}
+<p class="disclaimer"><strong>{labels['disclaimer']}:</strong> {esc(labels['disclaimer_text'].format(specialty=specialty))}</p>
+</body>
+</html>
+"""
+
+
+def pdf_available():
+    """Whether PDF rendering is possible (needs the optional weasyprint package)"""
+    try:
+        import weasyprint  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def render_pdf(report):
+    """Render a report as PDF via weasyprint (Devanagari needs a Noto Sans Devanagari font installed)"""
+    from weasyprint import HTML
+    # Audio can't play in a PDF
+    return HTML(string=render_html({**report, "audio_path": None})).write_pdf()
+
+
+def render(report, fmt="html"):
+    """
+    Returns:
+        bytes: The report in the given format ("html" or "pdf")
+    """
+    if fmt == "pdf":
+        return render_pdf(report)
+    if fmt == "html":
+        return render_html(report).encode("utf-8")
+    raise ValueError(f"Unknown report format: {fmt}")
+
+
+class ReportJobManager:
+    """
+    Background report rendering for consultation results
+
+    Reports are rendered on worker threads, off the script run, and cached
+    by (result id, format, audio), so reruns and repeated downloads reuse
+    one rendering. The download button waits on the job only when clicked.
+    The oldest finished reports are dropped once more than max_reports are held.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_reports=DEFAULT_MAX_REPORTS):
+        self.max_reports = max_reports
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, report, fmt="html"):
+        """
+        Start rendering a report (no-op if already started)
+
+        Returns:
+            Future: Resolves to the report bytes
+        """
+        key = (report["id"], fmt, report.get("audio_path"))
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                return job
+            job = self._executor.submit(render, report, fmt)
+            self._jobs[key] = job
+            self._trim_locked()
+            return job
+
+    def result(self, report, fmt="html", timeout=60):
+        """The rendered report bytes (renders now if it was never submitted)"""
+        return self.submit(report, fmt).result(timeout)
+
+    def discard(self, result_id):
+        """Drop every cached rendering of a result"""
+        with self._lock:
+            for key in [k for k in self._jobs if k[0] == result_id]:
+                self._jobs.pop(key).cancel()
+
+    def _trim_locked(self):
+        finished = [key for key, job in self._jobs.items() if job.done()]
+        while len(self._jobs) > self.max_reports and finished:
+            del self._jobs[finished.pop(0)]
+
+
+def _render_to_file(report, fmt, output_dir):
+    path = os.path.join(output_dir, f"{report['id']}.{fmt}")
+    with open(path, "wb") as f:
+        f.write(render(report, fmt))
+    return path
+
+
+def render_batch(reports, output_dir, fmt="html", processes=None):
+    """
+    Render many reports in parallel on a process pool
+
+    Args:
+        reports: Report dicts (see report_from_consultation)
+        output_dir: Directory to write <id>.<fmt> files to
+        fmt: "html" or "pdf"
+        processes: Worker processes (default: CPU count)
+
+    Returns:
+        tuple: (written paths, number of failures)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    failures = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_render_to_file, report, fmt, output_dir) for report in reports]
+        for report, future in zip(reports, futures):
+            try:
+                paths.append(future.result())
+            except Exception as e:
+                failures += 1
+                logging.error(f"Could not render report {report['id']}: {str(e)}")
+    return paths, failures
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import get_config
+    from consultation_store import ConsultationStore
+
+    parser = argparse.ArgumentParser(description="Render reports for past consultations")
+    parser.add_argument("--output-dir", default="reports")
+    parser.add_argument("--format", default="html", choices=sorted(FORMATS))
+    parser.add_argument("--specialty")
+    parser.add_argument("--language")
+    parser.add_argument("--days", type=float, help="Only consultations from the last N days")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--db", default=get_config().paths.consultation_db)
+    args = parser.parse_args()
+
+    store = ConsultationStore(db_path=args.db)
+    since = time.time() - args.days * 86400 if args.days else None
+    reports = []
+    cursor = None
+    while len(reports) < args.limit:
+        page, cursor = store.query(args.specialty, args.language, since, limit=min(200, args.limit - len(reports)),
+                                   cursor=cursor, answered=True)
+        reports.extend(report_from_consultation(c) for c in page)
+        if cursor is None:
+            break
+    store.close()
+
+    start = time.perf_counter()
+    paths, failures = render_batch(reports, args.output_dir, args.format, args.processes)
+    print(f"Rendered {len(paths)} reports to {args.output_dir} in {time.perf_counter() - start:.2f}s"
+          f" ({failures} failed)")
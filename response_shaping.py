@@ -0,0 +1,93 @@
+import re
+
+from config import get_config
+from text_normalization import split_sentences
+
+# Response caps per specialty (response.max_tokens) only cut off runaway
+# answers, since the prompts ask for one short paragraph; the default stop
+# sequence, a blank line, ends generation when the model moves on to extras
+# (notes, disclaimers, headings). Devanagari text needs roughly twice the
+# tokens of English for the same content.
+LANGUAGE_TOKEN_FACTOR = {
+    "hindi": 2.0,
+}
+
+# Structured (JSON) answers spend tokens on keys and quoting, and a blank
+# line is no sign the answer is done
+STRUCTURED_TOKEN_FACTOR = 1.5
+
+# What the voice reads out: the opening assessment plus the closing reassurance
+SPOKEN_MAX_SENTENCES = 3
+SPOKEN_MAX_CHARS = 320
+
+MARKDOWN_RE = re.compile(r"[*_#`>|~]+")
+
+
+def generation_limits(specialty, language, budget_max_tokens=None, structured=False):
+    """
+    max_tokens and stop sequences for a consultation
+
+    Args:
+        specialty: Doctor type ("allopathy", "homeopathy", "ayurveda")
+        language: "english" or "hindi"
+        budget_max_tokens: Tighter cap from the usage budget, if any
+        structured: The answer is a JSON object (response.structured):
+            a larger cap and no stop sequences
+
+    Returns:
+        tuple: (max_tokens or None, list of stop sequences or None)
+    """
+    response = get_config().response
+    max_tokens = response.max_tokens.get(specialty)
+    if max_tokens:
+        max_tokens = int(max_tokens * LANGUAGE_TOKEN_FACTOR.get(language, 1.0))
+        if structured:
+            max_tokens = int(max_tokens * STRUCTURED_TOKEN_FACTOR)
+    if budget_max_tokens:
+        max_tokens = min(max_tokens, budget_max_tokens) if max_tokens else budget_max_tokens
+    if structured:
+        return max_tokens, None
+    return max_tokens, list(response.stop_sequences) or None
+
+
+def trim_to_sentence(text):
+    """Drop a trailing incomplete sentence (an answer cut off by max_tokens)"""
+    sentences = split_sentences(text)
+    if len(sentences) > 1 and not re.search(r"[.!?।॥]$", sentences[-1]):
+        return " ".join(sentences[:-1])
+    return text.strip()
+
+
+def spoken_summary(text, max_sentences=SPOKEN_MAX_SENTENCES, max_chars=SPOKEN_MAX_CHARS):
+    """
+    A short version of the response for text-to-speech
+
+    Keeps the opening sentences (the assessment) and, when the answer is
+    longer, its last sentence (the reassuring close the prompts ask for),
+    within max_sentences and max_chars. Synthesis time grows with text
+    length, so this bounds voice latency; the full text is still shown.
+
+    Args:
+        text: The full written response
+        max_sentences: Max sentences to speak
+        max_chars: Max characters to speak (at least the first sentence is kept)
+
+    Returns:
+        str: Text to synthesize
+    """
+    sentences = split_sentences(MARKDOWN_RE.sub("", text))
+    if len(sentences) <= max_sentences and sum(len(s) + 1 for s in sentences) <= max_chars:
+        return " ".join(sentences)
+
+    closing = sentences[-1] if len(sentences) > 1 else None
+    budget_chars = max_chars - (len(closing) + 1 if closing else 0)
+    budget_sentences = max_sentences - (1 if closing else 0)
+
+    spoken = [sentences[0]]
+    for sentence in sentences[1:-1]:
+        if len(spoken) >= budget_sentences or sum(len(s) + 1 for s in spoken) + len(sentence) > budget_chars:
+            break
+        spoken.append(sentence)
+    if closing and sum(len(s) + 1 for s in spoken) + len(closing) <= max_chars:
+        spoken.append(closing)
+    return " ".join(spoken)
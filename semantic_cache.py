@@ -0,0 +1,240 @@
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+from embeddings import get_default_embedder, VectorIndex
+from text_normalization import matching_text, match_key, DIGITS
+from pipeline import is_error
+
+DEFAULT_THRESHOLD = 0.9
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_TTL = 24 * 60 * 60
+# Nearest neighbours checked for one whose negations and numbers match
+GUARD_CANDIDATES = 5
+
+MODE_OFF = "off"
+MODE_SHADOW = "shadow"
+MODE_ON = "on"
+
+# Terms that flip a symptom's meaning; Hindi ones as spelled by match_key (नहीं, nahin, nahi)
+NEGATION_TERMS = frozenset({
+    "no", "not", "never", "without", "none", "nor", "neither", "nothing",
+})
+HINDI_NEGATION_TERMS = {"nahin": "nahi", "nahi": "nahi", "nai": "nahi", "na": "na", "mat": "mat", "bina": "bina"}
+# "don't" tokenizes as "don" "t"
+CONTRACTION_STEMS = frozenset({
+    "don", "doesn", "didn", "isn", "wasn", "aren", "weren", "hasn", "haven", "hadn",
+    "can", "couldn", "won", "wouldn", "shouldn",
+})
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+DEVANAGARI_DIGITS = str.maketrans(DIGITS)
+
+
+def normalize_symptoms(text):
+    """Case-folded, punctuation-free symptom text with Devanagari romanized (see text_normalization)"""
+    return matching_text(text)
+
+
+def query_guard(text):
+    """
+    What two symptom texts must share for one to be served the other's answer
+
+    Embedding similarity can't tell "fever, no cough" from "cough, no
+    fever" or 3 days from 30. The guard is each negation with the words on
+    either side (its scope, before or after depending on the language) and
+    the numbers, so such pairs never match however similar they score.
+
+    Returns:
+        tuple: (negation contexts, numbers), both sorted tuples
+    """
+    # English terms are matched as written ("w" folds to "v"), Hindi ones and context words folded
+    words = matching_text(text).split()
+    tokens = match_key(text).split()
+    negations = []
+    for i, (word, token) in enumerate(zip(words, tokens)):
+        if word == "t" and i > 0 and words[i - 1] in CONTRACTION_STEMS:
+            term = "not"
+        elif word in NEGATION_TERMS:
+            term = word
+        elif token in HINDI_NEGATION_TERMS:
+            term = HINDI_NEGATION_TERMS[token]
+        else:
+            continue
+        before = tokens[i - 1] if i > 0 and words[i - 1] not in CONTRACTION_STEMS else ""
+        after = tokens[i + 1] if i + 1 < len(tokens) else ""
+        negations.append((before, term, after))
+    numbers = NUMBER_RE.findall(text.translate(DEVANAGARI_DIGITS))
+    return tuple(sorted(negations)), tuple(sorted(numbers))
+
+
+class SemanticResponseCache:
+    """
+    Cache of text-only consultation answers, matched by symptom similarity
+
+    Symptom descriptions are embedded locally and compared with a single
+    vectorized nearest-neighbour lookup restricted to the same partition
+    (specialty, language, model). A neighbour above the threshold is a hit.
+    Before that, a transliteration-aware exact key (text_normalization.
+    match_key) catches repeats that differ only in script, spelling or
+    punctuation without embedding anything.
+
+    In shadow mode hits are only counted: the model is still called, and the
+    cached answer is compared with the fresh one to measure answer drift, so
+    the threshold can be tuned before the cache is allowed to serve answers.
+    Mode "on" needs a sentence-embedding model (cache.embedding_model); with
+    the hashing embedder the cache stays in shadow mode. Similarity hits
+    also need the same negations and numbers as the cached query (see
+    query_guard).
+    """
+
+    def __init__(
+        self,
+        mode=MODE_SHADOW,
+        threshold=DEFAULT_THRESHOLD,
+        max_entries=DEFAULT_MAX_ENTRIES,
+        ttl=DEFAULT_TTL,
+        embedder=None
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedder = embedder or get_default_embedder()
+        self.mode = mode
+        self._index = VectorIndex(self.embedder.dim)
+        self._lock = threading.Lock()
+        # key -> (response, created_at, exact_key, guard), oldest first
+        self._entries = OrderedDict()
+        # exact_key -> key
+        self._exact = {}
+        self._stats = {
+            "lookups": 0, "hits": 0, "exact_hits": 0, "guard_rejected": 0, "served": 0,
+            "shadow_compared": 0, "drift_total": 0.0
+        }
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode):
+        if mode == MODE_ON and not getattr(self.embedder, "semantic", False):
+            logging.warning(
+                "Semantic cache mode 'on' needs a sentence-embedding model (cache.embedding_model); "
+                "staying in shadow mode"
+            )
+            mode = MODE_SHADOW
+        self._mode = mode
+
+    def get_or_compute(self, symptoms, compute, specialty, language, model):
+        """
+        Return a cached answer for similar symptoms, or compute and cache one
+
+        Args:
+            symptoms: The patient's symptom text (without the doctor prompt)
+            compute: Zero-argument callable that calls the model and returns its answer
+            specialty: Doctor type, part of the cache partition
+            language: Response language, part of the cache partition
+            model: Model name, part of the cache partition
+
+        Returns:
+            str: The answer
+        """
+        normalized = normalize_symptoms(symptoms)
+        if self.mode == MODE_OFF or not normalized:
+            return compute()
+
+        partition = f"{specialty}|{language}|{model}"
+        exact_key = f"{partition}|{match_key(symptoms)}"
+        vector = None
+        guard = query_guard(symptoms)
+        cached = self._lookup_exact(exact_key)
+        if cached is None:
+            vector = self.embedder.embed([normalized])[0]
+            cached = self._lookup(vector, partition, guard)
+
+        if cached is not None and self.mode == MODE_ON:
+            with self._lock:
+                self._stats["served"] += 1
+            return cached
+
+        response = compute()
+        if is_error(response):
+            return response
+
+        if cached is not None:
+            self._record_drift(cached, response)
+        else:
+            self._insert(vector, partition, exact_key, guard, response)
+        return response
+
+    def stats(self):
+        """
+        Hit rate and mean answer drift (1 - cosine similarity of answers) seen in shadow mode
+
+        Returns:
+            dict: Counters plus derived hit_rate and mean_drift
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["mean_drift"] = (
+            stats["drift_total"] / stats["shadow_compared"] if stats["shadow_compared"] else None
+        )
+        return stats
+
+    def _lookup_exact(self, exact_key):
+        with self._lock:
+            entry = self._entries.get(self._exact.get(exact_key))
+            if entry is None or time.time() - entry[1] > self.ttl:
+                return None
+            self._stats["lookups"] += 1
+            self._stats["hits"] += 1
+            self._stats["exact_hits"] += 1
+        logging.info(f"Semantic cache exact hit (mode {self.mode})")
+        return entry[0]
+
+    def _lookup(self, vector, partition, guard):
+        hits = self._index.search(vector, k=GUARD_CANDIDATES, min_score=self.threshold, partition=partition)
+        with self._lock:
+            self._stats["lookups"] += 1
+            now = time.time()
+            entries = [(score, self._entries.get(key)) for key, score, _ in hits]
+            entries = [(score, entry) for score, entry in entries if entry is not None and now - entry[1] <= self.ttl]
+            if not entries:
+                return None
+            match = next(((score, entry) for score, entry in entries if entry[3] == guard), None)
+            if match is None:
+                self._stats["guard_rejected"] += 1
+                logging.info(f"Semantic cache near miss (similarity {entries[0][0]:.3f}): negations or numbers differ")
+                return None
+            score, entry = match
+            self._stats["hits"] += 1
+        logging.info(f"Semantic cache hit (similarity {score:.3f}, mode {self.mode})")
+        return entry[0]
+
+    def _insert(self, vector, partition, exact_key, guard, response):
+        key = uuid.uuid4().hex
+        evicted = []
+        with self._lock:
+            self._entries[key] = (response, time.time(), exact_key, guard)
+            self._exact[exact_key] = key
+            while len(self._entries) > self.max_entries:
+                old_key, (_, _, old_exact, _) = self._entries.popitem(last=False)
+                if self._exact.get(old_exact) == old_key:
+                    del self._exact[old_exact]
+                evicted.append(old_key)
+        self._index.add([key], [vector], [{"partition": partition}])
+        if evicted:
+            self._index.remove(evicted)
+
+    def _record_drift(self, cached, fresh):
+        vectors = self.embedder.embed([normalize_symptoms(cached), normalize_symptoms(fresh)])
+        drift = 1.0 - float(vectors[0] @ vectors[1])
+        with self._lock:
+            self._stats["shadow_compared"] += 1
+            self._stats["drift_total"] += drift
+        logging.info(f"Semantic cache shadow comparison: answer drift {drift:.3f}")
@@ -0,0 +1,279 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# Default limits (bytes / seconds)
+DEFAULT_SESSION_QUOTA = 25 * 1024 * 1024
+DEFAULT_GLOBAL_QUOTA = 256 * 1024 * 1024
+DEFAULT_SPILL_THRESHOLD = 2 * 1024 * 1024
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+# How often the background sweeper evicts idle sessions when nothing else does
+DEFAULT_SWEEP_INTERVAL = 60
+
+
+class MediaQuotaExceeded(Exception):
+    """Raised when a blob would push a session over its byte quota"""
+
+
+class _Blob:
+    """A content-addressed media blob, shared by every session that holds it"""
+
+    def __init__(self, digest, path, size):
+        self.digest = digest
+        self.path = path
+        self.size = size
+        self.data = None
+        self.refcount = 0
+
+
+class SessionMediaManager:
+    """
+    Bounded store for the media blobs (uploaded images, recorded audio)
+    that used to live as raw bytes in st.session_state.
+
+    Every blob is written once to a content-addressed file under spill_dir,
+    so identical uploads from different sessions share a single copy. Small
+    blobs are additionally kept in memory as a hot cache, bounded by the
+    global quota; the least recently used ones are dropped back to disk-only
+    when it fills up. Sessions that stay idle longer than idle_timeout are
+    evicted and their unreferenced blobs are removed from disk: on every
+    put() and touch(), and every sweep_interval seconds from a background
+    thread, so they go even when no session is active.
+    """
+
+    def __init__(
+        self,
+        spill_dir="temp_docs/media",
+        session_quota=DEFAULT_SESSION_QUOTA,
+        global_quota=DEFAULT_GLOBAL_QUOTA,
+        spill_threshold=DEFAULT_SPILL_THRESHOLD,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        sweep_interval=DEFAULT_SWEEP_INTERVAL
+    ):
+        self.spill_dir = spill_dir
+        self.session_quota = session_quota
+        self.global_quota = global_quota
+        self.spill_threshold = spill_threshold
+        self.idle_timeout = idle_timeout
+
+        os.makedirs(spill_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._blobs = {}
+        # digest -> None, ordered from least to most recently used
+        self._resident = OrderedDict()
+        self._resident_bytes = 0
+        # session_id -> {"items": {key: digest}, "last_seen": float}
+        self._sessions = {}
+
+        self._stopped = threading.Event()
+        if sweep_interval:
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, args=(sweep_interval,), name="session-media-sweeper", daemon=True
+            )
+            self._sweeper.start()
+
+    def put(self, session_id, key, data, suffix=""):
+        """
+        Store a blob for a session, replacing whatever was under the same key
+
+        Args:
+            session_id: Unique id of the Streamlit session
+            key: Slot name within the session (e.g. "image", "audio")
+            data: Raw bytes
+            suffix: File extension for the on-disk copy (e.g. ".wav")
+
+        Returns:
+            str: Content digest of the stored blob
+        """
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            self._evict_idle_locked(time.monotonic())
+            session = self._touch_locked(session_id)
+
+            previous = session["items"].get(key)
+            used = sum(
+                self._blobs[d].size for k, d in session["items"].items() if k != key
+            )
+            if used + len(data) > self.session_quota:
+                raise MediaQuotaExceeded(
+                    f"Session media quota of {self.session_quota} bytes exceeded"
+                )
+
+            blob = self._blobs.get(digest)
+            if blob is None:
+                path = os.path.join(self.spill_dir, digest + suffix)
+                with open(path, "wb") as f:
+                    f.write(data)
+                blob = _Blob(digest, path, len(data))
+                self._blobs[digest] = blob
+
+            blob.refcount += 1
+            session["items"][key] = digest
+            if previous is not None:
+                self._release_locked(previous)
+
+            if blob.data is None and blob.size <= self.spill_threshold:
+                blob.data = data
+                self._resident_bytes += blob.size
+            if blob.data is not None:
+                self._resident[digest] = None
+                self._resident.move_to_end(digest)
+            self._enforce_global_quota_locked()
+
+        return digest
+
+    def get(self, session_id, key):
+        """Return the bytes stored under key for a session, or None"""
+        with self._lock:
+            blob = self._lookup_locked(session_id, key)
+            if blob is None:
+                return None
+            if blob.data is not None:
+                self._resident.move_to_end(blob.digest)
+                return blob.data
+            path = blob.path
+
+        # Read outside the lock; the blob may be released and its file deleted meanwhile
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def path(self, session_id, key):
+        """Return the on-disk path of a session's blob, or None"""
+        with self._lock:
+            blob = self._lookup_locked(session_id, key)
+            return blob.path if blob is not None else None
+
+    def digest(self, session_id, key):
+        """Return the content digest of a session's blob, or None"""
+        with self._lock:
+            blob = self._lookup_locked(session_id, key)
+            return blob.digest if blob is not None else None
+
+    def discard(self, session_id, key):
+        """Drop a single blob from a session"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            digest = session["items"].pop(key, None)
+            if digest is not None:
+                self._release_locked(digest)
+
+    def clear_session(self, session_id):
+        """Drop every blob held by a session"""
+        with self._lock:
+            self._drop_session_locked(session_id)
+
+    def touch(self, session_id):
+        """Mark a session as active so it is not evicted as idle (and evict the ones that are)"""
+        with self._lock:
+            self._evict_idle_locked(time.monotonic())
+            self._touch_locked(session_id)
+
+    def evict_idle(self):
+        """
+        Evict sessions that have been idle longer than idle_timeout
+
+        Returns:
+            int: Number of sessions evicted
+        """
+        with self._lock:
+            return self._evict_idle_locked(time.monotonic())
+
+    def close(self):
+        """Stop the background sweeper"""
+        self._stopped.set()
+
+    def _sweep_loop(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                evicted = self.evict_idle()
+            except Exception as e:
+                logging.warning(f"Idle media sweep failed: {str(e)}")
+                continue
+            if evicted:
+                logging.info(f"Evicted {evicted} idle media sessions")
+
+    def memory_usage(self):
+        """
+        Snapshot of the store's footprint, suitable for a metrics gauge
+
+        Returns:
+            dict: Resident/on-disk byte counts, blob and session counts, quotas
+        """
+        with self._lock:
+            return {
+                "resident_bytes": self._resident_bytes,
+                "disk_bytes": sum(b.size for b in self._blobs.values()),
+                "blobs": len(self._blobs),
+                "resident_blobs": len(self._resident),
+                "sessions": len(self._sessions),
+                "global_quota": self.global_quota,
+                "session_quota": self.session_quota
+            }
+
+    # Internal helpers, all called with self._lock held
+
+    def _touch_locked(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"items": {}, "last_seen": 0.0}
+            self._sessions[session_id] = session
+        session["last_seen"] = time.monotonic()
+        return session
+
+    def _lookup_locked(self, session_id, key):
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        session["last_seen"] = time.monotonic()
+        digest = session["items"].get(key)
+        return self._blobs.get(digest) if digest is not None else None
+
+    def _release_locked(self, digest):
+        blob = self._blobs.get(digest)
+        if blob is None:
+            return
+        blob.refcount -= 1
+        if blob.refcount > 0:
+            return
+        if blob.data is not None:
+            self._resident_bytes -= blob.size
+            self._resident.pop(digest, None)
+        del self._blobs[digest]
+        try:
+            os.remove(blob.path)
+        except OSError as e:
+            logging.warning(f"Could not remove media blob {blob.path}: {str(e)}")
+
+    def _drop_session_locked(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        for digest in session["items"].values():
+            self._release_locked(digest)
+
+    def _evict_idle_locked(self, now):
+        idle = [
+            sid for sid, s in self._sessions.items()
+            if now - s["last_seen"] > self.idle_timeout
+        ]
+        for session_id in idle:
+            self._drop_session_locked(session_id)
+        return len(idle)
+
+    def _enforce_global_quota_locked(self):
+        # Spill least recently used blobs back to disk-only
+        while self._resident_bytes > self.global_quota and self._resident:
+            digest, _ = self._resident.popitem(last=False)
+            blob = self._blobs[digest]
+            blob.data = None
+            self._resident_bytes -= blob.size
@@ -0,0 +1,126 @@
+import json
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+def make_key(*parts):
+    """Stable digest of the parts that make two calls interchangeable"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            hasher.update(part)
+        elif isinstance(part, str):
+            hasher.update(part.encode("utf-8"))
+        else:
+            hasher.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one
+
+    The first caller for a key (the leader) runs the call; callers that
+    arrive with the same key while it is in flight wait for the leader's
+    result instead of making their own call. Exceptions raised by the call
+    are re-raised in every caller. Nothing is cached: once the call
+    finishes, the next caller for the key starts a new one.
+
+    do() and do_async() share the in-flight table, so blocking and async
+    callers (on any thread or event loop) coalesce with each other.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn() unless an identical call is already in flight
+
+        Args:
+            key: Cache key identifying interchangeable calls (see make_key)
+            fn: Zero-argument callable doing the upstream call
+            timeout: Max seconds a follower waits for the leader (defaults
+                to the instance timeout; the leader itself is not interrupted)
+
+        Returns:
+            Whatever fn() returned
+
+        Raises:
+            TimeoutError: A follower waited longer than timeout
+            Exception: Whatever fn() raised
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            wait = self.timeout if timeout is None else timeout
+            try:
+                return future.result(timeout=wait)
+            except FutureTimeoutError:
+                raise TimeoutError(f"Timed out after {wait}s waiting for an identical in-flight call")
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    async def do_async(self, key, fn, timeout=None):
+        """
+        Async version of do(): fn is a zero-argument coroutine function
+
+        Followers await the leader's result without blocking their event loop.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            wait = self.timeout if timeout is None else timeout
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), wait)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timed out after {wait}s waiting for an identical in-flight call")
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self):
+        """Upstream calls made vs calls served from another caller's flight"""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight))
@@ -0,0 +1,180 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from voice_of_the_doctor import text_to_speech
+from job_queue import JobFailed
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_JOBS = 500
+# Published audio outlives its job (other processes, restarts); older files are swept
+DEFAULT_PUBLISHED_MAX_AGE = 24 * 60 * 60
+SWEEP_INTERVAL = 60 * 60
+
+
+class SpeechJobManager:
+    """
+    Background voice synthesis for consultation results
+
+    Speech is no longer generated inside the consultation: the text result
+    is shown first and synthesis is submitted here (on demand, when the user
+    asks to hear it). Jobs are keyed by result id, so repeated requests for
+    the same result share one job. The oldest finished jobs are dropped, and
+    their audio files deleted, once more than max_jobs are held.
+
+    With publish_dir set, finished audio is moved there under a name derived
+    from its content hash, so it can be served from a stable URL that
+    browsers cache (see streamlit_app.py); identical audio shares one file.
+
+    With job_client set (job_queue.enabled), synthesis runs as a "tts" job
+    on the queue workers and this manager only waits for the file.
+
+    Published files no job of this process refers to (left by a restart or
+    another process) are deleted once older than published_max_age, at
+    startup and then at most every SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, output_dir="temp_docs", workers=DEFAULT_WORKERS, max_jobs=DEFAULT_MAX_JOBS, publish_dir=None,
+                 job_client=None, job_timeout=None, published_max_age=DEFAULT_PUBLISHED_MAX_AGE):
+        self.output_dir = output_dir
+        self.publish_dir = publish_dir
+        self.max_jobs = max_jobs
+        self.job_client = job_client
+        self.job_timeout = job_timeout
+        self.published_max_age = published_max_age
+        os.makedirs(output_dir, exist_ok=True)
+        if publish_dir:
+            os.makedirs(publish_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speech")
+        # Reentrant: a finished job's cleanup callback runs immediately, under the lock
+        self._lock = threading.RLock()
+        self._jobs = OrderedDict()
+        self._last_sweep = 0.0
+        self.sweep_published()
+
+    def submit(self, result_id, input_text, language, codec=None):
+        """
+        Start synthesizing a result's voice response (no-op if already started)
+
+        Args:
+            codec: Compact codec for uncompressed speech (see voice_of_the_doctor.negotiate_codec)
+
+        Returns:
+            Future: Resolves to the audio file path, or None if synthesis failed
+        """
+        with self._lock:
+            job = self._jobs.get(result_id)
+            if job is not None:
+                return job
+            # A discarded job may still be running: each submit writes its own file
+            output_filepath = os.path.join(self.output_dir, f"doctor_response_{result_id}_{uuid.uuid4().hex[:8]}.mp3")
+            job = self._executor.submit(self._synthesize, input_text, output_filepath, language, codec)
+            self._jobs[result_id] = job
+            self._trim_locked()
+        if time.time() - self._last_sweep > SWEEP_INTERVAL:
+            self.sweep_published()
+        return job
+
+    def get(self, result_id):
+        """The job for a result, or None if synthesis was never requested"""
+        with self._lock:
+            return self._jobs.get(result_id)
+
+    def discard(self, result_id):
+        """Cancel a pending job or delete a finished job's audio"""
+        with self._lock:
+            job = self._jobs.pop(result_id, None)
+        if job is not None:
+            self._cleanup(job)
+
+    def sweep_published(self):
+        """
+        Delete published audio older than published_max_age that no job refers to
+
+        Returns:
+            int: Number of files deleted
+        """
+        self._last_sweep = time.time()
+        if not self.publish_dir:
+            return 0
+        with self._lock:
+            in_use = {job.result() for job in self._jobs.values()
+                      if job.done() and not job.cancelled() and job.exception() is None}
+        cutoff = time.time() - self.published_max_age
+        removed = 0
+        try:
+            entries = list(os.scandir(self.publish_dir))
+        except OSError as e:
+            logging.warning(f"Could not sweep {self.publish_dir}: {str(e)}")
+            return 0
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.path not in in_use and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                continue  # Removed meanwhile by another process
+        if removed:
+            logging.info(f"Swept {removed} published speech files older than {self.published_max_age}s")
+        return removed
+
+    def stats(self):
+        """Jobs waiting for a worker, being synthesized and finished"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        running = sum(1 for job in jobs if job.running())
+        done = sum(1 for job in jobs if job.done())
+        return {"queued": len(jobs) - running - done, "running": running, "done": done}
+
+    def _synthesize(self, input_text, output_filepath, language, codec):
+        if self.job_client is not None:
+            path = self._synthesize_on_queue(input_text, output_filepath, language, codec)
+        else:
+            path = text_to_speech(input_text, output_filepath, language, codec)
+        if path is None or not self.publish_dir:
+            return path
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:32]
+        published = os.path.join(self.publish_dir, f"{digest}{os.path.splitext(path)[1]}")
+        os.replace(path, published)
+        return published
+
+    def _synthesize_on_queue(self, input_text, output_filepath, language, codec):
+        payload = {"input_text": input_text, "output_filepath": output_filepath, "language": language, "codec": codec}
+        try:
+            return self.job_client.run("tts", "tts", payload, timeout=self.job_timeout)
+        except (JobFailed, TimeoutError) as e:
+            logging.error(f"Speech job failed: {str(e)}")
+            return None
+
+    def _trim_locked(self):
+        finished = [rid for rid, job in self._jobs.items() if job.done()]
+        while len(self._jobs) > self.max_jobs and finished:
+            self._cleanup(self._jobs.pop(finished.pop(0)))
+
+    def _cleanup(self, job):
+        if job.cancel():
+            return
+        # Remove the file once the job finishes (immediately if it already has)
+        job.add_done_callback(self._remove_output)
+
+    def _remove_output(self, job):
+        try:
+            path = job.result()
+        except Exception:
+            return
+        with self._lock:
+            # Published audio is shared by every result with the same speech
+            if any(other.done() and not other.cancelled() and other.exception() is None and other.result() == path
+                   for other in self._jobs.values()):
+                return
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not remove speech file {path}: {str(e)}")
@@ -1,20 +1,53 @@
 import os
+import time
+import uuid
+import asyncio
+import threading
+from queue import Queue, Empty
 import streamlit as st
-from dotenv import load_dotenv
 from audio_recorder_streamlit import audio_recorder
-from datetime import datetime
 
-from brain_of_the_doctor import encode_image, analyze_image_with_query
-from voice_of_the_patient import transcribe_with_groq
-from voice_of_the_doctor import text_to_speech_with_gtts
+from brain_of_the_doctor import prepare_images, analyze_images_result, chat_flight
+from voice_of_the_patient import transcribe_result, transcribe_result_async, stt_flight
+from voice_of_the_doctor import tts_flight, negotiate_codec, AUDIO_MIME_TYPES
+from speech_jobs import SpeechJobManager
+from report_renderer import (
+    ReportJobManager, report_from_results, report_filename, pdf_available, FORMATS as REPORT_FORMATS
+)
+from prefetch import SpeculativePrefetcher
+from single_flight import make_key
+from job_queue import SQLiteBroker, JobClient, JobFailed
+from session_media import SessionMediaManager, MediaQuotaExceeded
+from consultation_store import ConsultationStore
+from consultation_search import ConsultationSearch
+from semantic_cache import SemanticResponseCache
+from usage_accounting import get_usage_meter
+from model_router import model_router
+from response_shaping import generation_limits, spoken_summary
+from structured_output import parse_sections, render_markdown
+from pipeline import Pipeline, StageResult
+from text_normalization import clean_text
+from image_quality import assess_file
+from health import health_monitor
+from config import get_config, on_reload
+from cassette import install_from_config as install_cassette
 
-load_dotenv()
+# Configuration (config.yaml, the APP_PROFILE profile and environment overrides;
+# see config.py). Read on every script run, so per-run values hot-reload; the
+# cached resources below keep the values they were created with.
+config = get_config()
+GROQ_API_KEY = config.groq.api_key
+OUTPUT_AUDIO_PATH = config.paths.output_audio
+REPORT_PDF = config.reports.pdf in ("auto", "true") and pdf_available()
 
-# Configuration
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-OUTPUT_AUDIO_PATH = os.getenv("OUTPUT_AUDIO_PATH", "temp_docs/doctor_response.mp3")
-PATIENT_AUDIO_PATH = os.getenv("PATIENT_AUDIO_PATH", "temp_docs/patient_audio.wav")
-PATIENT_IMAGE_PATH = os.getenv("PATIENT_IMAGE_PATH", "temp_docs/patient_image.png")
+# Voice responses are published under content-hash names in Streamlit's static
+# directory when static serving is on (.streamlit/config.toml): the browser
+# gets a stable, cacheable URL with range requests instead of the audio bytes
+# being re-read and re-registered on every rerun
+STATIC_AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "voice")
+STATIC_AUDIO_BASE = st.get_option("server.baseUrlPath").strip("/")
+STATIC_AUDIO_URL = f"/{STATIC_AUDIO_BASE}/app/static/voice" if STATIC_AUDIO_BASE else "/app/static/voice"
+STATIC_AUDIO = bool(st.get_option("server.enableStaticServing"))
 
 # Ensure output directory exists
 os.makedirs("temp_docs", exist_ok=True)
@@ -27,6 +60,21 @@ LANGUAGE_CONFIG = {
         "code": "en",
         "whisper_lang": "en",
         "gtts_lang": "en",
+        # Labels for each input in the prompt sent to the model
+        "prompt_labels": {
+            "voice": "[Voice Description]",
+            "text": "[Written Description]",
+            "none": "Patient has not described specific symptoms. Please analyze the image for any visible medical conditions."
+        },
+        # Photo quality problems found by the local check (image_quality.py)
+        "image_issues": {
+            "unreadable": "unreadable",
+            "too_small": "too small",
+            "blurry": "blurry",
+            "too_dark": "too dark",
+            "too_bright": "overexposed",
+            "low_contrast": "no visible detail"
+        },
         "ui": {
             "title": "🩺 AI Medical Assistant",
             "subtitle": "Powered by Advanced AI • Allopathy | Homeopathy | Ayurveda",
@@ -37,7 +85,7 @@ LANGUAGE_CONFIG = {
             "image_label": "Image",
             "voice_label": "Voice",
             "text_label": "Text",
-            "upload_image": "Upload medical image:",
+            "upload_image": "Upload medical image(s):",
             "record_symptoms": "Record symptoms:",
             "type_symptoms": "Type symptoms:",
             "text_placeholder": "E.g., I have been experiencing headaches for 3 days, along with mild fever and body ache...",
@@ -51,6 +99,11 @@ LANGUAGE_CONFIG = {
             "input_summary": "📊 Input Summary",
             "image_provided": "✅ Image provided",
             "no_image": "⭕ No image",
+            "images_unclear": "⚠️ Photos unclear",
+            "image_quality_skip": "⚠️ {count} photo(s) are not clear enough and will be skipped. Retake them in good light and in focus for a visual assessment.",
+            "image_quality_warn": "⚠️ {count} photo(s) may not be clear enough for a reliable visual assessment. Consider retaking them in good light and in focus.",
+            "images_unusable": "⚠️ The photos are not clear enough to analyze. Retake them, or describe your symptoms by voice or text.",
+            "images_skipped": "📷 Unclear photos skipped; analyzing your description only...",
             "voice_recorded": "✅ Voice recorded",
             "no_voice": "⭕ No voice",
             "text_provided": "✅ Text provided",
@@ -58,11 +111,17 @@ LANGUAGE_CONFIG = {
             "warning_no_input": "⚠️ Please provide at least **one** type of input (image, voice, or text) to get a consultation.",
             "get_consultation": "🔍 Get {specialty} Consultation",
             "transcribing": "🎤 Transcribing voice input...",
+            "transcription_failed": "⚠️ The voice recording could not be transcribed; continuing with your other inputs.",
+            "voice_not_transcribed": "⚠️ Your voice recording could not be transcribed.",
             "processing_text": "📝 Processing text input...",
             "analyzing_image": "🔍 {icon} Analyzing image from {specialty} perspective...",
             "analyzing_symptoms": "🔍 {icon} Analyzing symptoms from {specialty} perspective...",
             "generating_voice": "🔊 Generating voice response...",
+            "play_voice": "▶️ Play Voice Response",
+            "voice_unavailable": "⚠️ Voice response could not be generated.",
             "consultation_complete": "✅ Consultation Complete!",
+            "consultation_failed": "❌ The consultation could not be completed",
+            "analysis_failed": "The doctor could not answer right now. Please try again in a moment.",
             "consultation_results": "📋 {icon} {specialty} Consultation Results",
             "inputs_used": "Inputs used:",
             "your_symptoms": "📝 Your Described Symptoms",
@@ -70,6 +129,7 @@ LANGUAGE_CONFIG = {
             "voice_response": "🔊 Voice Response",
             "new_consultation": "🔄 New Consultation",
             "download_report": "📥 Download Report",
+            "download_report_pdf": "📄 Download PDF",
             "consulting": "🔬 Consulting {doctor_name}...",
             "currently_consulting": "Currently consulting with:",
             "select_language": "🌐 Select Language",
@@ -84,6 +144,19 @@ LANGUAGE_CONFIG = {
         "code": "hi",
         "whisper_lang": "hi",
         "gtts_lang": "hi",
+        "prompt_labels": {
+            "voice": "[आवाज़ विवरण]",
+            "text": "[लिखित विवरण]",
+            "none": "मरीज ने विशिष्ट लक्षण नहीं बताए हैं। कृपया किसी भी दिखाई देने वाली चिकित्सा स्थिति के लिए छवि का विश्लेषण करें।"
+        },
+        "image_issues": {
+            "unreadable": "पढ़ने योग्य नहीं",
+            "too_small": "बहुत छोटी",
+            "blurry": "धुंधली",
+            "too_dark": "बहुत अंधेरी",
+            "too_bright": "बहुत ज़्यादा रोशनी",
+            "low_contrast": "कोई स्पष्ट विवरण नहीं"
+        },
         "ui": {
             "title": "🩺 AI चिकित्सा सहायक",
             "subtitle": "उन्नत AI द्वारा संचालित • एलोपैथी | होम्योपैथी | आयुर्वेद",
@@ -94,7 +167,7 @@ LANGUAGE_CONFIG = {
             "image_label": "छवि",
             "voice_label": "आवाज़",
             "text_label": "टेक्स्ट",
-            "upload_image": "चिकित्सा छवि अपलोड करें:",
+            "upload_image": "चिकित्सा छवि(यां) अपलोड करें:",
             "record_symptoms": "लक्षण रिकॉर्ड करें:",
             "type_symptoms": "लक्षण टाइप करें:",
             "text_placeholder": "उदाहरण: मुझे 3 दिनों से सिरदर्द हो रहा है, साथ में हल्का बुखार और बदन दर्द भी है...",
@@ -108,6 +181,11 @@ LANGUAGE_CONFIG = {
             "input_summary": "📊 इनपुट सारांश",
             "image_provided": "✅ छवि प्रदान की गई",
             "no_image": "⭕ कोई छवि नहीं",
+            "images_unclear": "⚠️ फ़ोटो अस्पष्ट",
+            "image_quality_skip": "⚠️ {count} फ़ोटो पर्याप्त स्पष्ट नहीं हैं और छोड़ दी जाएंगी। दृश्य मूल्यांकन के लिए उन्हें अच्छी रोशनी में, फ़ोकस के साथ दोबारा लें।",
+            "image_quality_warn": "⚠️ {count} फ़ोटो विश्वसनीय दृश्य मूल्यांकन के लिए पर्याप्त स्पष्ट नहीं हो सकतीं। उन्हें अच्छी रोशनी में, फ़ोकस के साथ दोबारा लेने पर विचार करें।",
+            "images_unusable": "⚠️ फ़ोटो विश्लेषण के लिए पर्याप्त स्पष्ट नहीं हैं। उन्हें दोबारा लें, या अपने लक्षण आवाज़ या टेक्स्ट से बताएं।",
+            "images_skipped": "📷 अस्पष्ट फ़ोटो छोड़ दी गईं; केवल आपके विवरण का विश्लेषण कर रहे हैं...",
             "voice_recorded": "✅ आवाज़ रिकॉर्ड की गई",
             "no_voice": "⭕ कोई आवाज़ नहीं",
             "text_provided": "✅ टेक्स्ट प्रदान किया गया",
@@ -115,11 +193,17 @@ LANGUAGE_CONFIG = {
             "warning_no_input": "⚠️ कृपया परामर्श प्राप्त करने के लिए कम से कम **एक** प्रकार का इनपुट (छवि, आवाज़, या टेक्स्ट) प्रदान करें।",
             "get_consultation": "🔍 {specialty} परामर्श प्राप्त करें",
             "transcribing": "🎤 आवाज़ इनपुट को ट्रांसक्राइब कर रहे हैं...",
+            "transcription_failed": "⚠️ आवाज़ रिकॉर्डिंग ट्रांसक्राइब नहीं हो सकी; आपके अन्य इनपुट के साथ जारी है।",
+            "voice_not_transcribed": "⚠️ आपकी आवाज़ रिकॉर्डिंग ट्रांसक्राइब नहीं हो सकी।",
             "processing_text": "📝 टेक्स्ट इनपुट प्रोसेस कर रहे हैं...",
             "analyzing_image": "🔍 {icon} {specialty} दृष्टिकोण से छवि का विश्लेषण कर रहे हैं...",
             "analyzing_symptoms": "🔍 {icon} {specialty} दृष्टिकोण से लक्षणों का विश्लेषण कर रहे हैं...",
             "generating_voice": "🔊 आवाज़ प्रतिक्रिया उत्पन्न कर रहे हैं...",
+            "play_voice": "▶️ आवाज़ प्रतिक्रिया सुनें",
+            "voice_unavailable": "⚠️ आवाज़ प्रतिक्रिया उत्पन्न नहीं हो सकी।",
             "consultation_complete": "✅ परामर्श पूर्ण!",
+            "consultation_failed": "❌ परामर्श पूरा नहीं हो सका",
+            "analysis_failed": "डॉक्टर अभी उत्तर नहीं दे सके। कृपया थोड़ी देर बाद फिर से प्रयास करें।",
             "consultation_results": "📋 {icon} {specialty} परामर्श परिणाम",
             "inputs_used": "उपयोग किए गए इनपुट:",
             "your_symptoms": "📝 आपके बताए गए लक्षण",
@@ -127,6 +211,7 @@ LANGUAGE_CONFIG = {
             "voice_response": "🔊 आवाज़ प्रतिक्रिया",
             "new_consultation": "🔄 नया परामर्श",
             "download_report": "📥 रिपोर्ट डाउनलोड करें",
+            "download_report_pdf": "📄 PDF डाउनलोड करें",
             "consulting": "🔬 {doctor_name} से परामर्श कर रहे हैं...",
             "currently_consulting": "वर्तमान में परामर्श कर रहे हैं:",
             "select_language": "🌐 भाषा चुनें",
@@ -137,6 +222,11 @@ LANGUAGE_CONFIG = {
     }
 }
 
+for _language, _codes in config.languages.items():
+    if _language in LANGUAGE_CONFIG:
+        LANGUAGE_CONFIG[_language]["whisper_lang"] = _codes.whisper
+        LANGUAGE_CONFIG[_language]["gtts_lang"] = _codes.tts
+
 # Doctor type prompts - Updated for flexible input and multi-language
 DOCTOR_PROMPTS = {
     "allopathy": {
@@ -580,19 +670,199 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Record or replay model traffic for offline tests and benchmarks (cassette.mode, off by default)
+@st.cache_resource
+def get_cassette():
+    return install_cassette(config)
+
+cassette = get_cassette()
+
+# Shared media store for all sessions (images and recordings live here, not in session state)
+@st.cache_resource
+def get_media_manager():
+    return SessionMediaManager(
+        spill_dir=config.paths.media_dir,
+        session_quota=config.media.session_quota_mb * 1024 * 1024,
+        global_quota=config.media.global_quota_mb * 1024 * 1024,
+        spill_threshold=config.media.spill_threshold_mb * 1024 * 1024,
+        idle_timeout=config.media.idle_timeout_min * 60
+    )
+
+media = get_media_manager()
+
+# Consultation history, written in the background off the request path
+@st.cache_resource
+def get_consultation_store():
+    return ConsultationStore(db_path=config.paths.consultation_db)
+
+consultation_store = get_consultation_store()
+
+# Search index over the history, updated incrementally as consultations are written
+@st.cache_resource
+def get_consultation_search():
+    return ConsultationSearch(consultation_store)
+
+consultation_search = get_consultation_search()
+
+# Similarity cache for text-only consultations (shadow mode only measures)
+@st.cache_resource
+def get_response_cache():
+    cache = SemanticResponseCache(mode=config.cache.semantic_mode, threshold=config.cache.semantic_threshold)
+
+    def apply_config(new, old):
+        cache.mode = new.cache.semantic_mode
+        cache.threshold = new.cache.semantic_threshold
+
+    on_reload(apply_config)
+    return cache
+
+response_cache = get_response_cache()
+
+# Optional job queue: transcription, analysis and speech run on separate worker processes
+@st.cache_resource
+def get_job_client():
+    if not config.job_queue.enabled:
+        return None
+    return JobClient(SQLiteBroker(config.paths.jobs_db))
+
+job_client = get_job_client()
+
+# Voice responses are synthesized in the background, after the text is shown
+@st.cache_resource
+def get_speech_jobs():
+    return SpeechJobManager(
+        output_dir=os.path.dirname(OUTPUT_AUDIO_PATH) or "temp_docs",
+        workers=config.concurrency.speech_workers,
+        max_jobs=config.concurrency.max_speech_jobs,
+        publish_dir=STATIC_AUDIO_DIR if STATIC_AUDIO else None,
+        job_client=job_client,
+        job_timeout=config.job_queue.timeout_seconds
+    )
+
+speech_jobs = get_speech_jobs()
+
+# Shareable reports are rendered off the script run and cached by result id
+@st.cache_resource
+def get_report_jobs():
+    return ReportJobManager(workers=config.concurrency.report_workers, max_reports=config.concurrency.max_reports)
+
+report_jobs = get_report_jobs()
+
+# Transcription and image preprocessing start as soon as each input is ready
+@st.cache_resource
+def get_prefetcher():
+    return SpeculativePrefetcher(max_results=config.concurrency.prefetch_max_results)
+
+prefetcher = get_prefetcher()
+
+# Token/audio accounting and per-specialty budgets (shared with the model calls)
+usage_meter = get_usage_meter()
+
+# Liveness/readiness probes and saturation gauges for the load balancer and autoscaler
+@st.cache_resource
+def get_health_monitor():
+    health_monitor.add_metrics("model_calls", lambda: {
+        "chat": chat_flight.stats(), "stt": stt_flight.stats(), "tts": tts_flight.stats()
+    })
+    health_monitor.add_metrics("speech_jobs", speech_jobs.stats)
+    health_monitor.add_metrics("prefetch", prefetcher.stats)
+    health_monitor.add_metrics("media", media.memory_usage)
+    health_monitor.add_metrics("models", model_router.stats)
+    if job_client is not None:
+        health_monitor.add_metrics("job_queue", job_client.broker.depth)
+    if cassette is not None:
+        health_monitor.add_metrics("cassette", lambda: {"mode": cassette.mode, **cassette.stats})
+    health_monitor.start()
+    return health_monitor
+
+get_health_monitor()
+
+def run_stage(queue, task_name, payload, inline):
+    """
+    Run a pipeline stage on the job queue workers when enabled, otherwise in this process
+
+    Queue results are polled by the client's background thread; the run
+    waits on the job's Future the way it waits on an inline model call.
+
+    Returns:
+        StageResult: inline() returns one too; a job's result is an answer
+            even if its text starts with "Error"
+    """
+    if job_client is None:
+        return inline()
+    try:
+        result = job_client.run(queue, task_name, payload, timeout=config.job_queue.timeout_seconds)
+    except (JobFailed, TimeoutError) as e:
+        return StageResult.failure(queue, f"Error processing your request: {str(e)}")
+    return StageResult.success(queue, result)
+
+def stream_sections(compute, placeholder, language, on_summary=None):
+    """
+    Run compute(on_section) off the script thread, rendering structured sections as they complete
+
+    on_summary(text) is called as soon as the spoken summary is complete,
+    so voice synthesis can start while the rest is still being generated.
+    Sections only stream for inline analysis; job queue workers and cache
+    hits return the whole answer at once.
+    """
+    sections = Queue()
+    outcome = {}
+
+    def run():
+        try:
+            outcome["response"] = compute(lambda name, value: sections.put((name, value)))
+        except Exception as e:
+            outcome["error"] = e
+
+    worker = threading.Thread(target=run, name="structured-analysis", daemon=True)
+    worker.start()
+    shown = {}
+    while worker.is_alive() or not sections.empty():
+        try:
+            name, value = sections.get(timeout=0.05)
+        except Empty:
+            continue
+        shown[name] = value
+        placeholder.markdown(render_markdown(shown, language))
+        if name == "spoken_summary" and value and on_summary:
+            on_summary(value)
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["response"]
+
+def check_images(image_keys):
+    """
+    Local quality check of each uploaded photo (images.quality_gate), by image key
+
+    Results are kept per content hash, so each upload is decoded and checked
+    once. With the gate off every photo passes.
+    """
+    if config.images.quality_gate == "off":
+        return {key: {"ok": True, "issues": []} for key in image_keys}
+    checks = st.session_state.image_quality
+    results = {}
+    for key in image_keys:
+        digest = media.digest(session_id, key)
+        if digest not in checks:
+            checks[digest] = assess_file(media.path(session_id, key))
+        results[key] = checks[digest]
+    return results
+
 # Initialize session state
-if "recorded_audio" not in st.session_state:
-    st.session_state.recorded_audio = None
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 if "audio_saved" not in st.session_state:
     st.session_state.audio_saved = False
 if "analysis_done" not in st.session_state:
     st.session_state.analysis_done = False
 if "results" not in st.session_state:
     st.session_state.results = None
-if "uploaded_image_data" not in st.session_state:
-    st.session_state.uploaded_image_data = None
 if "image_saved" not in st.session_state:
     st.session_state.image_saved = False
+if "image_keys" not in st.session_state:
+    st.session_state.image_keys = []
+if "image_quality" not in st.session_state:
+    st.session_state.image_quality = {}
 if "selected_doctor" not in st.session_state:
     st.session_state.selected_doctor = "allopathy"
 if "text_symptoms" not in st.session_state:
@@ -602,6 +872,18 @@ if "text_saved" not in st.session_state:
 if "selected_language" not in st.session_state:
     st.session_state.selected_language = "english"
 
+session_id = st.session_state.session_id
+media.touch(session_id)
+
+# Media may have been evicted while the session sat idle
+if st.session_state.image_saved and any(media.path(session_id, k) is None for k in st.session_state.image_keys):
+    for key in st.session_state.image_keys:
+        media.discard(session_id, key)
+    st.session_state.image_keys = []
+    st.session_state.image_saved = False
+if st.session_state.audio_saved and media.path(session_id, "audio") is None:
+    st.session_state.audio_saved = False
+
 # Helper function to get UI text
 def get_ui_text(key):
     return LANGUAGE_CONFIG[st.session_state.selected_language]["ui"].get(key, key)
@@ -646,6 +928,8 @@ with col_lang2:
 
 # Get current language config
 lang_config = LANGUAGE_CONFIG[st.session_state.selected_language]
+# Speech codec this browser plays best (Opus, MP3 for Safari; see tts.audio_codec)
+voice_codec = negotiate_codec(st.context.headers.get("User-Agent"))
 ui = lang_config["ui"]
 
 # Header
@@ -774,21 +1058,35 @@ with col1:
     
     if not st.session_state.image_saved:
         st.markdown(f"**{ui['upload_image']}**")
-        uploaded_image = st.file_uploader(
-            "Choose an image",
+        uploaded_images = st.file_uploader(
+            "Choose images",
             type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
             label_visibility="collapsed",
             key="image_uploader"
         )
         
-        if uploaded_image:
-            st.session_state.uploaded_image_data = uploaded_image.getvalue()
-            with open(PATIENT_IMAGE_PATH, "wb") as f:
-                f.write(st.session_state.uploaded_image_data)
-            st.session_state.image_saved = True
-            st.rerun()
+        if uploaded_images:
+            image_keys = []
+            try:
+                for i, uploaded_image in enumerate(uploaded_images[:config.media.max_upload_images]):
+                    key = f"image_{i}"
+                    media.put(
+                        session_id,
+                        key,
+                        uploaded_image.getvalue(),
+                        suffix=os.path.splitext(uploaded_image.name)[1].lower()
+                    )
+                    image_keys.append(key)
+                st.session_state.image_keys = image_keys
+                st.session_state.image_saved = True
+                st.rerun()
+            except MediaQuotaExceeded as e:
+                for key in image_keys:
+                    media.discard(session_id, key)
+                st.error(str(e))
         else:
-            st.caption("📤 JPG, JPEG, PNG")
+            st.caption(f"📤 JPG, JPEG, PNG (max {config.media.max_upload_images})")
             st.markdown(f"""
             <div class="status-badge status-optional">
                 ⭕ {ui['optional']}
@@ -800,15 +1098,29 @@ with col1:
             {ui['image_ready']}
         </div>
         """, unsafe_allow_html=True)
-        st.image(st.session_state.uploaded_image_data, caption="Uploaded", use_container_width=True)
+        image_checks = check_images(st.session_state.image_keys)
+        st.image(
+            [media.get(session_id, k) for k in st.session_state.image_keys],
+            caption=[
+                "Uploaded" if image_checks[k]["ok"]
+                else "⚠️ " + ", ".join(lang_config["image_issues"][issue] for issue in image_checks[k]["issues"])
+                for k in st.session_state.image_keys
+            ],
+            use_container_width=True
+        )
+        unclear_images = sum(1 for check in image_checks.values() if not check["ok"])
+        if unclear_images:
+            quality_message = "image_quality_skip" if config.images.quality_gate == "reject" else "image_quality_warn"
+            st.warning(ui[quality_message].format(count=unclear_images))
         
         if st.button(ui['change'], key="change_image", use_container_width=True):
-            st.session_state.uploaded_image_data = None
+            for key in st.session_state.image_keys:
+                media.discard(session_id, key)
+            st.session_state.image_keys = []
+            st.session_state.image_quality = {}
             st.session_state.image_saved = False
             st.session_state.analysis_done = False
             st.session_state.results = None
-            if os.path.exists(PATIENT_IMAGE_PATH):
-                os.remove(PATIENT_IMAGE_PATH)
             st.rerun()
 
 # Column 2: Voice Input
@@ -834,11 +1146,12 @@ with col2:
         st.caption("🔴 Click to record" if st.session_state.selected_language == "english" else "🔴 रिकॉर्ड करने के लिए क्लिक करें")
         
         if audio_bytes:
-            st.session_state.recorded_audio = audio_bytes
-            with open(PATIENT_AUDIO_PATH, "wb") as f:
-                f.write(st.session_state.recorded_audio)
-            st.session_state.audio_saved = True
-            st.rerun()
+            try:
+                media.put(session_id, "audio", audio_bytes, suffix=".wav")
+                st.session_state.audio_saved = True
+                st.rerun()
+            except MediaQuotaExceeded as e:
+                st.error(str(e))
         else:
             st.markdown(f"""
             <div class="status-badge status-optional">
@@ -851,15 +1164,13 @@ with col2:
             {ui['audio_ready']}
         </div>
         """, unsafe_allow_html=True)
-        st.audio(st.session_state.recorded_audio, format="audio/wav")
+        st.audio(media.get(session_id, "audio"), format="audio/wav")
         
         if st.button(ui['rerecord'], key="record_again", use_container_width=True):
-            st.session_state.recorded_audio = None
+            media.discard(session_id, "audio")
             st.session_state.audio_saved = False
             st.session_state.analysis_done = False
             st.session_state.results = None
-            if os.path.exists(PATIENT_AUDIO_PATH):
-                os.remove(PATIENT_AUDIO_PATH)
             st.rerun()
 
 # Column 3: Text Input
@@ -905,10 +1216,46 @@ with col3:
 
 st.markdown("<hr>", unsafe_allow_html=True)
 
+# Photos that fail the local quality check never reach the vision model when
+# images.quality_gate is "reject"; with none left the consultation is text-only
+analysis_image_keys = []
+if st.session_state.image_saved:
+    image_checks = check_images(st.session_state.image_keys)
+    analysis_image_keys = [
+        k for k in st.session_state.image_keys
+        if image_checks[k]["ok"] or config.images.quality_gate != "reject"
+    ]
+
+# Speculative prefetch: the consultation will need the transcript and the
+# encoded images, so start on them now and let the click wait only for the
+# model. Work is keyed by content; a changed or discarded input cancels its
+# old job. Skipped with the job queue, whose workers run these stages.
+stt_prefetch_key = None
+images_prefetch_key = None
+if config.prefetch.enabled and job_client is None:
+    if st.session_state.audio_saved:
+        stt_prefetch_key = make_key("stt", config.models.stt, lang_config["whisper_lang"], media.digest(session_id, "audio"))
+        prefetcher.speculate(session_id, "stt", stt_prefetch_key, lambda: transcribe_result_async(
+            GROQ_API_KEY, media.path(session_id, "audio"), config.models.stt, lang_config["whisper_lang"],
+            usage={"specialty": st.session_state.selected_doctor, "language": st.session_state.selected_language}
+        ))
+    else:
+        prefetcher.release(session_id, "stt")
+    if analysis_image_keys:
+        prefetch_image_paths = [media.path(session_id, k) for k in analysis_image_keys]
+        images_prefetch_key = make_key("images", [media.digest(session_id, k) for k in analysis_image_keys])
+        prefetcher.speculate(
+            session_id, "images", images_prefetch_key,
+            lambda: asyncio.to_thread(prepare_images, prefetch_image_paths)
+        )
+    else:
+        prefetcher.release(session_id, "images")
+
 # Analysis section
 if not st.session_state.analysis_done:
     # Check what inputs are available
-    image_ready = st.session_state.image_saved
+    image_ready = bool(analysis_image_keys)
+    images_rejected = st.session_state.image_saved and not image_ready
     audio_ready = st.session_state.audio_saved
     text_ready = st.session_state.text_saved
     
@@ -923,6 +1270,8 @@ if not st.session_state.analysis_done:
     with col_sum1:
         if image_ready:
             st.success(ui['image_provided'])
+        elif images_rejected:
+            st.warning(ui['images_unclear'])
         else:
             st.info(ui['no_image'])
     
@@ -940,7 +1289,7 @@ if not st.session_state.analysis_done:
     
     # Warning if no input
     if not any_input_ready:
-        st.warning(ui['warning_no_input'])
+        st.warning(ui['images_unusable'] if images_rejected else ui['warning_no_input'])
     
     st.markdown("")
     
@@ -960,6 +1309,19 @@ if not st.session_state.analysis_done:
         # Combine all text inputs
         combined_symptoms = ""
         transcription_text = ""
+        image_count = 0
+        timings = {}
+        consultation_start = time.perf_counter()
+        result_id = uuid.uuid4().hex
+        structured = config.response.structured
+        # Failed stages end there: their error text never becomes symptoms or speech
+        pipeline = Pipeline()
+        usage_tags = {"specialty": st.session_state.selected_doctor, "language": st.session_state.selected_language}
+        # Over budget: shorter answers, then a cheaper model for text-only cases
+        budget_plan = usage_meter.plan(st.session_state.selected_doctor, has_image=image_ready)
+        max_tokens, stop = generation_limits(
+            st.session_state.selected_doctor, st.session_state.selected_language, budget_plan["max_tokens"], structured
+        )
         
         # Processing with status updates
         status_label = ui['consulting'].format(doctor_name=doctor_name)
@@ -968,56 +1330,165 @@ if not st.session_state.analysis_done:
             # Step 1: Transcribe audio if available
             if audio_ready:
                 st.write(ui['transcribing'])
-                transcription_text = transcribe_with_groq(
-                    GROQ_API_KEY=GROQ_API_KEY,
-                    audio_filepath=PATIENT_AUDIO_PATH,
-                    stt_model="whisper-large-v3",
-                    language=lang_config["whisper_lang"]
+                stage_start = time.perf_counter()
+                stt_payload = {
+                    "audio_filepath": media.path(session_id, "audio"),
+                    "stt_model": config.models.stt,
+                    "language": lang_config["whisper_lang"],
+                    "usage": usage_tags
+                }
+                prefetched = None
+                if stt_prefetch_key:
+                    prefetched = prefetcher.take(stt_prefetch_key, timeout=config.job_queue.timeout_seconds)
+                    if prefetched is not None and not prefetched.ok:
+                        # Failed speculatively; retry now rather than keep the error
+                        prefetcher.discard(stt_prefetch_key)
+                        prefetched = None
+                transcription = pipeline.run(
+                    "stt",
+                    lambda: prefetched if prefetched is not None else run_stage(
+                        "stt", "transcribe", stt_payload,
+                        lambda: transcribe_result(GROQ_API_KEY=GROQ_API_KEY, **stt_payload)
+                    )
                 )
-                voice_label = "[Voice Description]" if st.session_state.selected_language == "english" else "[आवाज़ विवरण]"
-                combined_symptoms += f"{voice_label}: {transcription_text} "
+                timings["transcription"] = time.perf_counter() - stage_start
+                if transcription.ok:
+                    transcription_text = transcription.value
+                    combined_symptoms += f"{lang_config['prompt_labels']['voice']}: {clean_text(transcription_text)} "
+                else:
+                    st.write(ui['transcription_failed'])
             
             # Step 2: Add text input if available
             if text_ready:
                 st.write(ui['processing_text'])
-                text_label = "[Written Description]" if st.session_state.selected_language == "english" else "[लिखित विवरण]"
-                combined_symptoms += f"{text_label}: {st.session_state.text_symptoms} "
+                combined_symptoms += f"{lang_config['prompt_labels']['text']}: {clean_text(st.session_state.text_symptoms)} "
             
             # If no symptoms described, add default message
             if not combined_symptoms.strip():
-                if st.session_state.selected_language == "english":
-                    combined_symptoms = "Patient has not described specific symptoms. Please analyze the image for any visible medical conditions."
-                else:
-                    combined_symptoms = "मरीज ने विशिष्ट लक्षण नहीं बताए हैं। कृपया किसी भी दिखाई देने वाली चिकित्सा स्थिति के लिए छवि का विश्लेषण करें।"
+                combined_symptoms = lang_config['prompt_labels']['none']
             
             # Step 3: Analyze with or without image
+            stage_start = time.perf_counter()
+            llm_models = model_router.choose(
+                has_image=image_ready,
+                input_chars=len(combined_symptoms),
+                language=st.session_state.selected_language,
+                specialty=st.session_state.selected_doctor
+            )
+            if budget_plan["model"]:
+                llm_models = [budget_plan["model"]] + [m for m in llm_models if m != budget_plan["model"]]
+            llm_model, fallback_models = llm_models[0], llm_models[1:]
             if image_ready:
                 st.write(ui['analyzing_image'].format(icon=doc_info['icon'], specialty=specialty))
                 system_prompt = doc_info["prompt_with_image"][st.session_state.selected_language]
-                encoded_image = encode_image(PATIENT_IMAGE_PATH)
-                doctor_response = analyze_image_with_query(
-                    query=system_prompt + combined_symptoms,
-                    encoded_image=encoded_image,
-                    model="meta-llama/llama-4-scout-17b-16e-instruct"
-                )
+                image_paths = [media.path(session_id, k) for k in analysis_image_keys]
+                image_count = len(image_paths)
+                
+                def analyze_inline(on_section=None):
+                    prepared = prefetcher.take(images_prefetch_key) if images_prefetch_key else None
+                    encoded_images, image_hashes = prepared or prepare_images(image_paths)
+                    return analyze_images_result(
+                        query=system_prompt + combined_symptoms,
+                        encoded_images=encoded_images,
+                        model=llm_model,
+                        image_hashes=image_hashes,
+                        usage=usage_tags,
+                        max_tokens=max_tokens,
+                        fallback_models=fallback_models,
+                        stop=stop,
+                        structured=structured,
+                        on_section=on_section
+                    )
+                
+                def analyze(on_section=None):
+                    return run_stage(
+                        "llm", "analyze",
+                        {"query": system_prompt + combined_symptoms, "image_paths": image_paths, "model": llm_model,
+                         "usage": usage_tags, "max_tokens": max_tokens, "fallback_models": fallback_models,
+                         "stop": stop, "structured": structured},
+                        lambda: analyze_inline(on_section)
+                    )
             else:
+                if images_rejected:
+                    st.write(ui['images_skipped'])
                 st.write(ui['analyzing_symptoms'].format(icon=doc_info['icon'], specialty=specialty))
                 system_prompt = doc_info["prompt_text_only"][st.session_state.selected_language]
-                doctor_response = analyze_image_with_query(
-                    query=system_prompt + combined_symptoms,
-                    encoded_image=None,
-                    model="meta-llama/llama-4-scout-17b-16e-instruct"
-                )
+                # Read here: session state isn't available to the thread that streams sections
+                symptoms = f"{transcription_text} {st.session_state.text_symptoms if text_ready else ''}"
+                specialty_key, language_key = st.session_state.selected_doctor, st.session_state.selected_language
+                
+                def analyze(on_section=None):
+                    # A failed analysis raises StageError through the cache, so it is never cached
+                    return StageResult.success("llm", response_cache.get_or_compute(
+                        symptoms=symptoms,
+                        compute=lambda: run_stage(
+                            "llm", "analyze",
+                            {"query": system_prompt + combined_symptoms, "image_paths": [], "model": llm_model,
+                             "usage": usage_tags, "max_tokens": max_tokens, "fallback_models": fallback_models,
+                             "stop": stop, "structured": structured},
+                            lambda: analyze_images_result(
+                                query=system_prompt + combined_symptoms,
+                                encoded_images=[],
+                                model=llm_model,
+                                usage=usage_tags,
+                                max_tokens=max_tokens,
+                                fallback_models=fallback_models,
+                                stop=stop,
+                                structured=structured,
+                                on_section=on_section
+                            )
+                        ).unwrap(),
+                        specialty=specialty_key,
+                        language=language_key,
+                        # Structured and free-form answers are cached apart
+                        model=f"{llm_model}+structured" if structured else llm_model
+                    ))
             
-            # Step 4: Generate voice response
-            st.write(ui['generating_voice'])
-            text_to_speech_with_gtts(
-                input_text=doctor_response,
-                output_filepath=OUTPUT_AUDIO_PATH,
-                language=lang_config["gtts_lang"]
-            )
+            # Summary voiced while the answer was still streaming, checked against the final answer
+            voice_started = {}
+            if structured:
+                def start_voice(summary):
+                    # The summary streams first, so speech can be ready by the time the answer is.
+                    # Only the first one is submitted (later submits for the result are no-ops).
+                    if config.tts.prefetch and "text" not in voice_started:
+                        voice_started["text"] = summary
+                        speech_jobs.submit(result_id, summary, lang_config["gtts_lang"], voice_codec)
+                
+                section_placeholder = st.empty()
+                
+                def run_analysis():
+                    return stream_sections(
+                        analyze, section_placeholder, st.session_state.selected_language, on_summary=start_voice
+                    )
+            else:
+                run_analysis = analyze
+            # With the recording as the only input, a failed transcription leaves nothing to analyze
+            voice_only = audio_ready and not (text_ready or image_ready)
+            analysis = pipeline.run("llm", run_analysis, requires=("stt",) if voice_only else ())
+            timings["analysis"] = time.perf_counter() - stage_start
+            timings["total"] = time.perf_counter() - consultation_start
             
-            status.update(label=ui['consultation_complete'], state="complete", expanded=False)
+            if analysis.ok:
+                status.update(label=ui['consultation_complete'], state="complete", expanded=False)
+            else:
+                # Voice started from a streamed summary belongs to an answer that never completed
+                speech_jobs.discard(result_id)
+                status.update(label=ui['consultation_failed'], state="error", expanded=False)
+        
+        doctor_response, sections, spoken_text = None, None, None
+        if analysis.ok:
+            doctor_response = analysis.value
+            # A structured answer is shown and stored as markdown; voice reads its summary
+            sections = parse_sections(doctor_response) if structured else None
+            if sections:
+                doctor_response = render_markdown(sections, st.session_state.selected_language)
+                spoken_text = sections["spoken_summary"] or spoken_summary(doctor_response)
+            else:
+                spoken_text = spoken_summary(doctor_response)
+            if voice_started.get("text", spoken_text) != spoken_text:
+                # The early summary came from a model that failed over to a fallback;
+                # speech is resubmitted below with the final answer's summary
+                speech_jobs.discard(result_id)
         
         # Prepare display text for symptoms
         symptoms_display = ""
@@ -1034,10 +1505,15 @@ if not st.session_state.analysis_done:
         
         # Save results to session state
         st.session_state.results = {
+            "id": result_id,
+            "created_at": time.time(),
             "transcription": transcription_text if audio_ready else "",
             "text_input": st.session_state.text_symptoms if text_ready else "",
             "symptoms_display": symptoms_display,
             "response": doctor_response,
+            "sections": sections,
+            # Voice reads a bounded summary; the full answer stays on screen
+            "spoken_text": spoken_text,
             "doctor_type": st.session_state.selected_doctor,
             "doctor_name": doctor_name,
             "doctor_icon": doc_info["icon"],
@@ -1045,9 +1521,35 @@ if not st.session_state.analysis_done:
             "has_image": image_ready,
             "has_audio": audio_ready,
             "has_text": text_ready,
-            "language": st.session_state.selected_language
+            "language": st.session_state.selected_language,
+            # Partial results: what failed is reported instead of shown as the answer
+            "errors": {stage: result.error for stage, result in pipeline.results.items() if not result.ok}
         }
+        
+        # Persist to history (non-blocking); failed consultations are kept with their errors, out of search
+        consultation_store.record({
+            "id": st.session_state.results["id"],
+            "session_id": session_id,
+            "specialty": st.session_state.selected_doctor,
+            "language": st.session_state.selected_language,
+            "has_image": image_ready,
+            "has_audio": audio_ready,
+            "has_text": text_ready,
+            "image_count": image_count,
+            "transcription": st.session_state.results["transcription"],
+            "text_input": st.session_state.results["text_input"],
+            "response": doctor_response,
+            "timings": timings,
+            "models": {"stt": config.models.stt if audio_ready else None, "llm": llm_model, "budget": budget_plan["state"]},
+            "errors": st.session_state.results["errors"] or None
+        })
         st.session_state.analysis_done = True
+        
+        # Step 4 (deferred): voice synthesis only starts up front if prefetching is enabled
+        if config.tts.prefetch and analysis.ok:
+            speech_jobs.submit(
+                st.session_state.results["id"], st.session_state.results["spoken_text"], lang_config["gtts_lang"], voice_codec
+            )
         st.rerun()
 
 # Display results if analysis is done
@@ -1080,6 +1582,8 @@ if st.session_state.analysis_done and st.session_state.results:
     else:
         no_symptoms_text = "Image-only analysis performed" if st.session_state.selected_language == "english" else "केवल छवि विश्लेषण किया गया"
         st.info(no_symptoms_text)
+    if "stt" in results.get("errors", {}):
+        st.warning(ui['voice_not_transcribed'])
     
     # Doctor's response with appropriate styling
     response_class = f"result-response-{results['doctor_type']}" if results['doctor_type'] != 'allopathy' else 'result-response'
@@ -1089,19 +1593,60 @@ if st.session_state.analysis_done and st.session_state.results:
         <div class="result-title">{assessment_title}</div>
     </div>
     """, unsafe_allow_html=True)
-    st.success(results["response"])
+    if results["response"] is None:
+        st.error(ui['analysis_failed'])
+        st.caption(results["errors"].get("llm", ""))
+    elif results.get("sections"):
+        # Warning signs stand apart from the assessment
+        st.success(render_markdown({**results["sections"], "red_flags": []}, results["language"]))
+        if results["sections"]["red_flags"]:
+            st.warning(render_markdown({"red_flags": results["sections"]["red_flags"]}, results["language"]))
+    else:
+        st.success(results["response"])
     
-    # Audio response
-    st.markdown(f"""
-    <div class="result-section result-audio">
-        <div class="result-title">{ui['voice_response']}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    # Audio response (nothing to speak when the analysis failed)
+    if results["response"] is not None:
+        st.markdown(f"""
+        <div class="result-section result-audio">
+            <div class="result-title">{ui['voice_response']}</div>
+        </div>
+        """, unsafe_allow_html=True)
+    
+        speech_job = speech_jobs.get(results["id"])
+        speech_pending = speech_job is not None and not speech_job.done()
+    
+        # Polls only while synthesis is running, without rerunning the whole page
+        @st.fragment(run_every=1.0 if speech_pending else None)
+        def voice_response():
+            job = speech_jobs.get(results["id"])
+            if job is None:
+                if st.button(ui['play_voice'], key="play_voice", use_container_width=True):
+                    speech_jobs.submit(
+                        results["id"], results["spoken_text"], LANGUAGE_CONFIG[results["language"]]["gtts_lang"], voice_codec
+                    )
+                    st.rerun()
+            elif not job.done():
+                st.info(ui['generating_voice'])
+            elif speech_pending:
+                # Just finished: full rerun to stop polling
+                st.rerun()
+            else:
+                audio_path = job.result()
+                if audio_path and os.path.exists(audio_path):
+                    audio_format = AUDIO_MIME_TYPES.get(os.path.splitext(audio_path)[1].lstrip("."), "audio/mpeg")
+                    if os.path.dirname(audio_path) == STATIC_AUDIO_DIR:
+                        audio_data = f"{STATIC_AUDIO_URL}/{os.path.basename(audio_path)}"
+                    else:
+                        with open(audio_path, "rb") as audio_file:
+                            audio_data = audio_file.read()
+                    # Autoplay once, not on every later rerun
+                    autoplay = st.session_state.get("voice_autoplayed") != results["id"]
+                    st.session_state.voice_autoplayed = results["id"]
+                    st.audio(audio_data, format=audio_format, autoplay=autoplay)
+                else:
+                    st.warning(ui['voice_unavailable'])
     
-    if os.path.exists(OUTPUT_AUDIO_PATH):
-        with open(OUTPUT_AUDIO_PATH, "rb") as audio_file:
-            audio_data = audio_file.read()
-            st.audio(audio_data, format="audio/mp3", autoplay=True)
+        voice_response()
     
     # Disclaimer based on doctor type and language
     if st.session_state.selected_language == "english":
@@ -1135,96 +1680,43 @@ col_btn1, col_btn2 = st.columns(2)
 
 with col_btn1:
     if st.button(ui['new_consultation'], use_container_width=True):
-        st.session_state.recorded_audio = None
+        # Clean up temp files
+        if st.session_state.results:
+            speech_jobs.discard(st.session_state.results["id"])
+            report_jobs.discard(st.session_state.results["id"])
+        media.clear_session(session_id)
         st.session_state.audio_saved = False
         st.session_state.analysis_done = False
         st.session_state.results = None
-        st.session_state.uploaded_image_data = None
+        st.session_state.image_keys = []
+        st.session_state.image_quality = {}
         st.session_state.image_saved = False
         st.session_state.text_symptoms = ""
         st.session_state.text_saved = False
-        # Clean up temp files
-        for filepath in [OUTPUT_AUDIO_PATH, PATIENT_AUDIO_PATH, PATIENT_IMAGE_PATH]:
-            if filepath and os.path.exists(filepath):
-                os.remove(filepath)
         st.rerun()
 
 with col_btn2:
-    if st.session_state.analysis_done and st.session_state.results:
+    if st.session_state.analysis_done and st.session_state.results and st.session_state.results["response"] is not None:
         results = st.session_state.results
         
-        # Build input methods string
-        input_methods_str = []
-        if results.get('has_image'):
-            input_methods_str.append("Image" if st.session_state.selected_language == "english" else "छवि")
-        if results.get('has_audio'):
-            input_methods_str.append("Voice" if st.session_state.selected_language == "english" else "आवाज़")
-        if results.get('has_text'):
-            input_methods_str.append("Text" if st.session_state.selected_language == "english" else "टेक्स्ट")
-        
-        if st.session_state.selected_language == "english":
-            report_content = f"""
-{'='*60}
-AI MEDICAL CONSULTATION REPORT
-{'='*60}
-
-Consultation Type: {results['doctor_name']}
-Date: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-Input Methods: {', '.join(input_methods_str)}
-Language: English
-
-{'='*60}
-PATIENT'S SYMPTOMS:
-{'='*60}
-{results.get("symptoms_display", "No symptoms described").replace("**", "").replace("🎤", "[Voice]").replace("✍️", "[Text]")}
-
-{'='*60}
-{results['doctor_icon']} {results['specialty'].upper()} ASSESSMENT:
-{'='*60}
-{results["response"]}
-
-{'='*60}
-DISCLAIMER:
-{'='*60}
-This AI assistant is for educational purposes only.
-The consultation was based on {results['specialty']} principles.
-Always consult a qualified healthcare professional for proper diagnosis and treatment.
-"""
-        else:
-            report_content = f"""
-{'='*60}
-AI चिकित्सा परामर्श रिपोर्ट
-{'='*60}
-
-परामर्श प्रकार: {results['doctor_name']}
-दिनांक: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-इनपुट विधियां: {', '.join(input_methods_str)}
-भाषा: हिंदी
-
-{'='*60}
-मरीज के लक्षण:
-{'='*60}
-{results.get("symptoms_display", "कोई लक्षण नहीं बताए गए").replace("**", "").replace("🎤", "[आवाज़]").replace("✍️", "[टेक्स्ट]")}
-
-{'='*60}
-{results['doctor_icon']} {results['specialty'].upper()} मूल्यांकन:
-{'='*60}
-{results["response"]}
-
-{'='*60}
-अस्वीकरण:
-{'='*60}
-यह AI सहायक केवल शैक्षिक उद्देश्यों के लिए है।
-परामर्श {results['specialty']} सिद्धांतों पर आधारित था।
-उचित निदान और उपचार के लिए हमेशा योग्य स्वास्थ्य पेशेवर से परामर्श करें।
-"""
-        st.download_button(
-            label=ui['download_report'],
-            data=report_content,
-            file_name=f"medical_consultation_{results['doctor_type']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-            mime="text/plain",
-            use_container_width=True
-        )
+        # Rendered in the background and served from the cache when clicked
+        speech_job = speech_jobs.get(results["id"])
+        audio_path = None
+        if speech_job is not None and speech_job.done() and not speech_job.cancelled() and not speech_job.exception():
+            audio_path = speech_job.result()
+        report = report_from_results(results, audio_path)
+        report_formats = ["html", "pdf"] if REPORT_PDF else ["html"]
+        for fmt in report_formats:
+            report_jobs.submit(report, fmt)
+            st.download_button(
+                label=ui['download_report'] if fmt == "html" else ui['download_report_pdf'],
+                data=lambda fmt=fmt: report_jobs.result(report, fmt),
+                file_name=report_filename(report, fmt),
+                mime=REPORT_FORMATS[fmt],
+                on_click="ignore",
+                key=f"download_report_{fmt}",
+                use_container_width=True
+            )
 
 # Footer
 if st.session_state.selected_language == "english":
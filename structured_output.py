@@ -0,0 +1,270 @@
+"""
+Structured (JSON) doctor responses
+
+With response.structured on, the model answers with one JSON object
+instead of free-form markdown:
+
+    {"spoken_summary": "...", "conditions": ["..."], "remedies": ["..."], "red_flags": ["..."]}
+
+Consumers then read the part they need (the voice reads spoken_summary,
+the results panel renders the lists) instead of re-processing the whole
+text. SectionStreamParser reads the object while it streams in and hands
+out each section as soon as its value is complete, so the first sections
+can be shown and spoken before the model has finished the last one.
+"""
+import json
+import logging
+
+# In the order the model is asked to write them: the summary first, so voice can start early
+SECTIONS = ("spoken_summary", "conditions", "remedies", "red_flags")
+LIST_SECTIONS = ("conditions", "remedies", "red_flags")
+
+SECTION_LABELS = {
+    "english": {
+        "conditions": "Possible conditions",
+        "remedies": "What you can do",
+        "red_flags": "See a doctor in person if",
+    },
+    "hindi": {
+        "conditions": "संभावित स्थितियाँ",
+        "remedies": "आप क्या कर सकते हैं",
+        "red_flags": "डॉक्टर से तुरंत मिलें यदि",
+    },
+}
+
+STRUCTURED_INSTRUCTIONS = (
+    "\n\nAnswer with only a JSON object, no other text, with these keys in this order: "
+    '"spoken_summary" (two or three short sentences to be read aloud: your assessment and a reassuring close), '
+    '"conditions" (list of the possible conditions, each a short phrase), '
+    '"remedies" (list of short, practical remedies or next steps), '
+    '"red_flags" (list of warning signs that need a doctor in person). '
+    "Write every value in the same language as the instructions above."
+)
+
+
+def structured_query(query):
+    """The query with the JSON answer format appended"""
+    return query + STRUCTURED_INSTRUCTIONS
+
+
+def normalize_sections(raw):
+    """
+    Coerce a parsed JSON object to the section layout
+
+    Lists become lists of non-empty strings (a single string is wrapped),
+    spoken_summary a string; unknown keys are dropped.
+
+    Returns:
+        dict: Every key in SECTIONS, or None if raw has none of them
+    """
+    if not isinstance(raw, dict) or not any(name in raw for name in SECTIONS):
+        return None
+    sections = {}
+    for name in SECTIONS:
+        sections[name] = _normalize_value(name, raw.get(name))
+    return sections
+
+
+def _normalize_value(name, value):
+    if name not in LIST_SECTIONS:
+        if isinstance(value, list):
+            value = " ".join(str(item) for item in value)
+        return str(value).strip() if value is not None else ""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = [value]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+class SectionStreamParser:
+    """
+    Incremental parser for a streamed JSON object of sections
+
+    feed() takes the text as it arrives and returns the top-level members
+    whose values have just completed; nested values are decoded only once
+    they are whole. Text before the opening brace (a code fence, a stray
+    preamble) is skipped. close() returns everything complete so far, so a
+    response cut off by max_tokens still yields its finished sections.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._finished = False
+        self._key = None
+        self._key_start = None
+        self._after_colon = False
+        self._value_start = None
+        self.sections = {}
+
+    def feed(self, chunk):
+        """
+        Parse the next piece of the response
+
+        Returns:
+            list: (section, value) pairs completed by this chunk, in order
+        """
+        completed = []
+        self._text += chunk
+        text = self._text
+        for i in range(self._pos, len(text)):
+            if self._finished:
+                break
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        if self._value_start is not None:
+                            self._complete(text[self._value_start:i + 1], completed)
+                        elif self._key_start is not None:
+                            self._key = self._decode(text[self._key_start:i + 1])
+                            self._key_start = None
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                continue
+
+            starts_value = self._depth == 1 and self._after_colon and self._value_start is None
+            if ch == '"':
+                self._in_string = True
+                if starts_value:
+                    self._value_start = i
+                elif self._depth == 1 and self._key is None:
+                    self._key_start = i
+            elif ch in "[{":
+                if starts_value:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._complete(text[self._value_start:i + 1], completed)
+                elif self._depth == 0:
+                    if self._value_start is not None:
+                        self._complete(text[self._value_start:i], completed)
+                    self._finished = True
+            elif self._depth == 1:
+                if ch == ":":
+                    self._after_colon = self._key is not None
+                elif ch == ",":
+                    if self._value_start is not None:
+                        self._complete(text[self._value_start:i], completed)
+                elif starts_value and not ch.isspace():
+                    self._value_start = i  # number, true, false or null
+        self._pos = len(text)
+        return completed
+
+    def _complete(self, value_text, completed):
+        key = self._key
+        self._key = None
+        self._after_colon = False
+        self._value_start = None
+        value = self._decode(value_text.strip())
+        if key in SECTIONS and key not in self.sections and value is not None:
+            value = _normalize_value(key, value)
+            self.sections[key] = value
+            completed.append((key, value))
+
+    @staticmethod
+    def _decode(value_text):
+        try:
+            return json.loads(value_text)
+        except ValueError:
+            return None
+
+    def close(self):
+        """
+        The sections of the whole response
+
+        Returns:
+            dict: Every key in SECTIONS (missing ones empty), or None if
+                no section was complete
+        """
+        start = self._text.find("{")
+        end = self._text.rfind("}")
+        if start != -1 and end > start:
+            try:
+                sections = normalize_sections(json.loads(self._text[start:end + 1]))
+                if sections is not None:
+                    return sections
+            except ValueError:
+                pass
+        if not self.sections:
+            return None
+        return normalize_sections(self.sections)
+
+
+def parse_sections(text):
+    """
+    The sections of a complete structured response
+
+    Returns:
+        dict: Every key in SECTIONS, or None if text is not a structured
+            response (free-form markdown, an "Error ..." string)
+    """
+    if not text or "{" not in text:
+        return None
+    parser = SectionStreamParser()
+    parser.feed(text)
+    return parser.close()
+
+
+def sections_json(sections):
+    """Serialize sections compactly, keeping non-ASCII text readable"""
+    return json.dumps(sections, ensure_ascii=False)
+
+
+def merge_sections(parts):
+    """
+    Combine the sections of several responses (best-effort merge of batch findings)
+
+    Lists are concatenated without repeats; the first non-empty spoken
+    summary is kept.
+    """
+    merged = {name: [] for name in LIST_SECTIONS}
+    merged["spoken_summary"] = ""
+    for sections in parts:
+        if not sections:
+            continue
+        if not merged["spoken_summary"]:
+            merged["spoken_summary"] = sections["spoken_summary"]
+        for name in LIST_SECTIONS:
+            merged[name] += [item for item in sections[name] if item not in merged[name]]
+    return merged
+
+
+def render_markdown(sections, language="english"):
+    """
+    The sections as markdown for the results panel, reports and search
+
+    Sections not yet available (None or missing) are left out, so partial
+    results can be rendered while the response is still streaming.
+    """
+    labels = SECTION_LABELS.get(language, SECTION_LABELS["english"])
+    parts = []
+    if sections.get("spoken_summary"):
+        parts.append(sections["spoken_summary"])
+    for name in LIST_SECTIONS:
+        items = sections.get(name)
+        if items:
+            parts.append(f"**{labels[name]}**\n" + "\n".join(f"- {item}" for item in items))
+    return "\n\n".join(parts)
+
+
+def emit_sections(on_section, sections):
+    """Call on_section(name, value) for each section, logging callback failures"""
+    for name, value in sections:
+        try:
+            on_section(name, value)
+        except Exception as e:
+            logging.warning(f"Section callback failed for {name}: {str(e)}")
@@ -0,0 +1,38 @@
+import os
+import threading
+
+import speech_jobs
+from speech_jobs import SpeechJobManager
+
+
+def test_resubmit_while_discarded_job_runs(tmp_path, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+
+    def fake_tts(input_text, output_filepath, language, codec=None):
+        with open(output_filepath, "wb") as f:
+            f.write(input_text.encode("utf-8"))
+        if input_text == "early":
+            # Hold the first job mid-synthesis, its file already written
+            started.set()
+            release.wait(5)
+        return output_filepath
+
+    monkeypatch.setattr(speech_jobs, "text_to_speech", fake_tts)
+    manager = SpeechJobManager(output_dir=str(tmp_path / "out"), workers=2, publish_dir=str(tmp_path / "pub"))
+
+    first = manager.submit("r1", "early", "en")
+    assert started.wait(5)
+    manager.discard("r1")
+    second = manager.submit("r1", "final", "en")
+    assert second is not first
+
+    final_path = second.result(5)
+    release.set()
+    first.result(5)
+
+    with open(final_path, "rb") as f:
+        assert f.read() == b"final"
+    assert manager.get("r1") is second
+    # The discarded job's audio is removed, the current one kept
+    assert os.listdir(tmp_path / "pub") == [os.path.basename(final_path)]
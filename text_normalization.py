@@ -0,0 +1,194 @@
+import re
+import unicodedata
+
+# Invisible characters that only break equality (zero-width space, word joiner, BOM, soft hyphen)
+INVISIBLE_RE = re.compile("[\u200b\u2060\ufeff\u00ad]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+PUNCTUATION_MAP = str.maketrans({
+    "‘": "'", "’": "'", "“": '"', "”": '"',
+    "–": "-", "—": "-", "…": "...",
+    "॥": "। ",  # double danda reads as a sentence end
+})
+
+# A "|" or "." typed after Devanagari text is used as a danda
+ASCII_DANDA_RE = re.compile(r"(?<=[\u0900-\u097F])\s*[|.](?=\s|$)")
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?।])\s+")
+ABBREVIATIONS = ("dr.", "mr.", "mrs.", "ms.", "vs.", "e.g.", "i.e.", "etc.", "approx.", "no.")
+
+# Word characters plus Devanagari (its vowel signs are combining marks, which \w splits on)
+TOKEN_RE = re.compile(r"[\w\u0900-\u0963\u0966-\u097F]+")
+DEVANAGARI_RE = re.compile(r"[\u0900-\u097F]")
+
+# Loose Devanagari romanization, close to how Hinglish is typed
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "v", "श": "sh",
+    "ष": "sh", "स": "s", "ह": "h", "ळ": "l",
+    "क़": "q", "ख़": "kh", "ग़": "g", "ज़": "z", "ड़": "r", "ढ़": "rh", "फ़": "f", "य़": "y",
+}
+VOWELS = {
+    "अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऑ": "o",
+}
+VOWEL_SIGNS = {
+    "ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॉ": "o",
+}
+NASALS = {"ं": "n", "ँ": "n", "ः": "h"}
+VIRAMA = "्"
+NUKTA = "़"
+DIGITS = {chr(0x0966 + i): str(i) for i in range(10)}
+
+
+def clean_text(text):
+    """
+    Canonical form of user or model text, for prompts and speech
+
+    NFC-normalizes (so precomposed and decomposed Devanagari compare equal),
+    drops invisible characters, straightens quotes and dashes, turns a "|"
+    or "." typed after Devanagari into a danda and collapses whitespace.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFC", text)
+    text = INVISIBLE_RE.sub("", text).translate(PUNCTUATION_MAP)
+    text = ASCII_DANDA_RE.sub("।", text)
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def tokenize(text):
+    """Case-folded word tokens of cleaned text; handles Devanagari and Latin script"""
+    return TOKEN_RE.findall(clean_text(text).casefold())
+
+
+def split_sentences(text):
+    """Split English or Hindi text into sentences at ., !, ? and the danda (not after abbreviations)"""
+    sentences = []
+    for piece in SENTENCE_END_RE.split(clean_text(text)):
+        if sentences and sentences[-1].casefold().endswith(ABBREVIATIONS):
+            sentences[-1] += " " + piece
+        elif piece:
+            sentences.append(piece)
+    return sentences
+
+
+def chunk_text(text, max_chars):
+    """
+    Pack sentences into chunks of at most max_chars, for sentence-wise TTS
+
+    Sentences longer than max_chars are split at commas/semicolons first,
+    then at spaces, so chunk boundaries fall on natural pauses.
+    """
+    chunks = []
+    current = ""
+    for sentence in split_sentences(text):
+        for part in _split_long(sentence, max_chars):
+            if current and len(current) + 1 + len(part) > max_chars:
+                chunks.append(current)
+                current = part
+            else:
+                current = f"{current} {part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_long(sentence, max_chars):
+    if len(sentence) <= max_chars:
+        return [sentence]
+    parts = []
+    for clause in re.split(r"(?<=[,;:])\s+", sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            parts.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if clause:
+            parts.append(clause)
+    return parts
+
+
+def transliterate(text):
+    """
+    Romanize Devanagari the way Hinglish is usually typed (बुखार -> bukhaar)
+
+    Latin text passes through unchanged. The inherent vowel is dropped at
+    the end of a word and between a vowel and a following full syllable
+    (सिरदर्द -> sirdard, खुजली -> khujlee), a simple form of Hindi schwa
+    deletion, so the output is close to a user's own spelling.
+    """
+    # Units: [kind, roman, vowel]; kind is "c" (consonant), "v" (vowel or
+    # nasal sign) or "x" (anything else); a consonant's vowel is None until
+    # its inherent vowel is resolved
+    units = []
+    chars = unicodedata.normalize("NFC", text)
+    i = 0
+    while i < len(chars):
+        ch = chars[i]
+        if i + 1 < len(chars) and chars[i + 1] == NUKTA and ch + NUKTA in CONSONANTS:
+            ch = ch + NUKTA
+            i += 1
+        nxt = chars[i + 1] if i + 1 < len(chars) else ""
+        if ch in CONSONANTS:
+            vowel = None
+            if nxt in VOWEL_SIGNS:
+                vowel = VOWEL_SIGNS[nxt]
+                i += 1
+            elif nxt == VIRAMA:
+                vowel = ""
+                i += 1
+            units.append(["c", CONSONANTS[ch], vowel])
+        elif ch in VOWELS:
+            units.append(["v", VOWELS[ch], ""])
+        elif ch in NASALS:
+            units.append(["v", NASALS[ch], ""])
+        else:
+            units.append(["x", DIGITS.get(ch, "." if ch == "।" else ch), ""])
+        i += 1
+
+    # Right to left, so the following syllable is already resolved
+    for j in range(len(units) - 1, -1, -1):
+        kind, _, vowel = units[j]
+        if kind != "c" or vowel is not None:
+            continue
+        prev = units[j - 1] if j > 0 else None
+        nxt = units[j + 1] if j + 1 < len(units) else None
+        word_start = prev is None or prev[0] == "x"
+        word_end = nxt is None or nxt[0] == "x"
+        after_vowel = prev is not None and (prev[0] == "v" or (prev[0] == "c" and prev[2] != ""))
+        before_syllable = nxt is not None and nxt[0] == "c" and bool(nxt[2])
+        if not word_start and (word_end or (after_vowel and before_syllable)):
+            units[j][2] = ""
+        else:
+            units[j][2] = "a"
+    return "".join(roman + vowel for _, roman, vowel in units)
+
+
+def _fold_spelling(word):
+    """Fold common Hinglish spelling variants: vowel length, w/v, z/j, ph/f, doubled letters"""
+    for a, b in (("aa", "a"), ("ee", "i"), ("ii", "i"), ("oo", "u"), ("uu", "u"), ("ein", "en"),
+                 ("w", "v"), ("z", "j"), ("ph", "f"), ("q", "k")):
+        word = word.replace(a, b)
+    return re.sub(r"(.)\1+", r"\1", word)
+
+
+def matching_text(text):
+    """Tokens with Devanagari romanized, so Hindi and Hinglish inputs share features"""
+    return " ".join(transliterate(t) if DEVANAGARI_RE.search(t) else t for t in tokenize(text))
+
+
+def match_key(text):
+    """
+    Transliteration-aware exact-match key
+
+    Equal for inputs that differ only in Unicode normalization, case,
+    whitespace, punctuation, script (Devanagari vs Hinglish) or common
+    Hinglish spelling variants (bukhar / bukhaar / बुखार).
+    """
+    return " ".join(_fold_spelling(t) for t in matching_text(text).split())
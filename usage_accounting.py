@@ -0,0 +1,331 @@
+import os
+import io
+import wave
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from config import get_config, on_reload
+from consultation_store import connect
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+
+# Fraction of a budget after which answers are shortened
+DEFAULT_SOFT_LIMIT = 0.8
+DEGRADED_MAX_TOKENS = 400
+EXHAUSTED_MAX_TOKENS = 250
+
+# USD per million tokens (input, output); whisper models are priced per audio hour
+MODEL_PRICES = {
+    "meta-llama/llama-4-scout-17b-16e-instruct": (0.11, 0.34),
+    "llama-3.3-70b-versatile": (0.59, 0.79),
+    "llama-3.1-8b-instant": (0.05, 0.08),
+}
+AUDIO_PRICES_PER_HOUR = {
+    "whisper-large-v3": 0.111,
+    "whisper-large-v3-turbo": 0.04,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    specialty TEXT NOT NULL,
+    language TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    audio_seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, stage, model, specialty, language)
+);
+"""
+
+COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "images", "audio_seconds")
+
+UPSERT = """
+INSERT INTO usage (day, stage, model, specialty, language, requests, prompt_tokens, completion_tokens, images, audio_seconds)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, stage, model, specialty, language) DO UPDATE SET
+    requests = requests + excluded.requests,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    images = images + excluded.images,
+    audio_seconds = audio_seconds + excluded.audio_seconds
+"""
+
+
+def wav_duration(audio_bytes):
+    """Duration in seconds of WAV audio, or None for other formats"""
+    try:
+        with wave.open(io.BytesIO(audio_bytes)) as w:
+            return w.getnframes() / float(w.getframerate())
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None
+
+
+def estimate_cost(model, prompt_tokens=0, completion_tokens=0, audio_seconds=0.0):
+    """Approximate USD cost of usage on a model (0 for unknown models)"""
+    if model in AUDIO_PRICES_PER_HOUR:
+        return AUDIO_PRICES_PER_HOUR[model] * audio_seconds / 3600.0
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+
+
+class UsageMeter:
+    """
+    Token, image and audio accounting with daily per-specialty token budgets
+
+    record() only adds to in-memory totals keyed by (day, stage, model,
+    specialty, language); a background thread upserts the accumulated
+    deltas into SQLite every flush_interval seconds. Because flushes add
+    deltas, several processes (app and job queue workers) can share one
+    database, and each refreshes the day's totals from it after flushing.
+
+    plan() turns the budget state into a degradation: past soft_limit of
+    the budget answers get a max_tokens cap, and once the budget is spent
+    text-only cases move to a cheaper model with an even shorter cap.
+    Image cases keep the vision model. A budget of 0 means unlimited.
+    """
+
+    def __init__(
+        self,
+        db_path="data/usage.db",
+        budgets=None,
+        default_budget=0,
+        soft_limit=DEFAULT_SOFT_LIMIT,
+        flush_interval=DEFAULT_FLUSH_INTERVAL
+    ):
+        self.db_path = db_path
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.soft_limit = soft_limit
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = connect(db_path)
+        self._conn.executescript(SCHEMA)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._persisted = {}
+        self._persisted_day = None
+        self._refresh_persisted()
+
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._run_flusher, name="usage-flusher", daemon=True)
+        self._flusher.start()
+
+    def record(self, stage, model, specialty=None, language=None, prompt_tokens=0,
+               completion_tokens=0, images=0, audio_seconds=0.0):
+        """
+        Add one upstream request's usage to the in-memory totals
+
+        Args:
+            stage: "llm" or "stt"
+            model: Model that served the request
+            specialty: Doctor type the request was made for
+            language: Consultation language
+            prompt_tokens, completion_tokens: From the completion's usage
+            images: Images sent with the request
+            audio_seconds: Transcribed audio duration
+        """
+        key = (_today(), stage, model, specialty or "unknown", language or "unknown")
+        with self._lock:
+            totals = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens or 0
+            totals["completion_tokens"] += completion_tokens or 0
+            totals["images"] += images or 0
+            totals["audio_seconds"] += audio_seconds or 0.0
+
+    def record_completion(self, chat_completion, model, usage=None, images=0):
+        """Record a chat completion's token usage; usage holds specialty/language tags"""
+        counts = getattr(chat_completion, "usage", None)
+        self.record(
+            "llm", model,
+            prompt_tokens=getattr(counts, "prompt_tokens", 0),
+            completion_tokens=getattr(counts, "completion_tokens", 0),
+            images=images,
+            **(usage or {})
+        )
+
+    def budget(self, specialty):
+        """Daily token budget for a specialty (0 = unlimited)"""
+        return self.budgets.get(specialty, self.default_budget)
+
+    def tokens_used(self, specialty, day=None):
+        """Tokens spent today by a specialty, including unflushed usage"""
+        day = day or _today()
+        with self._lock:
+            if self._persisted_day != day:
+                persisted = 0
+            else:
+                persisted = self._persisted.get(specialty, 0)
+            # Rows being flushed stay counted until the refreshed totals include them
+            pending = sum(
+                t["prompt_tokens"] + t["completion_tokens"]
+                for rows in (self._pending, self._flushing)
+                for (d, _, _, s, _), t in rows.items()
+                if d == day and s == specialty
+            )
+        return persisted + pending
+
+    def plan(self, specialty, has_image=False):
+        """
+        How to serve the next request for a specialty within its budget
+
+        Once the budget is spent, text-only consultations switch to the
+        small text model (models.text_small).
+
+        Returns:
+            dict: state ("ok", "soft" or "exhausted"), model (override or
+                None to keep the default) and max_tokens (cap or None)
+        """
+        budget = self.budget(specialty)
+        if not budget:
+            return {"state": "ok", "model": None, "max_tokens": None}
+        used = self.tokens_used(specialty)
+        if used >= budget:
+            return {
+                "state": "exhausted",
+                "model": None if has_image else get_config().models.text_small,
+                "max_tokens": EXHAUSTED_MAX_TOKENS
+            }
+        if used >= self.soft_limit * budget:
+            return {"state": "soft", "model": None, "max_tokens": DEGRADED_MAX_TOKENS}
+        return {"state": "ok", "model": None, "max_tokens": None}
+
+    def summary(self, day=None):
+        """
+        Persisted totals for a day with estimated cost, after flushing
+
+        Returns:
+            list: One dict per (stage, model, specialty, language)
+        """
+        self.flush()
+        with self._flush_lock:
+            rows = self._conn.execute(
+                "SELECT * FROM usage WHERE day = ? ORDER BY specialty, stage, model, language",
+                (day or _today(),)
+            ).fetchall()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["cost_usd"] = estimate_cost(
+                item["model"], item["prompt_tokens"], item["completion_tokens"], item["audio_seconds"]
+            )
+            items.append(item)
+        return items
+
+    def flush(self):
+        """Write accumulated usage to the database now"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+            if pending:
+                rows = [key + tuple(totals[c] for c in COUNTERS) for key, totals in pending.items()]
+                try:
+                    with self._conn:
+                        self._conn.executemany(UPSERT, rows)
+                except Exception as e:
+                    logging.error(f"Usage flush failed, keeping {len(rows)} rows for retry: {str(e)}")
+                    self._merge_back(pending)
+                    return
+            self._refresh_persisted()
+
+    def close(self):
+        """Flush and stop the background thread"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._flusher.join()
+        self.flush()
+        self._conn.close()
+
+    def _merge_back(self, pending):
+        with self._lock:
+            self._flushing = {}
+            for key, totals in pending.items():
+                current = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                for counter in COUNTERS:
+                    current[counter] += totals[counter]
+
+    def _refresh_persisted(self):
+        day = _today()
+        rows = self._conn.execute(
+            "SELECT specialty, SUM(prompt_tokens + completion_tokens) FROM usage WHERE day = ? GROUP BY specialty",
+            (day,)
+        ).fetchall()
+        with self._lock:
+            self._persisted = {specialty: tokens for specialty, tokens in rows}
+            self._flushing = {}
+            self._persisted_day = day
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Usage flusher error: {str(e)}")
+
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+_meter = None
+_meter_lock = threading.Lock()
+
+
+def _apply_budgets(new, old=None):
+    # Budgets and the soft limit take effect on hot reload; the rest needs a restart
+    with _meter_lock:
+        if _meter is not None:
+            _meter.budgets = dict(new.usage.budgets)
+            _meter.default_budget = new.usage.daily_token_budget
+            _meter.soft_limit = new.usage.soft_limit
+
+
+def get_usage_meter():
+    """The process-wide meter, configured from the usage config section on first use"""
+    global _meter
+    with _meter_lock:
+        if _meter is None:
+            config = get_config()
+            _meter = UsageMeter(
+                db_path=config.paths.usage_db,
+                budgets=dict(config.usage.budgets),
+                default_budget=config.usage.daily_token_budget,
+                soft_limit=config.usage.soft_limit,
+                flush_interval=config.usage.flush_interval
+            )
+            atexit.register(_meter.close)
+            on_reload(_apply_budgets)
+        return _meter
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show token/audio usage and estimated cost for a day")
+    parser.add_argument("--day", help="YYYY-MM-DD (default: today)")
+    args = parser.parse_args()
+
+    meter = get_usage_meter()
+    total = 0.0
+    for item in meter.summary(args.day):
+        total += item["cost_usd"]
+        print(
+            f"{item['specialty']:<11} {item['language']:<8} {item['stage']:<4} {item['model']:<45} "
+            f"req={item['requests']:<5} in={item['prompt_tokens']:<8} out={item['completion_tokens']:<7} "
+            f"img={item['images']:<4} audio={item['audio_seconds']:.0f}s ${item['cost_usd']:.4f}"
+        )
+    print(f"Total estimated cost: ${total:.4f}")
@@ -1,43 +1,372 @@
 import os
+import io
+import time
+import shutil
+import asyncio
+import logging
+import subprocess
 from gtts import gTTS
-from dotenv import load_dotenv
 
-load_dotenv()
+from async_runtime import run_sync
+from config import get_config, on_reload
+from latency_scorer import LatencyScorer
+from pipeline import StageResult
+from single_flight import SingleFlight, make_key
+from text_normalization import clean_text, split_sentences, chunk_text
+
+# Identical concurrent syntheses share one backend call; each caller writes its own file
+tts_flight = SingleFlight(timeout=get_config().concurrency.single_flight_timeout)
+
+# Backend preference per language, local engines first (override with tts.preference)
+DEFAULT_PREFERENCE = ["piper", "espeak", "gtts"]
+
+# Compact speech encodings (ffmpeg output options, file extension); used when ffmpeg is installed
+FFMPEG = shutil.which("ffmpeg")
+AUDIO_CODECS = {
+    "opus": (["-c:a", "libopus", "-application", "voip", "-f", "ogg"], "ogg"),
+    "mp3": (["-c:a", "libmp3lame", "-f", "mp3"], "mp3"),
+}
+AUDIO_MIME_TYPES = {"mp3": "audio/mpeg", "ogg": "audio/ogg", "wav": "audio/wav"}
+
+
+class TTSBackend:
+    """
+    A speech synthesizer
+
+    Subclasses set name, audio_format (file extension, e.g. "mp3") and
+    implement available() and synthesize(). synthesize_async() runs
+    synthesize() in a worker thread unless a backend has a native version.
+    """
+
+    name = None
+    audio_format = None
+    languages = ()
+
+    def available(self):
+        """Whether the backend can run in this environment"""
+        return True
+
+    def supports(self, language):
+        return language in self.languages
+
+    def synthesize(self, input_text, language):
+        """
+        Args:
+            input_text: Text to speak
+            language: Language code ("en", "hi", ...)
+
+        Returns:
+            bytes: Encoded audio in audio_format
+        """
+        raise NotImplementedError
+
+    async def synthesize_async(self, input_text, language):
+        """Async version of synthesize()"""
+        return await asyncio.to_thread(self.synthesize, input_text, language)
+
+
+async def _run_process(args, input_bytes, timeout=60):
+    """Run a command without blocking the event loop; returns its stdout like subprocess.run(check=True)"""
+    process = await asyncio.create_subprocess_exec(
+        *args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(input_bytes), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(args, timeout)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return stdout
+
+
+class GTTSBackend(TTSBackend):
+    """Google Text-to-Speech (network call per request)"""
+
+    name = "gtts"
+    audio_format = "mp3"
+    languages = ("en", "hi", "ta", "te", "mr", "bn")
+
+    def synthesize(self, input_text, language):
+        buffer = io.BytesIO()
+        # Chunk at sentence boundaries (including the danda) rather than gTTS's Latin-only punctuation;
+        # gTTS sends one request per chunk
+        max_chars = get_config().tts.gtts_max_chars
+        gTTS(
+            text=input_text, lang=language, slow=False,
+            tokenizer_func=lambda text: chunk_text(text, max_chars)
+        ).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class EspeakBackend(TTSBackend):
+    """eSpeak NG, a small formant synthesizer that runs locally on the CPU"""
+
+    name = "espeak"
+    audio_format = "wav"
+    languages = ("en", "hi", "ta", "te", "mr", "bn")
+
+    def __init__(self):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self):
+        return self.binary is not None
+
+    def synthesize(self, input_text, language):
+        result = subprocess.run(
+            [self.binary, "-v", language, "--stdout"],
+            input=input_text.encode("utf-8"),
+            capture_output=True,
+            check=True,
+            timeout=60
+        )
+        return result.stdout
+
+    async def synthesize_async(self, input_text, language):
+        return await _run_process([self.binary, "-v", language, "--stdout"], input_text.encode("utf-8"))
+
+
+class PiperBackend(TTSBackend):
+    """
+    Piper neural TTS running locally on the CPU
+
+    Needs the piper binary and one voice model per language, configured in
+    tts.piper_voices (paths to .onnx voice files, e.g. PIPER_VOICE_EN).
+    """
+
+    name = "piper"
+    audio_format = "wav"
+
+    def __init__(self):
+        self.binary = shutil.which("piper")
+        self.voices = {}
+        for language, voice in get_config().tts.piper_voices.items():
+            if voice and os.path.exists(voice):
+                self.voices[language] = voice
+        self.languages = tuple(self.voices)
+
+    def available(self):
+        return self.binary is not None and bool(self.voices)
+
+    def synthesize(self, input_text, language):
+        # One sentence per line: Piper synthesizes line by line, with a pause between
+        result = subprocess.run(
+            [self.binary, "--model", self.voices[language], "--output_file", "-"],
+            input="\n".join(split_sentences(input_text)).encode("utf-8"),
+            capture_output=True,
+            check=True,
+            timeout=60
+        )
+        return result.stdout
+
+    async def synthesize_async(self, input_text, language):
+        return await _run_process(
+            [self.binary, "--model", self.voices[language], "--output_file", "-"],
+            "\n".join(split_sentences(input_text)).encode("utf-8")
+        )
+
+
+class TTSRouter:
+    """
+    Picks a TTS backend per request from measured latency and language preference
+
+    Candidates are the available backends supporting the language, in
+    preference order, ranked by the same scorer as the chat models (see
+    latency_scorer.LatencyScorer) per (backend, language): ones not yet
+    measured are tried first (in that order), otherwise the fastest wins,
+    with later preferences slightly penalised. A failing backend raises its
+    error rate and the next one is tried.
+    """
+
+    def __init__(self, backends, preferences=None):
+        self.backends = {b.name: b for b in backends if b.available()}
+        self.preferences = preferences or {}
+        self.scorer = LatencyScorer(explore_unmeasured=True)
+
+    def candidates(self, language):
+        order = self.preferences.get(language, DEFAULT_PREFERENCE)
+        names = [n for n in order if n in self.backends] + [
+            n for n in self.backends if n not in order
+        ]
+        available = [self.backends[n] for n in names if self.backends[n].supports(language)]
+        return self.scorer.rank(available, key=lambda backend: (backend.name, language))
+
+    def synthesize(self, input_text, language):
+        """
+        Returns:
+            tuple: (audio bytes, audio format) from the first backend that succeeds
+
+        Raises:
+            RuntimeError: No backend supports the language or all of them failed
+        """
+        return run_sync(self.synthesize_async(input_text, language))
+
+    async def synthesize_async(self, input_text, language):
+        """Async version of synthesize()"""
+        errors = []
+        for backend in self.candidates(language):
+            start = time.perf_counter()
+            try:
+                audio = await tts_flight.do_async(
+                    make_key("tts", backend.name, language, input_text),
+                    lambda: backend.synthesize_async(input_text, language)
+                )
+            except Exception as e:
+                self.scorer.observe((backend.name, language), time.perf_counter() - start, ok=False)
+                logging.warning(f"TTS backend {backend.name} failed for {language}: {str(e)}")
+                errors.append(f"{backend.name}: {str(e)}")
+                continue
+            self.scorer.observe((backend.name, language), time.perf_counter() - start)
+            return audio, backend.audio_format
+        raise RuntimeError(f"No TTS backend could synthesize '{language}': {'; '.join(errors) or 'none available'}")
+
+    def latency_stats(self):
+        """Current latency EWMA per (backend, language)"""
+        return {f"{name}:{language}": stats["latency"] for (name, language), stats in self.scorer.stats().items()}
+
+
+tts_router = TTSRouter([PiperBackend(), EspeakBackend(), GTTSBackend()], get_config().tts.preference)
+on_reload(lambda new, old: setattr(tts_router, "preferences", new.tts.preference))
+
+
+def negotiate_codec(user_agent=None, preference=None):
+    """
+    The codec to deliver speech in to a browser
+
+    "auto" (the tts.audio_codec default) picks Opus, which is about half the
+    size of MP3 at the same quality for speech, except for Safari, whose
+    support for Opus in Ogg is unreliable.
+
+    Args:
+        user_agent: The browser's User-Agent header
+        preference: "auto", "opus", "mp3" or "wav" (default tts.audio_codec)
+
+    Returns:
+        str: A key of AUDIO_CODECS, or "wav" to keep the backend's output
+    """
+    preference = preference or get_config().tts.audio_codec
+    if preference != "auto":
+        return preference
+    user_agent = user_agent or ""
+    if "Safari" in user_agent and not any(name in user_agent for name in ("Chrome", "Chromium", "Edg", "Firefox")):
+        return "mp3"
+    return "opus"
+
+
+async def encode_async(audio, audio_format, codec, bitrate_kbps=None):
+    """
+    Re-encode uncompressed speech (WAV from Piper / eSpeak) as mono Opus or MP3
+
+    Audio that is already compressed (gTTS's MP3), an unknown codec or a
+    missing ffmpeg binary leave the audio as it is.
+
+    Returns:
+        tuple: (audio bytes, audio format)
+    """
+    if codec not in AUDIO_CODECS or audio_format != "wav" or FFMPEG is None:
+        return audio, audio_format
+    options, extension = AUDIO_CODECS[codec]
+    bitrate = bitrate_kbps or get_config().tts.audio_bitrate_kbps
+    encoded = await _run_process(
+        [FFMPEG, "-loglevel", "error", "-i", "pipe:0", "-ac", "1", "-b:a", f"{bitrate}k", *options, "pipe:1"], audio
+    )
+    return encoded, extension
+
+
+async def synthesize_result_async(input_text, output_filepath, language="en", codec=None):
+    """
+    Convert text to speech with the best available backend, without blocking the event loop
+
+    Args:
+        input_text: Text to convert to speech
+        output_filepath: Path to save the audio file; its extension is
+            replaced to match the audio format (mp3, ogg or wav)
+        language: Language code ("en" for English, "hi" for Hindi)
+        codec: Compact codec for uncompressed output (see negotiate_codec)
+
+    Returns:
+        StageResult: Path to the saved audio file, or the failure
+    """
+    try:
+        audio, audio_format = await tts_router.synthesize_async(clean_text(input_text), language)
+        if codec:
+            try:
+                audio, audio_format = await encode_async(audio, audio_format, codec)
+            except Exception as e:
+                logging.warning(f"Could not encode speech as {codec}, keeping {audio_format}: {str(e)}")
+        output_filepath = f"{os.path.splitext(output_filepath)[0]}.{audio_format}"
+        await asyncio.to_thread(_write_audio, audio, output_filepath)
+    except Exception as e:
+        logging.error(f"Error generating speech: {str(e)}")
+        return StageResult.failure("tts", f"Error generating speech: {str(e)}")
+    return StageResult.success("tts", output_filepath)
+
+
+async def synthesize_async(input_text, output_filepath, language="en", codec=None):
+    """
+    synthesize_result_async() as a plain path
+
+    Returns:
+        str: Path to the saved audio file or None on error
+    """
+    return (await synthesize_result_async(input_text, output_filepath, language, codec)).value
+
+
+def text_to_speech_result(input_text, output_filepath, language="en", codec=None):
+    """Blocking wrapper around synthesize_result_async()"""
+    return run_sync(synthesize_result_async(input_text, output_filepath, language, codec))
+
+
+def text_to_speech(input_text, output_filepath, language="en", codec=None):
+    """
+    Convert text to speech with the best available backend
+
+    Blocking wrapper around synthesize_async().
+
+    Args:
+        input_text: Text to convert to speech
+        output_filepath: Path to save the audio file; its extension is
+            replaced to match the audio format (mp3, ogg or wav)
+        language: Language code ("en" for English, "hi" for Hindi)
+        codec: Compact codec for uncompressed output (see negotiate_codec)
+
+    Returns:
+        str: Path to the saved audio file or None on error
+    """
+    return run_sync(synthesize_async(input_text, output_filepath, language, codec))
+
+def _synthesize(input_text, language):
+    return tts_flight.do(
+        make_key("tts", "gtts", language, input_text),
+        lambda: GTTSBackend().synthesize(input_text, language)
+    )
+
+def _write_audio(audio_bytes, output_filepath):
+    with open(output_filepath, "wb") as f:
+        f.write(audio_bytes)
 
 def text_to_speech_with_gtts(input_text, output_filepath, language="en"):
     """
     Convert text to speech using Google Text-to-Speech
-    
+
+    A language gTTS can't speak is a failure, not English speech, so the
+    caller (or the TTS router) can try another engine.
+
     Args:
         input_text: Text to convert to speech
         output_filepath: Path to save the audio file
-        language: Language code ("en" for English, "hi" for Hindi)
-    
+        language: Language code ("en", "hi", "ta", "te", "mr", "bn")
+
     Returns:
         str: Path to the saved audio file or None on error
     """
+    if language not in GTTSBackend.languages:
+        logging.warning(f"gTTS does not support language '{language}'")
+        return None
     try:
-        # gTTS supports many languages including:
-        # 'en' - English
-        # 'hi' - Hindi
-        # 'ta' - Tamil
-        # 'te' - Telugu
-        # 'mr' - Marathi
-        # 'bn' - Bengali
-        # etc.
-        
-        tts = gTTS(text=input_text, lang=language, slow=False)
-        tts.save(output_filepath)
-        
+        _write_audio(_synthesize(input_text, language), output_filepath)
         return output_filepath
     except Exception as e:
-        print(f"Error generating speech: {str(e)}")
-        # Fallback to English if Hindi fails
-        if language != "en":
-            try:
-                tts = gTTS(text=input_text, lang="en", slow=False)
-                tts.save(output_filepath)
-                return output_filepath
-            except Exception as e2:
-                print(f"Fallback to English also failed: {str(e2)}")
+        logging.warning(f"gTTS failed for {language}: {str(e)}")
         return None
\ No newline at end of file
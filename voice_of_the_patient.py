@@ -1,37 +1,95 @@
 import os
+import asyncio
 import logging
-from groq import Groq
-from dotenv import load_dotenv
 
-load_dotenv()
+from async_runtime import get_async_client, run_sync
+from config import get_config
+from pipeline import StageResult
+from single_flight import SingleFlight, make_key
+from usage_accounting import get_usage_meter, wav_duration
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_API_KEY = get_config().groq.api_key
+
+# Identical concurrent transcriptions share one upstream call
+stt_flight = SingleFlight(timeout=get_config().concurrency.single_flight_timeout)
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
 
-def transcribe_with_groq(GROQ_API_KEY, audio_filepath, stt_model, language="en"):
+
+async def transcribe_result_async(GROQ_API_KEY, audio_filepath, stt_model, language="en", usage=None):
     """
-    Transcribe audio file to text using Groq Whisper API
-    
+    Transcribe audio file to text using the Groq Whisper API, without blocking the event loop
+
     Args:
         GROQ_API_KEY: Groq API key
         audio_filepath: Path to the audio file
         stt_model: Speech-to-text model name (e.g., "whisper-large-v3")
         language: Language code for transcription ("en" for English, "hi" for Hindi)
-    
+        usage: Tags (specialty, language) to account the audio duration under
+
     Returns:
-        str: Transcribed text
+        StageResult: The transcribed text, or the failure
     """
-    client = Groq(api_key=GROQ_API_KEY)
-    
     try:
-        audio_file = open(audio_filepath, "rb")
-        transcription = client.audio.transcriptions.create(
-            model=stt_model,
-            file=audio_file,
-            language=language  # Supports "en", "hi", and many other languages
-        )
-        audio_file.close()
-        return transcription.text
+        client = get_async_client(GROQ_API_KEY)
+        audio_bytes = await asyncio.to_thread(_read_bytes, audio_filepath)
+
+        async def call():
+            transcription = await client.audio.transcriptions.create(
+                model=stt_model,
+                file=(os.path.basename(audio_filepath), audio_bytes),
+                language=language  # Supports "en", "hi", and many other languages
+            )
+            try:
+                get_usage_meter().record(
+                    "stt", stt_model, audio_seconds=wav_duration(audio_bytes) or 0.0, **(usage or {})
+                )
+            except Exception as e:
+                logging.warning(f"Could not record usage: {str(e)}")
+            return transcription.text
+
+        text = await stt_flight.do_async(make_key("stt", stt_model, language, audio_bytes), call)
     except Exception as e:
         logging.error(f"Transcription error: {str(e)}")
-        return f"Error transcribing audio: {str(e)}"
\ No newline at end of file
+        return StageResult.failure("stt", f"Error transcribing audio: {str(e)}")
+    return StageResult.success("stt", text)
+
+
+async def transcribe_async(GROQ_API_KEY, audio_filepath, stt_model, language="en", usage=None):
+    """
+    transcribe_result_async() as plain text
+
+    Returns:
+        str: Transcribed text, or an "Error ..." message
+    """
+    result = await transcribe_result_async(GROQ_API_KEY, audio_filepath, stt_model, language, usage)
+    return result.value if result.ok else result.error
+
+
+def transcribe_result(GROQ_API_KEY, audio_filepath, stt_model, language="en", usage=None):
+    """Blocking wrapper around transcribe_result_async()"""
+    return run_sync(transcribe_result_async(GROQ_API_KEY, audio_filepath, stt_model, language, usage))
+
+
+def transcribe_with_groq(GROQ_API_KEY, audio_filepath, stt_model, language="en", usage=None):
+    """
+    Transcribe audio file to text using Groq Whisper API
+
+    Blocking wrapper around transcribe_async().
+
+    Args:
+        GROQ_API_KEY: Groq API key
+        audio_filepath: Path to the audio file
+        stt_model: Speech-to-text model name (e.g., "whisper-large-v3")
+        language: Language code for transcription ("en" for English, "hi" for Hindi)
+        usage: Tags (specialty, language) to account the audio duration under
+
+    Returns:
+        str: Transcribed text, or an "Error ..." message
+    """
+    return run_sync(transcribe_async(GROQ_API_KEY, audio_filepath, stt_model, language, usage))